@@ -0,0 +1,128 @@
+import collections
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from PIL import Image
+
+# process_image reads the image at scales 1.0, 0.5 and 2.0 on top of the
+# original, and the traditional pipeline and comparison read it ~3 more times
+PIPELINE_PIXEL_FACTOR = 1 + 1 + 0.25 + 4 + 3
+# Fixed per-request cost of the quantum simulation, in megapixel equivalents
+SIMULATION_COST = 1.0
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted; carries the HTTP status and Retry-After"""
+    def __init__(self, message, status_code, retry_after):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def image_dimensions(image_path):
+    """Read (width, height) from the image header without decoding the pixels"""
+    with Image.open(image_path) as image:
+        return image.size
+
+
+def estimate_cost(width, height):
+    """Estimated work for one upload in megapixel equivalents"""
+    return PIPELINE_PIXEL_FACTOR * width * height / 1e6 + SIMULATION_COST
+
+
+class AdmissionController:
+    """Concurrency limiter with a bounded FIFO wait queue and a cost budget
+
+    At most max_concurrent requests run at once and the summed cost of running
+    requests stays within max_cost (a single request larger than max_cost may
+    still run on its own). Up to max_queue requests wait for at most max_wait
+    seconds; beyond that requests are rejected immediately.
+    """
+    def __init__(self, max_concurrent=2, max_cost=400.0, max_queue=8, max_wait=30.0):
+        self.max_concurrent = max_concurrent
+        self.max_cost = max_cost
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+
+        self._condition = threading.Condition()
+        self._queue = collections.deque()
+        self._running = 0
+        self._running_cost = 0.0
+        self._average_duration = 5.0  # Seconds, refined as requests complete
+        self._rejected = 0
+
+    def _fits(self, cost):
+        if self._running >= self.max_concurrent:
+            return False
+        return self._running == 0 or self._running_cost + cost <= self.max_cost
+
+    def _retry_after(self):
+        """Rough seconds until a queued request could start"""
+        waves = (len(self._queue) + 1) / max(1, self.max_concurrent)
+        return max(1, int(math.ceil(waves * self._average_duration)))
+
+    def _acquire(self, cost):
+        cost = min(cost, self.max_cost)
+        with self._condition:
+            if not self._queue and self._fits(cost):
+                self._running += 1
+                self._running_cost += cost
+                return cost
+
+            if len(self._queue) >= self.max_queue:
+                self._rejected += 1
+                raise AdmissionRejected('Server is busy, too many requests are queued',
+                                        429, self._retry_after())
+
+            ticket = object()
+            self._queue.append(ticket)
+            wait_deadline = time.monotonic() + self.max_wait
+            try:
+                # FIFO: only the head of the queue may start, so large scans are not starved
+                while not (self._queue[0] is ticket and self._fits(cost)):
+                    remaining = wait_deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._rejected += 1
+                        raise AdmissionRejected('Server is busy, timed out waiting for a processing slot',
+                                                503, self._retry_after())
+                    self._condition.wait(remaining)
+            finally:
+                self._queue.remove(ticket)
+                self._condition.notify_all()
+
+            self._running += 1
+            self._running_cost += cost
+            return cost
+
+    def _release(self, cost, duration):
+        with self._condition:
+            self._running -= 1
+            self._running_cost -= cost
+            self._average_duration = 0.8 * self._average_duration + 0.2 * duration
+            self._condition.notify_all()
+
+    @contextmanager
+    def admit(self, cost):
+        """Hold a processing slot for the duration of the block, or raise AdmissionRejected"""
+        cost = self._acquire(cost)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(cost, time.monotonic() - start)
+
+    def stats(self):
+        with self._condition:
+            return {
+                'running': self._running,
+                'running_cost': self._running_cost,
+                'queued': len(self._queue),
+                'rejected': self._rejected,
+                'average_duration': self._average_duration
+            }
+
+
+# Make functions available for import
+__all__ = ['AdmissionController', 'AdmissionRejected', 'estimate_cost', 'image_dimensions']
@@ -1,13 +1,78 @@
 import flask
 from flask import render_template, request, jsonify, send_file
 import os
+import sys
+import threading
+import time
 from datetime import datetime
 import json
-from quantum_processing import process_image
-from compare_approaches import compare_quantum_traditional
+from compare_approaches import compare_quantum_traditional, process_both
+from similarity_search import add_features, find_similar, normalize_comparison_id, remove_features
+from admission import AdmissionController, AdmissionRejected, estimate_cost, image_dimensions
+from retention import RetentionManager, policies_from_env
+from batch_upload import BatchError, is_archive, save_batch, stream_batch, STREAM_FORMATS, STREAM_MIMETYPES
+from volume_processing import process_volume, save_series, volume_shape, TIFF_SUFFIXES, DICOM_SUFFIXES
+from metrics import Gauge, render_metrics, REQUEST_SECONDS, REQUESTS_IN_FLIGHT, PEAK_TRACED_BYTES
+from memory_usage import track_peak_memory
 
 app = flask.Flask(__name__)
 
+# Admission control for the processing endpoints (limits apply per worker process)
+app.config['MAX_CONCURRENT_JOBS'] = int(os.environ.get('QMI_MAX_CONCURRENT_JOBS', 2))
+app.config['MAX_INFLIGHT_COST'] = float(os.environ.get('QMI_MAX_INFLIGHT_COST', 400))
+app.config['MAX_QUEUED_JOBS'] = int(os.environ.get('QMI_MAX_QUEUED_JOBS', 8))
+app.config['MAX_QUEUE_WAIT'] = float(os.environ.get('QMI_MAX_QUEUE_WAIT', 30))
+app.config['REQUEST_DEADLINE'] = float(os.environ.get('QMI_REQUEST_DEADLINE', 120))
+
+# Run the quantum, classical-scale and traditional stages of an upload concurrently
+# on a per-process thread pool (sized by QMI_STAGE_WORKERS)
+app.config['PARALLEL_STAGES'] = os.environ.get('QMI_PARALLEL_STAGES', '0').lower() in ('1', 'true', 'yes')
+
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff'}
+
+# Memory: lean processing (uint8/float32, reused buffers) and per-upload peak memory reports
+app.config['LEAN_MEMORY'] = os.environ.get('QMI_LEAN_MEMORY', '0').lower() in ('1', 'true', 'yes')
+app.config['TRACE_MEMORY'] = os.environ.get('QMI_TRACE_MEMORY', '0').lower() in ('1', 'true', 'yes')
+
+# Run process_image in this many worker processes, handing images over in
+# shared memory (0: on the request thread)
+app.config['PROCESS_WORKERS'] = int(os.environ.get('QMI_PROCESS_WORKERS', 0))
+
+# Batch uploads: images per request, and how many of them one worker processes at once
+app.config['MAX_BATCH_FILES'] = int(os.environ.get('QMI_MAX_BATCH_FILES', 200))
+app.config['BATCH_WORKERS'] = int(os.environ.get('QMI_BATCH_WORKERS', app.config['MAX_CONCURRENT_JOBS']))
+
+# Processing deadline in seconds for a whole volume uploaded to /upload-volume
+app.config['VOLUME_DEADLINE'] = float(os.environ.get('QMI_VOLUME_DEADLINE', 600))
+
+# Default latency budget in seconds for process_image (unset: fixed circuit settings)
+app.config['LATENCY_BUDGET'] = float(os.environ['QMI_LATENCY_BUDGET']) if os.environ.get('QMI_LATENCY_BUDGET') else None
+
+admission = AdmissionController(
+    max_concurrent=app.config['MAX_CONCURRENT_JOBS'],
+    max_cost=app.config['MAX_INFLIGHT_COST'],
+    max_queue=app.config['MAX_QUEUED_JOBS'],
+    max_wait=app.config['MAX_QUEUE_WAIT']
+)
+
+def prune_evicted_features(tombstones):
+    """Drop the stored features of evicted comparisons so /similar never returns them"""
+    remove_features([tombstone['filename'] for tombstone in tombstones
+                     if os.path.normpath(tombstone['directory']) == 'comparison_results'
+                     and tombstone['filename'].startswith('comparison_')])
+
+# Size and age caps for the artifact directories; the sweeper thread is
+# started by the serving process (see __main__ and serve.py)
+retention = RetentionManager(policies_from_env(),
+                             interval=float(os.environ.get('QMI_RETENTION_INTERVAL', 300)),
+                             on_evict=prune_evicted_features)
+
+# Admission state is read when /metrics is scraped
+Gauge('admission_running_jobs', 'Uploads currently being processed',
+      callback=lambda: admission.stats()['running'])
+Gauge('admission_queued_jobs', 'Uploads waiting for a processing slot',
+      callback=lambda: admission.stats()['queued'])
+
 # Create necessary directories
 os.makedirs('uploads', exist_ok=True)
 os.makedirs('results', exist_ok=True)
@@ -15,10 +80,169 @@ os.makedirs('comparison_results', exist_ok=True)
 os.makedirs('processed_images', exist_ok=True)
 os.makedirs('traditional_results', exist_ok=True)
 
+@app.before_request
+def start_request_timer():
+    flask.g.request_start = time.perf_counter()
+    REQUESTS_IN_FLIGHT.inc()
+
+@app.after_request
+def record_request_latency(response):
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    start, method, status = flask.g.request_start, request.method, response.status_code
+    
+    def finish():
+        REQUEST_SECONDS.observe(time.perf_counter() - start, route=route, method=method, status=status)
+        REQUESTS_IN_FLIGHT.dec()
+    
+    # A streamed body (/upload-batch) is produced after teardown, so it is only
+    # done once the server closes the response
+    if response.is_streamed:
+        response.call_on_close(finish)
+    else:
+        finish()
+    flask.g.request_recorded = True
+    return response
+
+@app.teardown_request
+def finish_request(exception=None):
+    # Requests that never produced a response are still no longer in flight
+    if not flask.g.get('request_recorded'):
+        REQUESTS_IN_FLIGHT.dec()
+
+@app.route('/metrics')
+def metrics():
+    return flask.Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
+# Worker processes for process_image, started on first use (see PROCESS_WORKERS)
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+def get_process_pool():
+    """The shared-memory process pool, or None when processing stays in this process"""
+    global _process_pool
+    if app.config['PROCESS_WORKERS'] <= 0:
+        return None
+    with _process_pool_lock:
+        if _process_pool is None:
+            from shm_transport import SharedMemoryProcessPool
+            _process_pool = SharedMemoryProcessPool(max_workers=app.config['PROCESS_WORKERS'])
+    return _process_pool
+
+def deadline_exceeded_result(message):
+    return {'success': False, 'error': message, 'deadline_exceeded': True}, 504
+
+def process_upload(filepath, original_filename, timestamp, deadline=None, latency_budget=None):
+    """Run the quantum and comparison pipelines on a saved upload and store the results
+
+    Returns (payload, status_code) so /upload and /upload-batch can report it
+    as a JSON response or as one line of a stream. With TRACE_MEMORY the
+    payload also reports the peak traced memory under 'memory'.
+    """
+    if not app.config['TRACE_MEMORY']:
+        return run_pipelines(filepath, original_filename, timestamp, deadline, latency_budget)
+    
+    with track_peak_memory() as memory:
+        payload, status_code = run_pipelines(filepath, original_filename, timestamp, deadline, latency_budget)
+    PEAK_TRACED_BYTES.observe(memory['peak_traced_bytes'])
+    payload['memory'] = {'lean': app.config['LEAN_MEMORY'], **memory}
+    return payload, status_code
+
+def run_pipelines(filepath, original_filename, timestamp, deadline=None, latency_budget=None):
+    """The body of process_upload, without memory tracking"""
+    # Process image with the quantum and traditional approaches
+    pool = get_process_pool()
+    quantum_result, traditional_result = process_both(filepath, deadline=deadline,
+                                                      parallel=app.config['PARALLEL_STAGES'],
+                                                      quantum_runner=pool.process_image if pool else None,
+                                                      return_features=True, latency_budget=latency_budget,
+                                                      lean=app.config['LEAN_MEMORY'])
+    if quantum_result.get('deadline_exceeded'):
+        return deadline_exceeded_result(quantum_result['error'])
+    if not quantum_result.get('success', False):
+        return {
+            'success': False, 
+            'error': quantum_result.get('error', 'Failed to process image')
+        }, 200
+    feature_vector = quantum_result.pop('feature_vector')
+    
+    # Compare with traditional approach
+    comparison_result = compare_quantum_traditional(filepath, deadline=deadline, quantum_result=quantum_result,
+                                                    traditional_result=traditional_result)
+    if comparison_result is None and deadline is not None and time.monotonic() > deadline:
+        return deadline_exceeded_result('Processing deadline exceeded while comparing approaches')
+    if comparison_result is None:
+        return {'success': False, 'error': 'Failed to compare approaches'}, 200
+    
+    # Save comparison results with proper extension and consistent timestamp
+    comparison_filename = f"comparison_{timestamp}.json"
+    comparison_filepath = os.path.join('comparison_results', comparison_filename)
+    
+    # Ensure the comparison results directory exists
+    os.makedirs('comparison_results', exist_ok=True)
+    
+    # Save the comparison results
+    with open(comparison_filepath, 'w') as f:
+        json.dump({
+            'quantum_result': quantum_result,
+            'comparison_result': comparison_result,
+            'timestamp': timestamp,
+            'original_filename': original_filename
+        }, f, indent=4)
+    
+    # Verify comparison results were saved
+    if not os.path.exists(comparison_filepath):
+        return {'success': False, 'error': 'Failed to save comparison results'}, 200
+    
+    # Retain the quantum features for "similar previous scans" lookups
+    try:
+        add_features(comparison_filename, feature_vector)
+    except Exception as e:
+        print(f"Error storing quantum features for {comparison_filename}: {str(e)}")
+    
+    return {
+        'success': True,
+        'quantum_result': quantum_result,
+        'comparison_result': comparison_result,
+        'comparison_file': comparison_filename,
+        'timestamp': timestamp,
+        'message': f'Successfully processed image and saved comparison results as {comparison_filename}'
+    }, 200
+
+def admit_and_process(filepath, original_filename, timestamp, latency_budget=None):
+    """Wait for a processing slot for a saved upload, then process it
+
+    Returns (payload, status_code). The upload is removed if it cannot be
+    read or admitted; rejections carry 'retry_after' in the payload.
+    """
+    # Estimate the cost from the image header and wait for a processing slot
+    try:
+        width, height = image_dimensions(filepath)
+    except Exception as e:
+        os.remove(filepath)
+        return {'success': False, 'error': f'Failed to read image dimensions: {str(e)}'}, 200
+    
+    try:
+        with admission.admit(estimate_cost(width, height)):
+            deadline = time.monotonic() + app.config['REQUEST_DEADLINE']
+            return process_upload(filepath, original_filename, timestamp, deadline=deadline,
+                                  latency_budget=latency_budget)
+    except AdmissionRejected as e:
+        os.remove(filepath)
+        return {'success': False, 'error': str(e), 'retry_after': e.retry_after}, e.status_code
+
+def request_latency_budget():
+    """Per-request latency budget from the form, falling back to the server default"""
+    latency_budget = request.form.get('latency_budget', type=float)
+    if latency_budget is None:
+        latency_budget = app.config['LATENCY_BUDGET']
+    if latency_budget is not None and latency_budget <= 0:
+        raise ValueError('latency_budget must be a positive number of seconds')
+    return latency_budget
+
 @app.route('/upload', methods=['POST'])
 def upload():
     try:
@@ -30,13 +254,18 @@ def upload():
             return jsonify({'success': False, 'error': 'No file selected'})
             
         # Validate file extension
-        allowed_extensions = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff'}
-        if not '.' in file.filename or file.filename.rsplit('.', 1)[1].lower() not in allowed_extensions:
+        if not '.' in file.filename or file.filename.rsplit('.', 1)[1].lower() not in ALLOWED_EXTENSIONS:
             return jsonify({
                 'success': False, 
-                'error': f'Invalid file type. Allowed types are: {", ".join(allowed_extensions)}'
+                'error': f'Invalid file type. Allowed types are: {", ".join(ALLOWED_EXTENSIONS)}'
             })
         
+        # Per-request latency budget overrides the server default
+        try:
+            latency_budget = request_latency_budget()
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)})
+        
         # Save uploaded file with consistent timestamp format
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f"{timestamp}_{file.filename}"
@@ -47,51 +276,151 @@ def upload():
         if not os.path.exists(filepath):
             return jsonify({'success': False, 'error': 'Failed to save uploaded file'})
             
-        # Process image with quantum approach
-        quantum_result = process_image(filepath)
-        if not quantum_result.get('success', False):
+        payload, status_code = admit_and_process(filepath, file.filename, timestamp, latency_budget=latency_budget)
+        response = jsonify(payload)
+        response.status_code = status_code
+        if 'retry_after' in payload:
+            response.headers['Retry-After'] = str(payload['retry_after'])
+        return response
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Server error: {str(e)}'})
+
+@app.route('/upload-batch', methods=['POST'])
+def upload_batch():
+    """Process many images, or zip/tar archives of images, streaming each result when ready
+
+    Results are sent as NDJSON lines ({"type": "result", ...}) followed by a
+    {"type": "summary", ...} line, or as server-sent events with format=sse.
+    """
+    try:
+        files = [f for f in request.files.getlist('files') + request.files.getlist('file') if f.filename]
+        if not files:
+            return jsonify({'success': False, 'error': 'No files uploaded'})
+        
+        stream_format = request.form.get('format') or request.args.get('format')
+        if stream_format is None:
+            stream_format = 'sse' if 'text/event-stream' in request.headers.get('Accept', '') else 'ndjson'
+        if stream_format not in STREAM_FORMATS:
             return jsonify({
-                'success': False, 
-                'error': quantum_result.get('error', 'Failed to process image')
+                'success': False,
+                'error': f'Invalid format: {stream_format}. Allowed formats are: {", ".join(STREAM_FORMATS)}'
             })
         
-        # Compare with traditional approach
-        comparison_result = compare_quantum_traditional(filepath)
-        if comparison_result is None:
-            return jsonify({'success': False, 'error': 'Failed to compare approaches'})
+        try:
+            latency_budget = request_latency_budget()
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)})
         
-        # Save comparison results with proper extension and consistent timestamp
-        comparison_filename = f"comparison_{timestamp}.json"
-        comparison_filepath = os.path.join('comparison_results', comparison_filename)
+        # Save every image up front; each one gets its own '<timestamp>_<index>_<suffix>' id
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        try:
+            items = save_batch(files, 'uploads', timestamp, ALLOWED_EXTENSIONS, app.config['MAX_BATCH_FILES'])
+        except BatchError as e:
+            return jsonify({'success': False, 'error': str(e)})
         
-        # Ensure the comparison results directory exists
-        os.makedirs('comparison_results', exist_ok=True)
+        # Each image still passes admission control, so a batch cannot starve other uploads
+        def process_item(item):
+            return admit_and_process(item['filepath'], item['filename'], item['timestamp'],
+                                     latency_budget=latency_budget)
         
-        # Save the comparison results
-        with open(comparison_filepath, 'w') as f:
-            json.dump({
-                'quantum_result': quantum_result,
-                'comparison_result': comparison_result,
-                'timestamp': timestamp,
-                'original_filename': file.filename
-            }, f, indent=4)
+        response = flask.Response(stream_batch(items, process_item, max_workers=app.config['BATCH_WORKERS'],
+                                               stream_format=stream_format),
+                                  mimetype=STREAM_MIMETYPES[stream_format])
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'  # Let proxies pass each result through immediately
+        return response
         
-        # Verify comparison results were saved
-        if not os.path.exists(comparison_filepath):
-            return jsonify({'success': False, 'error': 'Failed to save comparison results'})
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Server error: {str(e)}'})
+
+@app.route('/upload-volume', methods=['POST'])
+def upload_volume():
+    """Process a multi-page TIFF, a DICOM file or a zip/tar of a DICOM series as one volume
+
+    Slices are processed in order through the warm pipeline, reusing work for
+    near-identical neighbours. The per-slice and whole-volume results are
+    saved as results/volume_<timestamp>.json.
+    """
+    try:
+        if 'file' not in request.files or request.files['file'].filename == '':
+            return jsonify({'success': False, 'error': 'No file uploaded'})
         
-        return jsonify({
-            'success': True,
-            'quantum_result': quantum_result,
-            'comparison_result': comparison_result,
-            'comparison_file': comparison_filename,
-            'timestamp': timestamp,
-            'message': f'Successfully processed image and saved comparison results as {comparison_filename}'
-        })
+        file = request.files['file']
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        name = os.path.basename(file.filename)
+        if is_archive(name):
+            paths = save_series(file.stream, name, 'uploads', timestamp)
+            if not paths:
+                return jsonify({'success': False, 'error': 'No files found in archive'})
+            source = paths
+        elif name.lower().endswith(TIFF_SUFFIXES + DICOM_SUFFIXES):
+            source = os.path.join('uploads', f"{timestamp}_{name}")
+            file.save(source)
+            paths = [source]
+        else:
+            return jsonify({
+                'success': False,
+                'error': 'Invalid file type. Upload a multi-page TIFF, a DICOM file or a zip/tar of a DICOM series'
+            })
+        
+        def remove_uploads():
+            for path in paths:
+                if os.path.exists(path):
+                    os.remove(path)
+        
+        try:
+            n_slices, width, height = volume_shape(source)
+        except Exception as e:
+            remove_uploads()
+            return jsonify({'success': False, 'error': f'Failed to read volume: {str(e)}'})
+        
+        volume_name = f"{timestamp}_{os.path.splitext(name)[0]}"
+        try:
+            with admission.admit(estimate_cost(width, height) * max(1, n_slices)):
+                deadline = time.monotonic() + app.config['VOLUME_DEADLINE']
+                result = process_volume(source, name=volume_name, deadline=deadline,
+                                        parallel=app.config['PARALLEL_STAGES'], lean=app.config['LEAN_MEMORY'])
+        except AdmissionRejected as e:
+            remove_uploads()
+            response = jsonify({'success': False, 'error': str(e), 'retry_after': e.retry_after})
+            response.status_code = e.status_code
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response
+        
+        if result.get('deadline_exceeded'):
+            response = jsonify(result)
+            response.status_code = 504
+            return response
+        
+        # Save the volume results next to the other downloadable results
+        os.makedirs('results', exist_ok=True)
+        result_file = f"volume_{timestamp}.json"
+        with open(os.path.join('results', result_file), 'w') as f:
+            json.dump({**result, 'timestamp': timestamp, 'original_filename': name}, f, indent=4)
+        
+        return jsonify({**result, 'result_file': result_file, 'timestamp': timestamp})
         
     except Exception as e:
         return jsonify({'success': False, 'error': f'Server error: {str(e)}'})
 
+def evicted_response(directory, filename):
+    """410 response for a file removed by the retention policy, or None if it never existed"""
+    record = retention.eviction_record(directory, filename)
+    if record is None:
+        return None
+    response = jsonify({
+        'success': False,
+        'error': f'File {filename} was removed from {directory} by the retention policy',
+        'evicted': True,
+        'evicted_at': datetime.fromtimestamp(record['evicted_at']).strftime('%Y-%m-%d %H:%M:%S'),
+        'reason': record['reason'],
+        'message': 'Please upload the image again to regenerate this file.',
+        'directory': directory
+    })
+    response.status_code = 410
+    return response
+
 @app.route('/download/<filename>')
 def download(filename):
     try:
@@ -101,6 +430,7 @@ def download(filename):
             # For comparison files, read and format as text
             filepath = os.path.join(directory, filename)
             if os.path.exists(filepath):
+                retention.touch(filepath)
                 with open(filepath, 'r') as f:
                     data = json.load(f)
                     # Format the data as readable text
@@ -137,6 +467,11 @@ def download(filename):
                     response.headers['Accept-Ranges'] = 'none'
                     return response
             else:
+                # Report files removed by the retention policy without listing the directory
+                response = evicted_response(directory, filename)
+                if response is not None:
+                    return response
+                
                 # If file doesn't exist, return error with available files
                 available_files = []
                 try:
@@ -167,6 +502,11 @@ def download(filename):
         
         # Check if file exists
         if not os.path.exists(filepath):
+            # Report files removed by the retention policy without listing the directory
+            response = evicted_response(directory, filename)
+            if response is not None:
+                return response
+            
             # Get list of available files in the directory
             available_files = []
             try:
@@ -193,6 +533,9 @@ def download(filename):
                 'directory': directory
             })
         
+        # Record the access for LRU eviction
+        retention.touch(filepath)
+        
         # Get the file extension
         file_ext = os.path.splitext(filename)[1]
         
@@ -262,5 +605,49 @@ def list_comparisons():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/storage-stats')
+def storage_stats():
+    try:
+        return jsonify({'success': True, **retention.stats()})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/similar/<comparison_id>')
+def similar(comparison_id):
+    try:
+        k = request.args.get('k', default=5, type=int)
+        metric = request.args.get('metric', default='cosine')
+        use_index = request.args.get('index', default='false').lower() in ('1', 'true', 'yes')
+        
+        if metric not in ('cosine', 'jensen_shannon'):
+            return jsonify({
+                'success': False,
+                'error': f'Invalid metric: {metric}. Allowed metrics are: cosine, jensen_shannon'
+            })
+        
+        matches = find_similar(comparison_id, k=max(1, k), metric=metric, use_index=use_index)
+        
+        return jsonify({
+            'success': True,
+            'comparison_id': normalize_comparison_id(comparison_id),
+            'metric': metric,
+            'matches': matches
+        })
+        
+    except KeyError as e:
+        return jsonify({'success': False, 'error': str(e).strip("'")})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
 if __name__ == '__main__':
-    app.run(debug=True) 
\ No newline at end of file
+    if '--import-profile' in sys.argv:
+        from lazy_imports import print_import_profile
+        print_import_profile('app')
+    else:
+        # The reloader runs this block in two processes; sweep and calibrate only in the serving one
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            retention.start()
+            # Calibrate the latency cost model before the first budgeted request (and the process pool) needs it
+            from cost_model import get_cost_model
+            get_cost_model()
+        app.run(debug=True) 
\ No newline at end of file
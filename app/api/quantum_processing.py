@@ -1,45 +1,177 @@
 import cv2
 import numpy as np
-import qiskit
-from qiskit import QuantumCircuit, Aer, execute
-from qiskit.visualization import plot_histogram
-import pennylane as qml
 import json
-import matplotlib.pyplot as plt
-import io
 import base64
-from PIL import Image
+import struct
 import sys
 import os
 
+# memory_usage lives in the project root, two levels above this script
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+from memory_usage import track_peak_memory
+
+# Encoder settings per output format: OpenCV flag and default level
+IMAGE_ENCODERS = {
+    'png': (cv2.IMWRITE_PNG_COMPRESSION, 3),
+    'jpg': (cv2.IMWRITE_JPEG_QUALITY, 95),
+    'webp': (cv2.IMWRITE_WEBP_QUALITY, 90)
+}
+
+TRANSPORTS = ('base64', 'file', 'frame')
+
+# Quantum edge detection: data qubits per segment (16 pixels) and the
+# intensity difference, on the [0, 1] scale, above which a pixel counts as edge
+EDGE_SEGMENT_QUBITS = 4
+EDGE_THRESHOLD = 0.1
+
+def segment_rows(rows, length):
+    """Split each row into segments of length pixels that overlap by one pixel
+    
+    Consecutive segments share their boundary pixel, so every pair of
+    neighbouring pixels lies inside one segment. Rows are padded by repeating
+    the last pixel. Returns (segments, segments_per_row).
+    """
+    n_rows, width = rows.shape
+    stride = length - 1
+    n_segments = max(1, int(np.ceil((width - 1) / stride)))
+    padded = np.pad(rows, ((0, 0), (0, n_segments * stride + 1 - width)), mode='edge')
+    index = (np.arange(n_segments) * stride)[:, None] + np.arange(length)
+    return padded[:, index].reshape(-1, length), n_segments
+
+def encode_image(img, image_format='png', compression=None):
+    """Encode an image with a configurable format and compression level (or quality)"""
+    if image_format not in IMAGE_ENCODERS:
+        raise ValueError(f"Unsupported image format: {image_format}. Use one of: {', '.join(IMAGE_ENCODERS)}")
+    flag, default_level = IMAGE_ENCODERS[image_format]
+    level = default_level if compression is None else int(compression)
+    ok, buffer = cv2.imencode(f'.{image_format}', img, [flag, level])
+    if not ok:
+        raise ValueError(f'Failed to encode image as {image_format}')
+    return buffer.tobytes()
+
+def write_frame(stream, metadata, image_bytes=b''):
+    """Write a length-prefixed binary frame: JSON metadata followed by the raw image bytes
+    
+    Layout: 4-byte big-endian JSON length, JSON (UTF-8), 8-byte big-endian
+    image length, image bytes.
+    """
+    header = json.dumps(metadata).encode('utf-8')
+    stream.write(struct.pack('>I', len(header)))
+    stream.write(header)
+    stream.write(struct.pack('>Q', len(image_bytes)))
+    stream.write(image_bytes)
+    stream.flush()
+
+def read_frame(stream):
+    """Read one frame written by write_frame and return (metadata, image_bytes)"""
+    (header_length,) = struct.unpack('>I', stream.read(4))
+    metadata = json.loads(stream.read(header_length).decode('utf-8'))
+    (image_length,) = struct.unpack('>Q', stream.read(8))
+    return metadata, stream.read(image_length)
+
 class QuantumMedicalScanner:
     def __init__(self):
-        # Initialize quantum device
-        self.dev = qml.device("default.qubit", wires=4)
+        # Quantum device and QNode are created on first use so that
+        # importing this module does not pull in PennyLane
+        self._dev = None
+        self._edge_qnode = None
+    
+    @property
+    def dev(self):
+        """PennyLane device (segment data qubits plus one ancilla), created on first access"""
+        if self._dev is None:
+            import pennylane as qml
+            self._dev = qml.device("default.qubit", wires=EDGE_SEGMENT_QUBITS + 1)
+        return self._dev
+        
+    def preprocess_image(self, image_path, lean=False):
+        """Preprocess the medical scan image
         
-    def preprocess_image(self, image_path):
-        """Preprocess the medical scan image"""
+        lean=True returns float32 instead of float64, normalized in place.
+        """
         img = cv2.imread(image_path, 0)  # Read as grayscale
         img = cv2.resize(img, (256, 256))  # Resize to standard size
         
         # Normalize to [0, 1]
-        img = img / 255.0
+        if lean:
+            img = img.astype(np.float32)
+            img *= np.float32(1 / 255.0)
+        else:
+            img = img / 255.0
         
         return img
     
-    @qml.qnode(device="default.qubit", interface="autograd")
-    def quantum_edge_detection(self, image, wires=4):
-        """Quantum circuit for edge detection"""
-        for i in range(wires):
-            qml.RY(np.pi * image[i, 0], wires=i)
+    def edge_circuit(self):
+        """QHED circuit over a batch of amplitude-encoded pixel segments
         
-        for i in range(wires-1):
-            qml.CNOT(wires=[i, i+1])
+        The ancilla is the least significant wire. Hadamard, a cyclic
+        decrement over all wires and a second Hadamard leave amplitude
+        (c_j - c_{j+1}) / 2 on basis state 2j + 1, so the analytic
+        probabilities hold the squared neighbour differences of every segment.
+        """
+        if self._edge_qnode is None:
+            import pennylane as qml
+            
+            data_wires = list(range(EDGE_SEGMENT_QUBITS))
+            ancilla = EDGE_SEGMENT_QUBITS
+            size = 2 ** (EDGE_SEGMENT_QUBITS + 1)
+            decrement = np.roll(np.eye(size), -1, axis=0)  # |k> -> |k - 1 mod size>
             
-        return [qml.expval(qml.PauliZ(i)) for i in range(wires)]
+            @qml.qnode(self.dev)
+            def circuit(segments):
+                qml.AmplitudeEmbedding(segments, wires=data_wires, normalize=True)
+                qml.Hadamard(wires=ancilla)
+                qml.QubitUnitary(decrement, wires=data_wires + [ancilla])
+                qml.Hadamard(wires=ancilla)
+                return qml.probs(wires=data_wires + [ancilla])
+            
+            self._edge_qnode = circuit
+        return self._edge_qnode
+    
+    def quantum_edge_detection(self, image):
+        """Full-resolution edge map from quantum Hadamard edge detection (QHED)
+        
+        Every row and every column is split into 16-pixel segments and all of
+        them are evaluated as one broadcast execution of edge_circuit. The
+        neighbour differences are rescaled by each segment's norm and combined
+        into a gradient magnitude on the intensity scale of image. A float32
+        image (lean mode) is processed and returned in float32; anything else
+        in float64.
+        """
+        image = np.asarray(image)
+        if image.dtype != np.float32:
+            image = image.astype(np.float64, copy=False)
+        length = 2 ** EDGE_SEGMENT_QUBITS
+        height, width = image.shape
+        
+        row_segments, row_count = segment_rows(image, length)
+        column_segments, column_count = segment_rows(image.T, length)
+        segments = np.concatenate([row_segments, column_segments])
+        
+        # Flat segments cannot be normalised; their differences are zero anyway
+        norms = np.linalg.norm(segments, axis=1)
+        segments[norms < 1e-12] = 1.0
+        
+        probabilities = np.asarray(self.edge_circuit()(segments), dtype=image.dtype)
+        # Odd basis states 1, 3, ... hold (c_j - c_{j+1})^2 / 4; the last one wraps around
+        differences = 2 * np.sqrt(probabilities[:, 1:2 * length - 2:2]) * norms[:, None]
+        
+        horizontal = differences[:len(row_segments)].reshape(height, -1)[:, :width - 1]
+        vertical = differences[len(row_segments):].reshape(width, -1)[:, :height - 1].T
+        
+        gradient_x = np.zeros_like(image)
+        gradient_y = np.zeros_like(image)
+        gradient_x[:, :width - 1] = horizontal
+        gradient_y[:height - 1, :] = vertical
+        return np.sqrt(gradient_x ** 2 + gradient_y ** 2)
     
     def apply_quantum_filter(self, img):
         """Apply quantum filter on the image"""
+        from qiskit import QuantumCircuit
+        from qiskit_aer import AerSimulator
+        
         # Simulate a simple quantum filter operation
         # In a real app, this would involve more sophisticated quantum operations
         qc = QuantumCircuit(4, 4)
@@ -57,8 +189,8 @@ class QuantumMedicalScanner:
         qc.measure(range(4), range(4))
         
         # Execute the circuit on a simulator
-        simulator = Aer.get_backend('qasm_simulator')
-        job = execute(qc, simulator, shots=1000)
+        simulator = AerSimulator()
+        job = simulator.run(qc, shots=1000)
         result = job.result()
         
         # Get counts and use them to modify the image
@@ -103,7 +235,7 @@ class QuantumMedicalScanner:
         
         return processed_regions
     
-    def calculate_metrics(self, img, anomalies):
+    def calculate_metrics(self, img, anomalies, edge_map=None):
         """Calculate various medical metrics from the scan"""
         # In a real application, this would include actual medical metrics
         # This is a simplified example
@@ -116,6 +248,10 @@ class QuantumMedicalScanner:
             "contrast_ratio": float(np.max(img) / (np.min(img) + 1e-10)),
         }
         
+        if edge_map is not None:
+            metrics["edge_density"] = float(np.mean(edge_map > EDGE_THRESHOLD))
+            metrics["mean_edge_strength"] = float(np.mean(edge_map))
+        
         if len(anomalies) > 0:
             metrics["largest_anomaly_size"] = max([a["width"] * a["height"] for a in anomalies])
             avg_anomaly_intensity = np.mean([a["avg_intensity"] for a in anomalies])
@@ -123,11 +259,35 @@ class QuantumMedicalScanner:
         
         return metrics
     
-    def process_scan(self, image_path):
-        """Main function to process a medical scan"""
+    def process_scan(self, image_path, transport='base64', image_format='png', compression=None,
+                     edge_detection=False, lean=False, trace_memory=False):
+        """Main function to process a medical scan
+        
+        With edge_detection (off by default) the quantum edge map is computed,
+        edge pixels are drawn in green and 'edge_density' / 'mean_edge_strength'
+        are added to the metrics. lean keeps the scan in float32 throughout, and
+        trace_memory adds the peak traced (Python and NumPy) memory and the
+        process high-water RSS under 'memory' (see track_peak_memory).
+        
+        transport selects how the annotated image is returned:
+        'base64' embeds it in the result,
+        'file' only writes it next to the input and returns 'processed_image_path',
+        'frame' returns the encoded bytes under 'processed_image_bytes' so the
+        caller can send them separately from the JSON metadata (see write_frame).
+        """
+        if trace_memory:
+            with track_peak_memory() as memory:
+                result = self.process_scan(image_path, transport, image_format, compression,
+                                           edge_detection=edge_detection, lean=lean)
+            result["memory"] = {"lean": lean, **memory}
+            return result
+        
         try:
+            if transport not in TRANSPORTS:
+                raise ValueError(f"Unsupported transport: {transport}. Use one of: {', '.join(TRANSPORTS)}")
+            
             # Preprocess image
-            img = self.preprocess_image(image_path)
+            img = self.preprocess_image(image_path, lean=lean)
             
             # Apply quantum filter
             filtered_img = self.apply_quantum_filter(img)
@@ -135,13 +295,17 @@ class QuantumMedicalScanner:
             # Detect anomalies
             anomalies = self.detect_anomalies(filtered_img)
             
+            # Quantum edge detection over the whole scan
+            edge_map = self.quantum_edge_detection(img) if edge_detection else None
+            
             # Calculate metrics
-            metrics = self.calculate_metrics(filtered_img, anomalies)
+            metrics = self.calculate_metrics(filtered_img, anomalies, edge_map)
             
             # Create visual representation
-            visual_img = img.copy() * 255
-            visual_img = visual_img.astype(np.uint8)
+            visual_img = (img * 255).astype(np.uint8)
             visual_img = cv2.cvtColor(visual_img, cv2.COLOR_GRAY2RGB)
+            if edge_map is not None:
+                visual_img[edge_map > EDGE_THRESHOLD] = (0, 255, 0)
             
             # Mark anomalies
             for anomaly in anomalies:
@@ -153,21 +317,35 @@ class QuantumMedicalScanner:
                     2
                 )
             
-            # Save the processed image
-            output_path = image_path.replace('.', '_processed.')
-            cv2.imwrite(output_path, visual_img)
-            
-            # Encode the image as base64 for sending to the frontend
-            _, buffer = cv2.imencode('.png', visual_img)
-            img_base64 = base64.b64encode(buffer).decode('utf-8')
-            
-            return {
+            result = {
                 "success": True,
                 "metrics": metrics,
-                "anomalies": anomalies,
-                "processed_image": img_base64
+                "anomalies": anomalies
             }
             
+            # Encode once; the same buffer is saved, embedded or framed
+            image_bytes = encode_image(visual_img, image_format, compression)
+            
+            if transport == 'frame':
+                result["processed_image_format"] = image_format
+                result["processed_image_bytes"] = image_bytes
+                return result
+            
+            # Save the processed image; the extension follows the encoded format
+            if transport == 'file':
+                root, _ = os.path.splitext(image_path)
+                output_path = f"{root}_processed.{image_format}"
+                with open(output_path, 'wb') as f:
+                    f.write(image_bytes)
+                result["processed_image_path"] = output_path
+                result["processed_image_format"] = image_format
+                result["processed_image_size"] = len(image_bytes)
+                return result
+            
+            # Encode the image as base64 for sending to the frontend
+            result["processed_image"] = base64.b64encode(image_bytes).decode('utf-8')
+            return result
+            
         except Exception as e:
             return {
                 "success": False,
@@ -176,16 +354,40 @@ class QuantumMedicalScanner:
 
 # Execute the script if called directly
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print(json.dumps({"success": False, "error": "No image path provided"}))
+    import argparse
+    parser = argparse.ArgumentParser(description="Process a medical scan")
+    parser.add_argument('image_path', nargs='?')
+    parser.add_argument('--transport', choices=TRANSPORTS, default='base64',
+                        help="base64: image inside the JSON; file: image written to disk; "
+                             "frame: length-prefixed binary frame on stdout")
+    parser.add_argument('--format', dest='image_format', choices=sorted(IMAGE_ENCODERS), default='png')
+    parser.add_argument('--compression', type=int, default=None,
+                        help="PNG compression level (0-9) or JPEG/WebP quality (0-100)")
+    parser.add_argument('--edges', action='store_true', help="Add quantum edge detection to the result")
+    parser.add_argument('--lean', action='store_true', help="Keep the scan in float32")
+    parser.add_argument('--trace-memory', action='store_true', help="Report peak traced memory in the result")
+    args = parser.parse_args()
+    
+    def emit(result):
+        if args.transport == 'frame':
+            image_bytes = result.pop("processed_image_bytes", b'')
+            write_frame(sys.stdout.buffer, result, image_bytes)
+        else:
+            print(json.dumps(result))
+    
+    if not args.image_path:
+        emit({"success": False, "error": "No image path provided"})
         sys.exit(1)
         
-    image_path = sys.argv[1]
+    image_path = args.image_path
     if not os.path.exists(image_path):
-        print(json.dumps({"success": False, "error": f"Image not found at {image_path}"}))
+        emit({"success": False, "error": f"Image not found at {image_path}"})
         sys.exit(1)
         
     scanner = QuantumMedicalScanner()
-    result = scanner.process_scan(image_path)
+    result = scanner.process_scan(image_path, transport=args.transport,
+                                  image_format=args.image_format, compression=args.compression,
+                                  edge_detection=args.edges, lean=args.lean,
+                                  trace_memory=args.trace_memory)
     
-    print(json.dumps(result)) 
\ No newline at end of file
+    emit(result) 
\ No newline at end of file
@@ -0,0 +1,153 @@
+import json
+import os
+import tarfile
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2')
+STREAM_FORMATS = ('ndjson', 'sse')
+STREAM_MIMETYPES = {'ndjson': 'application/x-ndjson', 'sse': 'text/event-stream'}
+
+
+class BatchError(ValueError):
+    """Raised when a batch upload cannot be accepted as a whole"""
+    pass
+
+
+def is_archive(filename):
+    return filename.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def has_allowed_extension(filename, allowed_extensions):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in allowed_extensions
+
+
+def archive_members(fileobj, filename, allowed_extensions=None):
+    """(name, file object) for each image in a zip or tar archive, in name order
+
+    Directory components are dropped from member names so nothing can be
+    written outside the upload directory. Files without an allowed extension
+    are skipped unless allowed_extensions is None.
+    """
+    if filename.lower().endswith('.zip'):
+        with zipfile.ZipFile(fileobj) as archive:
+            names = sorted(info.filename for info in archive.infolist() if not info.is_dir())
+            for name in names:
+                base_name = os.path.basename(name)
+                if name.startswith('__MACOSX/') or base_name.startswith('.'):
+                    continue
+                if allowed_extensions is None or has_allowed_extension(base_name, allowed_extensions):
+                    with archive.open(name) as member:
+                        yield base_name, member
+    else:
+        with tarfile.open(fileobj=fileobj, mode='r:*') as archive:
+            members = sorted((m for m in archive.getmembers() if m.isfile()), key=lambda m: m.name)
+            for member in members:
+                base_name = os.path.basename(member.name)
+                if base_name.startswith('.'):
+                    continue
+                if allowed_extensions is None or has_allowed_extension(base_name, allowed_extensions):
+                    yield base_name, archive.extractfile(member)
+
+
+def save_batch(files, upload_dir, timestamp, allowed_extensions, max_files):
+    """Save uploaded images and the images inside uploaded archives
+
+    Each item gets its own timestamp, '<timestamp>_<index>_<suffix>' with a
+    random suffix, so every image has its own upload and comparison files even
+    when batches arrive in the same second. Returns a list of
+    {'index', 'filename', 'filepath', 'timestamp'}; raises BatchError if the
+    batch holds no images or more than max_files.
+    """
+    items = []
+    try:
+        for file in files:
+            if is_archive(file.filename):
+                members = archive_members(file.stream, file.filename, allowed_extensions)
+            elif has_allowed_extension(file.filename, allowed_extensions):
+                members = [(os.path.basename(file.filename), file.stream)]
+            else:
+                raise BatchError(f'Invalid file type: {file.filename}')
+
+            for name, stream in members:
+                if len(items) >= max_files:
+                    raise BatchError(f'Too many images in batch, the limit is {max_files}')
+                index = len(items)
+                item_timestamp = f"{timestamp}_{index:03d}_{uuid.uuid4().hex[:8]}"
+                filepath = os.path.join(upload_dir, f"{item_timestamp}_{name}")
+                with open(filepath, 'wb') as f:
+                    while True:
+                        chunk = stream.read(1 << 20)
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                items.append({'index': index, 'filename': name, 'filepath': filepath,
+                              'timestamp': item_timestamp})
+    except (zipfile.BadZipFile, tarfile.TarError) as e:
+        remove_items(items)
+        raise BatchError(f'Failed to read archive: {str(e)}')
+    except BatchError:
+        remove_items(items)
+        raise
+
+    if not items:
+        raise BatchError('No images found in batch')
+    return items
+
+
+def remove_items(items):
+    for item in items:
+        try:
+            os.remove(item['filepath'])
+        except FileNotFoundError:
+            pass
+
+
+def format_event(event, payload, stream_format='ndjson'):
+    """One streamed record: a JSON line, or a server-sent event"""
+    data = json.dumps({'type': event, **payload})
+    if stream_format == 'sse':
+        return f"event: {event}\ndata: {data}\n\n"
+    return data + '\n'
+
+
+def stream_batch(items, process_item, max_workers=2, stream_format='ndjson'):
+    """Process items concurrently and yield each result as soon as it is ready, then a summary
+
+    process_item(item) returns (payload, status_code). If the client goes
+    away, items that have not started are cancelled and their uploads removed.
+    """
+    start = time.monotonic()
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='batch-upload')
+    futures = {executor.submit(process_item, item): item for item in items}
+    summary = {'total': len(items), 'succeeded': 0, 'failed': 0, 'rejected': 0, 'comparison_files': []}
+    try:
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                payload, status_code = future.result()
+            except Exception as e:
+                payload, status_code = {'success': False, 'error': f'Server error: {str(e)}'}, 500
+
+            if payload.get('success'):
+                summary['succeeded'] += 1
+                summary['comparison_files'].append(payload['comparison_file'])
+            elif status_code in (429, 503):
+                summary['rejected'] += 1
+            else:
+                summary['failed'] += 1
+            yield format_event('result', {'index': item['index'], 'filename': item['filename'],
+                                          'status': status_code, **payload}, stream_format)
+
+        summary['comparison_files'].sort()
+        summary['elapsed_seconds'] = round(time.monotonic() - start, 3)
+        yield format_event('summary', summary, stream_format)
+    finally:
+        remove_items([item for future, item in futures.items() if future.cancel()])
+        executor.shutdown(wait=False)
+
+
+# Make functions available for import
+__all__ = ['BatchError', 'archive_members', 'is_archive', 'save_batch', 'stream_batch', 'format_event', 'STREAM_FORMATS', 'STREAM_MIMETYPES']
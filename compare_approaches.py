@@ -1,15 +1,16 @@
 import os
+import time
 import cv2
 import numpy as np
 from datetime import datetime
 import json
-from quantum_processing import process_image
-from skimage.metrics import structural_similarity as ssim
-from sklearn.metrics import mean_squared_error
-import matplotlib.pyplot as plt
+from quantum_processing import process_image, check_deadline, get_stage_executor, DeadlineExceeded
+from image_metrics import compare_images
+from metrics import record_stage, IMAGES_PROCESSED, ANOMALY_CANDIDATES
 
 def traditional_image_processing(image_path):
     """Traditional image processing approach"""
+    stage_start = time.perf_counter()
     try:
         # Read and preprocess image
         image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
@@ -47,6 +48,7 @@ def traditional_image_processing(image_path):
                     })
         
         # Sort anomalies by severity
+        ANOMALY_CANDIDATES.observe(len(anomalies), source='traditional')
         anomalies.sort(key=lambda x: x['severity'], reverse=True)
         
         # Apply traditional enhancement
@@ -59,6 +61,8 @@ def traditional_image_processing(image_path):
         name, ext = os.path.splitext(base_name)
         output_path = os.path.join(output_dir, f"{name}_traditional{ext}")
         cv2.imwrite(output_path, enhanced)
+        IMAGES_PROCESSED.inc(pipeline='traditional')
+        record_stage('traditional_processing', stage_start)
         
         return {
             'output_path': output_path,
@@ -73,19 +77,66 @@ def traditional_image_processing(image_path):
         print(f"Error in traditional processing: {str(e)}")
         return None
 
-def compare_quantum_traditional(image_path):
-    """Compare quantum and traditional approaches"""
+def process_both(image_path, deadline=None, parallel=False, quantum_runner=None, **process_image_options):
+    """Run process_image and traditional_image_processing on one image
+    
+    With parallel=True the traditional pipeline runs on the shared stage pool
+    while process_image (itself in parallel mode) runs on the calling thread.
+    Sequentially, the traditional pipeline is skipped if quantum processing
+    fails or the deadline has passed. quantum_runner replaces process_image,
+    e.g. with SharedMemoryProcessPool.process_image to run it in a worker
+    process. Returns (quantum_result, traditional_result).
+    """
+    if quantum_runner is None:
+        quantum_runner = process_image
+    if not parallel:
+        quantum_result = quantum_runner(image_path, deadline=deadline, **process_image_options)
+        if not quantum_result['success'] or (deadline is not None and time.monotonic() > deadline):
+            return quantum_result, None
+        return quantum_result, traditional_image_processing(image_path)
+    
+    traditional_future = get_stage_executor().submit(traditional_image_processing, image_path)
+    quantum_result = quantum_runner(image_path, deadline=deadline, parallel=True, **process_image_options)
+    return quantum_result, traditional_future.result()
+
+def compare_quantum_traditional(image_path, metrics_max_size=None, metrics_roi=None, ssim_regions=None,
+                                deadline=None, quantum_result=None, traditional_result=None, parallel=False):
+    """Compare quantum and traditional approaches
+    
+    Pass the results of earlier process_image and traditional_image_processing
+    calls (e.g. from process_both) as quantum_result and traditional_result to
+    reuse them instead of processing the image again. Otherwise both pipelines
+    run here, concurrently with parallel=True.
+    
+    metrics_max_size and metrics_roi=(x, y, w, h) restrict the similarity
+    metrics to a downsampled image or a region; ssim_regions=(rows, cols)
+    adds per-region SSIM values to the result. Like process_image, the
+    comparison gives up (returns None) once the monotonic deadline passes.
+    """
+    # Deferred so importing this module (e.g. from app.py) stays cheap. The
+    # Figure API is used instead of pyplot, whose global state is not thread-safe
+    from matplotlib.figure import Figure
+    
     # Process with quantum approach
-    quantum_result = process_image(image_path)
+    if quantum_result is None:
+        quantum_result, traditional_result = process_both(image_path, deadline=deadline, parallel=parallel)
     if not quantum_result['success']:
         print(f"Error in quantum processing: {quantum_result.get('error', 'Unknown error')}")
         return None
     
+    try:
+        check_deadline(deadline, 'traditional processing')
+    except DeadlineExceeded as e:
+        print(str(e))
+        return None
+    
     # Process with traditional approach
-    traditional_result = traditional_image_processing(image_path)
+    if traditional_result is None:
+        traditional_result = traditional_image_processing(image_path)
     if traditional_result is None:
         print("Error in traditional processing")
         return None
+    stage_start = time.perf_counter()
     
     # Load processed images
     quantum_image = cv2.imread(quantum_result['output_path'], cv2.IMREAD_GRAYSCALE)
@@ -96,8 +147,9 @@ def compare_quantum_traditional(image_path):
         traditional_image = cv2.resize(traditional_image, (quantum_image.shape[1], quantum_image.shape[0]))
     
     # Calculate comparison metrics
-    ssim_score = ssim(quantum_image, traditional_image)
-    mse = mean_squared_error(quantum_image.flatten(), traditional_image.flatten())
+    similarity = compare_images(quantum_image, traditional_image, max_size=metrics_max_size,
+                                roi=metrics_roi, region_grid=ssim_regions)
+    stage_start = record_stage('comparison_metrics', stage_start)
     
     # Create visual comparison
     comparison_dir = 'comparison_results'
@@ -106,37 +158,43 @@ def compare_quantum_traditional(image_path):
     name, ext = os.path.splitext(base_name)
     comparison_path = os.path.join(comparison_dir, f"{name}_comparison.png")
     
-    plt.figure(figsize=(15, 5))
-    plt.subplot(131)
-    plt.imshow(cv2.imread(image_path, cv2.IMREAD_GRAYSCALE), cmap='gray')
-    plt.title('Original')
-    plt.axis('off')
+    figure = Figure(figsize=(15, 5))
+    axes = figure.add_subplot(131)
+    axes.imshow(cv2.imread(image_path, cv2.IMREAD_GRAYSCALE), cmap='gray')
+    axes.set_title('Original')
+    axes.axis('off')
     
-    plt.subplot(132)
-    plt.imshow(quantum_image, cmap='gray')
-    plt.title('Quantum Processing')
-    plt.axis('off')
+    axes = figure.add_subplot(132)
+    axes.imshow(quantum_image, cmap='gray')
+    axes.set_title('Quantum Processing')
+    axes.axis('off')
     
-    plt.subplot(133)
-    plt.imshow(traditional_image, cmap='gray')
-    plt.title('Traditional Processing')
-    plt.axis('off')
+    axes = figure.add_subplot(133)
+    axes.imshow(traditional_image, cmap='gray')
+    axes.set_title('Traditional Processing')
+    axes.axis('off')
     
-    plt.savefig(comparison_path)
-    plt.close()
+    figure.savefig(comparison_path)
+    record_stage('comparison_plot', stage_start)
     
-    return {
+    result = {
         'image_path': image_path,
         'quantum_anomalies': len(quantum_result['anomalies']),
         'traditional_anomalies': len(traditional_result['anomalies']),
-        'structural_similarity': float(ssim_score),
-        'mean_squared_error': float(mse),
+        'structural_similarity': similarity['ssim'],
+        'mean_squared_error': similarity['mse'],
+        # Identical images have infinite PSNR, which is not valid JSON
+        'peak_signal_to_noise_ratio': similarity['psnr'] if np.isfinite(similarity['psnr']) else None,
+        'metrics_resolution': similarity['resolution'],
         'metrics_comparison': {
             'quantum': quantum_result['metrics'],
             'traditional': traditional_result['metrics']
         },
         'comparison_path': comparison_path
     }
+    if ssim_regions is not None:
+        result['ssim_regions'] = similarity['ssim_regions']
+    return result
 
 def main():
     """Main function to run comparisons on test images"""
@@ -0,0 +1,160 @@
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+import cv2
+
+from feature_cache import bypass_caches
+
+# Settings the latency-budget mode chooses from
+MIN_QUBITS = 4
+MAX_QUBITS = 14
+SHOT_LADDER = [256, 512, 1024, 2048, 4096, 8192, 16384]
+
+
+def _quantum_terms(n_qubits, shots):
+    """Regressors for the simulation time: fixed cost, circuit size, state size and sampling"""
+    return [1.0, n_qubits ** 2, 2.0 ** n_qubits, shots * n_qubits]
+
+
+class LatencyCostModel:
+    """Predicts process_image latency from qubit count, shot count and image size
+
+    Quantum time is modelled as c0 + c1*n^2 + c2*2^n + c3*shots*n and the
+    classical stages as a fixed plus a per-pixel cost; both are fitted by
+    calibrate(). choose() only picks settings within the calibrated range,
+    since the 2^n term extrapolates poorly.
+    """
+    def __init__(self):
+        self.quantum_coefficients = None
+        self.classical_fixed = None
+        self.seconds_per_pixel = None
+        self.max_qubits = None
+        self.max_shots = None
+
+    @property
+    def calibrated(self):
+        return self.quantum_coefficients is not None
+
+    def calibrate(self, qubit_counts=(4, 6, 8, 10, 12, MAX_QUBITS), shot_counts=(256, 2048, SHOT_LADDER[-1])):
+        """Time the simulator and the classical stages on synthetic data
+
+        The defaults span every setting choose() can pick. The quantum result
+        memo is bypassed, so every timed call runs the simulator.
+        """
+        with bypass_caches():
+            return self._calibrate(qubit_counts, shot_counts)
+
+    def _calibrate(self, qubit_counts, shot_counts):
+        from quantum_processing import quantum_feature_extraction, process_image
+
+        rng = np.random.RandomState(0)
+        data = rng.rand(1024)
+        quantum_feature_extraction(data, n_qubits=qubit_counts[0], shots=shot_counts[0])  # Exclude first-call overhead
+
+        terms, timings = [], []
+        for n_qubits in qubit_counts:
+            for shots in shot_counts:
+                start = time.perf_counter()
+                quantum_feature_extraction(data, n_qubits=n_qubits, shots=shots)
+                timings.append(time.perf_counter() - start)
+                terms.append(_quantum_terms(n_qubits, shots))
+
+        coefficients, _, _, _ = np.linalg.lstsq(np.array(terms), np.array(timings), rcond=None)
+        self.quantum_coefficients = np.maximum(coefficients, 0.0)
+        self.max_qubits = max(qubit_counts)
+        self.max_shots = max(shot_counts)
+
+        # Classical cost: full pipeline on synthetic scans of two sizes minus the
+        # predicted quantum part, fitted as a fixed plus a per-pixel cost
+        sizes, classical = [], []
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for side in (256, 256, 1024):  # The first run only warms up the pipeline
+                # Smooth synthetic anatomy: upsampled low-resolution noise
+                synthetic = cv2.resize((rng.rand(16, 16) * 255).astype(np.uint8), (side, side),
+                                       interpolation=cv2.INTER_CUBIC)
+                image_path = os.path.join(temp_dir, f'calibration_{os.getpid()}.png')
+                cv2.imwrite(image_path, synthetic)
+                start = time.perf_counter()
+                result = process_image(image_path, n_qubits=MIN_QUBITS, shots=SHOT_LADDER[0])
+                elapsed = time.perf_counter() - start
+                if result.get('success') and os.path.exists(result['output_path']):
+                    os.remove(result['output_path'])
+                sizes.append(synthetic.size)
+                classical.append(max(elapsed - self.predict_quantum(MIN_QUBITS, SHOT_LADDER[0]), 0.0))
+
+        self.seconds_per_pixel = max((classical[2] - classical[1]) / (sizes[2] - sizes[1]), 0.0)
+        self.classical_fixed = max(classical[1] - self.seconds_per_pixel * sizes[1], 0.0)
+        return self
+
+    def to_dict(self):
+        """JSON-serializable fitted parameters"""
+        return {
+            'quantum_coefficients': [float(c) for c in self.quantum_coefficients],
+            'classical_fixed': self.classical_fixed,
+            'seconds_per_pixel': self.seconds_per_pixel,
+            'max_qubits': self.max_qubits,
+            'max_shots': self.max_shots
+        }
+
+    @classmethod
+    def from_dict(cls, parameters):
+        """Model with the parameters of to_dict, e.g. calibrated in another process"""
+        model = cls()
+        model.quantum_coefficients = np.array(parameters['quantum_coefficients'], dtype=np.float64)
+        model.classical_fixed = float(parameters['classical_fixed'])
+        model.seconds_per_pixel = float(parameters['seconds_per_pixel'])
+        model.max_qubits = int(parameters['max_qubits'])
+        model.max_shots = int(parameters['max_shots'])
+        return model
+
+    def predict_quantum(self, n_qubits, shots):
+        return float(np.dot(self.quantum_coefficients, _quantum_terms(n_qubits, shots)))
+
+    def predict(self, n_qubits, shots, pixels):
+        return self.predict_quantum(n_qubits, shots) + self.classical_fixed + self.seconds_per_pixel * pixels
+
+    def choose(self, latency_budget, pixels, min_qubits=MIN_QUBITS, max_qubits=MAX_QUBITS):
+        """Largest qubit count, then largest shot count, expected to fit the budget
+
+        Settings beyond the calibrated qubit and shot counts are not
+        considered. Returns (n_qubits, shots, predicted_seconds). If nothing
+        fits, the cheapest setting is returned.
+        """
+        max_qubits = max(min_qubits, min(max_qubits, self.max_qubits))
+        shot_ladder = [shots for shots in SHOT_LADDER if shots <= self.max_shots] or SHOT_LADDER[:1]
+        for n_qubits in range(max_qubits, min_qubits - 1, -1):
+            for shots in reversed(shot_ladder):
+                predicted = self.predict(n_qubits, shots, pixels)
+                if predicted <= latency_budget:
+                    return n_qubits, shots, predicted
+        return min_qubits, SHOT_LADDER[0], self.predict(min_qubits, SHOT_LADDER[0], pixels)
+
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_cost_model(calibrate=True):
+    """Process-wide cost model, calibrated on first use
+
+    With calibrate=False the model is returned only if it already exists, otherwise None.
+    """
+    global _model
+    with _model_lock:
+        if _model is None and calibrate:
+            _model = LatencyCostModel().calibrate()
+        return _model
+
+
+def set_cost_model(model):
+    """Install an already calibrated model as the process-wide one"""
+    global _model
+    with _model_lock:
+        _model = model
+
+
+# Make functions available for import
+__all__ = ['LatencyCostModel', 'get_cost_model', 'set_cost_model']
@@ -0,0 +1,189 @@
+import numpy as np
+import cv2
+
+from quantum_processing import DEDUP_RADIUS
+
+# Score thresholds evaluated by default; scores above the last one count as
+# anomalous at every threshold
+DEFAULT_THRESHOLDS = np.linspace(0.0, 1.0, 201)
+
+# Anomaly types that do not describe a place in the image
+FEATURE_SPACE_TYPES = ('quantum_anomaly',)
+
+
+def anomaly_score_map(anomalies, shape, radius=DEDUP_RADIUS, score_range=(0.0, 1.0)):
+    """Per-pixel anomaly scores at native resolution
+
+    Each anomaly paints its severity, clipped to score_range (the span of
+    the default thresholds), over a disc of radius pixels around its [x, y]
+    location (the deduplication radius, within which process_image treats
+    detections as one); where discs overlap the highest severity wins.
+    Pixels without an anomaly score 0. Anomalies without a location, such
+    as global quantum anomalies (FEATURE_SPACE_TYPES) that come from the
+    feature histogram rather than from a place in the image, are skipped,
+    as are locations outside the image.
+    """
+    height, width = shape[:2]
+    score_map = np.zeros(shape, dtype=np.float32)
+    for anomaly in sorted(anomalies, key=lambda a: a['severity']):
+        if anomaly.get('type') in FEATURE_SPACE_TYPES or 'location' not in anomaly:
+            continue
+        x, y = (int(value) for value in anomaly['location'][:2])
+        if not (0 <= x < width and 0 <= y < height):
+            continue
+        severity = float(np.clip(anomaly['severity'], *score_range))
+        cv2.circle(score_map, (x, y), radius, severity, thickness=-1)
+    return score_map
+
+
+def ground_truth_mask(ground_truth, shape):
+    """Boolean mask of the given shape; coarser (or finer) masks are resized with nearest-neighbour sampling"""
+    ground_truth = np.asarray(ground_truth)
+    if ground_truth.shape != tuple(shape):
+        ground_truth = cv2.resize(ground_truth.astype(np.uint8), (shape[1], shape[0]),
+                                  interpolation=cv2.INTER_NEAREST)
+    return ground_truth > 0
+
+
+def confusion_metrics(tp, fp, fn, tn):
+    """Accuracy, precision, recall and F1 from confusion counts (scalars or arrays)
+
+    Precision, recall and F1 are 0 where they are undefined, as in scikit-learn.
+    """
+    tp, fp, fn, tn = (np.asarray(count, dtype=np.float64) for count in (tp, fp, fn, tn))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.where(tp + fp > 0, tp / (tp + fp), 0.0)
+        recall = np.where(tp + fn > 0, tp / (tp + fn), 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+        accuracy = (tp + tn) / (tp + fp + fn + tn)
+    return {'accuracy': accuracy, 'precision': precision, 'recall': recall, 'f1': f1}
+
+
+def operating_point(scores, labels, threshold=0.5):
+    """Accuracy, precision, recall and F1 of predicting score > threshold for one map"""
+    predicted = scores > threshold
+    labels = np.asarray(labels, dtype=bool)
+    tp = np.count_nonzero(predicted & labels)
+    fp = np.count_nonzero(predicted) - tp
+    fn = np.count_nonzero(labels) - tp
+    tn = labels.size - tp - fp - fn
+    return {key: float(value) for key, value in confusion_metrics(tp, fp, fn, tn).items()}
+
+
+class ThresholdSweep:
+    """Confusion counts at many score thresholds at once, accumulated over any number of score maps
+
+    A pixel is predicted anomalous at threshold t when its score is > t.
+    Each update bins the scores between the sorted thresholds (searchsorted)
+    and counts positive and negative pixels per bin (bincount). Reverse
+    cumulative sums of the bin counts give the true and false positives at
+    every threshold, so ROC and precision-recall curves for the whole
+    dataset come from one pass over the pixels. Scores that fall between
+    two thresholds are tied, so curves and AUC are exact at the thresholds
+    and interpolated between them.
+    """
+    def __init__(self, thresholds=DEFAULT_THRESHOLDS):
+        self.thresholds = np.unique(np.asarray(thresholds, dtype=np.float64))
+        self.positive = np.zeros(len(self.thresholds) + 1, dtype=np.int64)
+        self.negative = np.zeros(len(self.thresholds) + 1, dtype=np.int64)
+
+    def histogram(self, scores, labels):
+        """(positive, negative) pixel counts per bin; bin k holds scores above k thresholds"""
+        bins = np.searchsorted(self.thresholds, np.ravel(scores), side='left')
+        labels = np.ravel(np.asarray(labels, dtype=bool))
+        n_bins = len(self.thresholds) + 1
+        return (np.bincount(bins[labels], minlength=n_bins),
+                np.bincount(bins[~labels], minlength=n_bins))
+
+    def update(self, scores, labels):
+        """Add one score map and its ground-truth mask; returns the bin counts of this map"""
+        positive, negative = self.histogram(scores, labels)
+        self.add_counts(positive, negative)
+        return positive, negative
+
+    def add_counts(self, positive, negative):
+        """Add bin counts from histogram, e.g. stored with an earlier run's results"""
+        self.positive += np.asarray(positive, dtype=np.int64)
+        self.negative += np.asarray(negative, dtype=np.int64)
+
+    @property
+    def n_positive(self):
+        return int(self.positive.sum())
+
+    @property
+    def n_negative(self):
+        return int(self.negative.sum())
+
+    def counts(self):
+        """tp, fp, fn, tn arrays with one entry per threshold"""
+        tp = np.cumsum(self.positive[::-1])[::-1][1:]
+        fp = np.cumsum(self.negative[::-1])[::-1][1:]
+        return tp, fp, self.n_positive - tp, self.n_negative - fp
+
+    def metrics(self):
+        """Accuracy, precision, recall, F1 and false positive rate per threshold"""
+        tp, fp, fn, tn = self.counts()
+        metrics = confusion_metrics(tp, fp, fn, tn)
+        metrics['fpr'] = fp / self.n_negative if self.n_negative else np.zeros(len(fp))
+        return metrics
+
+    def roc_curve(self):
+        """(fpr, tpr) in order of increasing fpr, from nothing to everything predicted anomalous"""
+        tp, fp, _, _ = self.counts()
+        tpr = np.concatenate([[0.0], tp[::-1] / max(self.n_positive, 1), [1.0]])
+        fpr = np.concatenate([[0.0], fp[::-1] / max(self.n_negative, 1), [1.0]])
+        return fpr, tpr
+
+    def pr_curve(self):
+        """(recall, precision) in order of increasing recall, ending with everything predicted anomalous"""
+        tp, fp, fn, tn = self.counts()
+        metrics = confusion_metrics(tp, fp, fn, tn)
+        total = self.n_positive + self.n_negative
+        recall = np.concatenate([metrics['recall'][::-1], [1.0 if self.n_positive else 0.0]])
+        precision = np.concatenate([metrics['precision'][::-1], [self.n_positive / total if total else 0.0]])
+        return recall, precision
+
+    def roc_auc(self):
+        """Area under the ROC curve (trapezoidal); None without both classes"""
+        if not self.n_positive or not self.n_negative:
+            return None
+        fpr, tpr = self.roc_curve()
+        return float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+
+    def average_precision(self):
+        """Area under the precision-recall curve as a step function (scikit-learn's definition); None without positives"""
+        if not self.n_positive:
+            return None
+        recall, precision = self.pr_curve()
+        return float(np.sum(np.diff(recall, prepend=0.0) * precision))
+
+    def best_threshold(self, metric='f1'):
+        """(threshold, value) that maximizes a per-threshold metric"""
+        values = self.metrics()[metric]
+        index = int(np.argmax(values))
+        return float(self.thresholds[index]), float(values[index])
+
+    def summary(self, curve_points=True):
+        """JSON-serializable totals, AUCs, the best-F1 threshold and, optionally, per-threshold curves"""
+        summary = {
+            'positive_pixels': self.n_positive,
+            'negative_pixels': self.n_negative,
+            'roc_auc': self.roc_auc(),
+            'average_precision': self.average_precision()
+        }
+        if self.n_positive:
+            threshold, f1 = self.best_threshold('f1')
+            summary['best_f1'] = {'threshold': threshold, 'f1': f1}
+        if curve_points:
+            tp, fp, fn, tn = self.counts()
+            summary['curves'] = {
+                'thresholds': self.thresholds.tolist(),
+                'tp': tp.tolist(), 'fp': fp.tolist(), 'fn': fn.tolist(), 'tn': tn.tolist(),
+                **{key: np.round(value, 6).tolist() for key, value in self.metrics().items()}
+            }
+        return summary
+
+
+# Make functions available for import
+__all__ = ['ThresholdSweep', 'anomaly_score_map', 'ground_truth_mask', 'operating_point', 'confusion_metrics',
+           'DEFAULT_THRESHOLDS', 'FEATURE_SPACE_TYPES']
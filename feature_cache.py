@@ -0,0 +1,113 @@
+import collections
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from metrics import record_cache
+
+# Circuit inputs (normalized values in [0, 1]) are rounded to this many
+# decimals before they are bound into angles and used as cache keys
+ANGLE_DECIMALS = int(os.environ.get('QMI_ANGLE_DECIMALS', 3))
+FEATURE_CACHE_SIZE = int(os.environ.get('QMI_FEATURE_CACHE_SIZE', 4096))
+PATCH_CACHE_SIZE = int(os.environ.get('QMI_PATCH_CACHE_SIZE', 65536))
+
+# Set by bypass_caches() for the current thread
+_bypass = threading.local()
+
+
+class LRUCache:
+    """Bounded, thread-safe least-recently-used cache with hit and miss counters
+
+    A maxsize of 0 disables caching; lookups are still counted as misses.
+    Inside bypass_caches() lookups miss without being counted and nothing is stored.
+    """
+    def __init__(self, name, maxsize):
+        self.name = name
+        self.maxsize = maxsize
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if getattr(_bypass, 'active', False):
+            return None
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        record_cache(self.name, value is not None)
+        return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0 or getattr(_bypass, 'active', False):
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+
+def quantize(values, decimals=ANGLE_DECIMALS):
+    """Round circuit inputs to the precision that is bound into the circuit and keyed on"""
+    return np.round(np.asarray(values, dtype=np.float64), decimals)
+
+
+def backend_key(backend):
+    """Part of the cache key identifying the simulator and its seed"""
+    return backend.name, getattr(backend.options, 'seed_simulator', None)
+
+
+# Whole-circuit features from quantum_feature_extraction, and per-patch
+# entropies from quantum_patch_feature_map
+feature_cache = LRUCache('quantum_features', FEATURE_CACHE_SIZE)
+patch_cache = LRUCache('quantum_patches', PATCH_CACHE_SIZE)
+
+
+def clear_caches():
+    """Drop all memoized quantum results and reset the counters"""
+    feature_cache.clear()
+    patch_cache.clear()
+
+
+@contextmanager
+def bypass_caches():
+    """Compute everything afresh in this thread for the duration of the block, e.g. to time it"""
+    previous = getattr(_bypass, 'active', False)
+    _bypass.active = True
+    try:
+        yield
+    finally:
+        _bypass.active = previous
+
+
+def cache_stats():
+    return {cache.name: cache.stats() for cache in (feature_cache, patch_cache)}
+
+
+# Make functions available for import
+__all__ = ['LRUCache', 'feature_cache', 'patch_cache', 'clear_caches', 'bypass_caches', 'cache_stats', 'quantize',
+           'backend_key']
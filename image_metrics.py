@@ -0,0 +1,117 @@
+import numpy as np
+import cv2
+
+
+def _prepare_pair(image_a, image_b, max_size=None, roi=None):
+    """Crop to an optional ROI and downsample so the larger side is at most max_size"""
+    if image_a.shape != image_b.shape:
+        raise ValueError(f'Images must have the same shape, got {image_a.shape} and {image_b.shape}')
+
+    if roi is not None:
+        x, y, w, h = roi
+        image_a = image_a[y:y+h, x:x+w]
+        image_b = image_b[y:y+h, x:x+w]
+        if image_a.size == 0:
+            raise ValueError(f'ROI {roi} does not overlap the image')
+
+    if max_size is not None and max(image_a.shape[:2]) > max_size:
+        scale = max_size / max(image_a.shape[:2])
+        new_size = (max(1, int(image_a.shape[1] * scale)), max(1, int(image_a.shape[0] * scale)))
+        image_a = cv2.resize(image_a, new_size, interpolation=cv2.INTER_AREA)
+        image_b = cv2.resize(image_b, new_size, interpolation=cv2.INTER_AREA)
+
+    return image_a, image_b
+
+
+def mse_psnr(image_a, image_b, data_range=255.0):
+    """Mean squared error and PSNR computed together in a single pass"""
+    diff = image_a.astype(np.float32)
+    diff -= image_b
+    mse = float(np.mean(np.square(diff, out=diff), dtype=np.float64))
+    psnr = float('inf') if mse == 0 else float(10 * np.log10(data_range ** 2 / mse))
+    return mse, psnr
+
+
+def structural_similarity(image_a, image_b, win_size=7, gaussian=False, sigma=1.5,
+                          data_range=255.0, full=False):
+    """SSIM using separable box (default) or Gaussian filters
+
+    The box-filter defaults follow skimage.metrics.structural_similarity
+    (7x7 window, sample covariance, border of win_size // 2 excluded from the mean).
+    With full=True the per-pixel SSIM map is returned as well.
+    Moments are computed in float64: variances are E[x^2] - E[x]^2 of values
+    up to 255, which cancels catastrophically in float32 on flat regions.
+    """
+    a = image_a.astype(np.float64)
+    b = image_b.astype(np.float64)
+
+    if gaussian:
+        win_size = int(2 * round(3.5 * sigma) + 1)
+        blur = lambda x: cv2.GaussianBlur(x, (win_size, win_size), sigma, borderType=cv2.BORDER_REFLECT)
+        cov_norm = 1.0
+    else:
+        blur = lambda x: cv2.boxFilter(x, -1, (win_size, win_size), borderType=cv2.BORDER_REFLECT)
+        n_pixels = win_size ** 2
+        cov_norm = n_pixels / (n_pixels - 1)
+
+    if min(a.shape[:2]) < win_size:
+        raise ValueError(f'Images must be at least {win_size}x{win_size} for SSIM')
+
+    ux = blur(a)
+    uy = blur(b)
+    vx = cov_norm * (blur(a * a) - ux * ux)
+    vy = cov_norm * (blur(b * b) - uy * uy)
+    vxy = cov_norm * (blur(a * b) - ux * uy)
+
+    c1 = (0.01 * data_range) ** 2
+    c2 = (0.03 * data_range) ** 2
+    numerator = (2 * ux * uy + c1) * (2 * vxy + c2)
+    denominator = (ux * ux + uy * uy + c1) * (vx + vy + c2)
+    ssim_map = numerator / denominator
+
+    pad = (win_size - 1) // 2
+    mssim = float(np.mean(ssim_map[pad:ssim_map.shape[0]-pad, pad:ssim_map.shape[1]-pad], dtype=np.float64))
+
+    if full:
+        return mssim, ssim_map
+    return mssim
+
+
+def region_means(value_map, grid=(4, 4)):
+    """Average a per-pixel map over a rows x cols grid of regions"""
+    rows, cols = grid
+    row_edges = np.linspace(0, value_map.shape[0], rows + 1).astype(int)
+    col_edges = np.linspace(0, value_map.shape[1], cols + 1).astype(int)
+    return [[float(np.mean(value_map[row_edges[i]:row_edges[i+1], col_edges[j]:col_edges[j+1]]))
+             for j in range(cols)]
+            for i in range(rows)]
+
+
+def compare_images(image_a, image_b, max_size=None, roi=None, region_grid=None,
+                   gaussian=False, data_range=255.0):
+    """Compute MSE, PSNR and SSIM between two grayscale images
+
+    max_size downsamples both images before comparison and roi=(x, y, w, h)
+    restricts it to a region. With region_grid=(rows, cols) the result also
+    contains the mean SSIM of each grid region under 'ssim_regions'.
+    """
+    image_a, image_b = _prepare_pair(image_a, image_b, max_size=max_size, roi=roi)
+    mse, psnr = mse_psnr(image_a, image_b, data_range=data_range)
+
+    metrics = {
+        'mse': mse,
+        'psnr': psnr,
+        'resolution': f"{image_a.shape[1]}x{image_a.shape[0]}"
+    }
+    if region_grid is not None:
+        metrics['ssim'], ssim_map = structural_similarity(image_a, image_b, gaussian=gaussian,
+                                                          data_range=data_range, full=True)
+        metrics['ssim_regions'] = region_means(ssim_map, region_grid)
+    else:
+        metrics['ssim'] = structural_similarity(image_a, image_b, gaussian=gaussian, data_range=data_range)
+
+    return metrics
+
+
+# Make functions available for import
+__all__ = ['compare_images', 'mse_psnr', 'structural_similarity', 'region_means']
@@ -0,0 +1,75 @@
+import importlib
+import json
+import subprocess
+import sys
+import time
+
+# Dependencies that are only imported by the code paths that use them
+HEAVY_MODULES = [
+    'qiskit',
+    'qiskit_aer',
+    'pennylane',
+    'matplotlib.pyplot'
+]
+
+_STARTUP_SNIPPET = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds,
+                  'heavy_modules_loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+
+def measure_startup(module_name):
+    """Time importing a module in a fresh interpreter and list the heavy modules it pulled in"""
+    code = _STARTUP_SNIPPET.format(module=module_name, heavy=HEAVY_MODULES)
+    completed = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+    if completed.returncode != 0:
+        return {'seconds': None, 'heavy_modules_loaded': [], 'error': completed.stderr.strip()}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def profile_imports(modules=HEAVY_MODULES):
+    """Import each module in turn and return how long it took"""
+    timings = []
+    for name in modules:
+        already_loaded = name in sys.modules
+        start = time.perf_counter()
+        error = None
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            error = str(e)
+        timings.append({
+            'module': name,
+            'seconds': time.perf_counter() - start,
+            'already_loaded': already_loaded,
+            'error': error
+        })
+    return timings
+
+
+def print_import_profile(module_name):
+    """Print the startup cost of an entry point and the cost of each deferred dependency"""
+    startup = measure_startup(module_name)
+    print(f"Startup profile for '{module_name}'")
+    print("-" * 50)
+    if startup['seconds'] is None:
+        print(f"Import failed: {startup['error']}")
+        return
+    print(f"Import time: {startup['seconds']:.3f}s")
+    loaded = startup['heavy_modules_loaded']
+    print(f"Heavy modules loaded at startup: {', '.join(loaded) if loaded else 'none'}")
+
+    print("\nDeferred dependencies (loaded on first use):")
+    for timing in profile_imports():
+        if timing['error']:
+            print(f"  {timing['module']:<20} not available ({timing['error']})")
+        else:
+            print(f"  {timing['module']:<20} {timing['seconds']:.3f}s")
+
+
+# Make functions available for import
+__all__ = ['HEAVY_MODULES', 'measure_startup', 'profile_imports', 'print_import_profile']
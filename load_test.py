@@ -0,0 +1,323 @@
+# Load test for the Flask endpoints: python load_test.py --concurrency 8 --duration 60
+#
+# By default the app is driven in-process through its WSGI interface from a
+# temporary working directory; --url targets a running server instead. The
+# report (latency percentiles, throughput and error rates per endpoint) is
+# written as JSON with sorted keys so runs can be diffed across versions.
+import argparse
+import io
+import json
+import os
+import queue
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import cv2
+
+ENDPOINTS = ('upload', 'download', 'list')
+DEFAULT_MIX = {'upload': 1, 'download': 4, 'list': 2}
+PERCENTILES = (50, 90, 95, 99)
+
+
+def parse_mix(text):
+    """'upload=1,download=4,list=2' -> {'upload': 1.0, 'download': 4.0, 'list': 2.0}"""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint in mix: {name}. Use: {', '.join(ENDPOINTS)}")
+        mix[name] = float(weight) if weight else 1.0
+    return mix
+
+
+def synthetic_images(count=4, size=512, seed=0):
+    """PNG-encoded smooth synthetic scans (upsampled low-resolution noise)"""
+    rng = np.random.RandomState(seed)
+    images = []
+    for _ in range(count):
+        image = cv2.resize((rng.rand(16, 16) * 255).astype(np.uint8), (size, size),
+                           interpolation=cv2.INTER_CUBIC)
+        images.append(cv2.imencode('.png', image)[1].tobytes())
+    return images
+
+
+def populate_comparisons(directory, count, seed=0):
+    """Write count synthetic comparison files, as /upload would, and return their names"""
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    filenames = []
+    for index in range(count):
+        timestamp = f"20000101_{index // 3600 % 24:02d}{index // 60 % 60:02d}{index % 60:02d}_lt{index:06d}"
+        filename = f"comparison_{timestamp}.json"
+        record = {
+            'quantum_result': {
+                'success': True,
+                'metrics': {'brightness': rng.uniform(50, 200), 'contrast': rng.uniform(10, 80)},
+                'anomalies': [{'type': 'quantum_patch_anomaly', 'location': [rng.randrange(512), rng.randrange(512)],
+                               'severity': rng.random()} for _ in range(5)]
+            },
+            'comparison_result': {'structural_similarity': rng.random(), 'mean_squared_error': rng.uniform(0, 500)},
+            'timestamp': timestamp,
+            'original_filename': f'load_test_{index}.png'
+        }
+        with open(os.path.join(directory, filename), 'w') as f:
+            json.dump(record, f)
+        filenames.append(filename)
+    return filenames
+
+
+class WSGIClient:
+    """Requests against the app object through Flask's test client"""
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def get(self, path):
+        response = self.client.get(path)
+        return response.status_code, response.get_json(silent=True)
+
+    def upload(self, filename, data):
+        response = self.client.post('/upload', data={'file': (io.BytesIO(data), filename)},
+                                    content_type='multipart/form-data')
+        return response.status_code, response.get_json(silent=True)
+
+
+class HTTPClient:
+    """Requests against a running server"""
+    def __init__(self, url):
+        import requests
+        self.url = url.rstrip('/')
+        self.session = requests.Session()
+
+    def _result(self, response):
+        try:
+            return response.status_code, response.json()
+        except ValueError:
+            return response.status_code, None
+
+    def get(self, path):
+        return self._result(self.session.get(self.url + path))
+
+    def upload(self, filename, data):
+        return self._result(self.session.post(self.url + '/upload',
+                                              files={'file': (filename, data, 'image/png')}))
+
+
+def summarize(samples, elapsed):
+    """Latency percentiles (ms), throughput and error rates for a list of samples"""
+    latencies = np.array([sample['latency'] for sample in samples]) * 1000
+    errors = sum(1 for sample in samples if not sample['ok'])
+    rejected = sum(1 for sample in samples if sample['status'] in (429, 503))
+    status_codes = {}
+    for sample in samples:
+        status_codes[str(sample['status'])] = status_codes.get(str(sample['status']), 0) + 1
+
+    summary = {
+        'requests': len(samples),
+        'errors': errors,
+        'error_rate': round(errors / len(samples), 4) if samples else 0.0,
+        'rejected': rejected,
+        'status_codes': status_codes,
+        'throughput_rps': round(len(samples) / elapsed, 3) if elapsed > 0 else 0.0,
+        'successful_rps': round((len(samples) - errors) / elapsed, 3) if elapsed > 0 else 0.0,
+        'latency_ms': None
+    }
+    if len(latencies):
+        summary['latency_ms'] = {
+            **{f'p{p}': round(float(np.percentile(latencies, p)), 2) for p in PERCENTILES},
+            'mean': round(float(latencies.mean()), 2),
+            'max': round(float(latencies.max()), 2)
+        }
+    return summary
+
+
+def run_load_test(url=None, workdir=None, concurrency=4, rate=None, duration=30.0, max_requests=None,
+                  mix=None, image_size=512, comparison_files=2000, seed=0):
+    """Drive the endpoints and return the report
+
+    Without rate, each of the concurrency threads issues requests back to
+    back (closed loop). With rate (requests/second), arrivals follow a
+    Poisson process and latency is measured from each request's scheduled
+    arrival time, so time spent waiting for a free thread is included.
+    """
+    mix = dict(DEFAULT_MIX if mix is None else mix)
+    names = [name for name in ENDPOINTS if mix.get(name, 0) > 0]
+    weights = [mix[name] for name in names]
+    images = synthetic_images(size=image_size, seed=seed)
+
+    # Comparison files go where the app reads them: the WSGI working
+    # directory, or the server's directory if --workdir is given with --url
+    download_names = []
+    if comparison_files and workdir is not None:
+        print(f"Writing {comparison_files} comparison files to {workdir}")
+        download_names = populate_comparisons(os.path.join(workdir, 'comparison_results'), comparison_files, seed)
+    if url is None:
+        from app import app
+        make_client = lambda: WSGIClient(app)
+    else:
+        make_client = lambda: HTTPClient(url)
+    names_lock = threading.Lock()
+
+    samples = []
+    samples_lock = threading.Lock()
+    issued = 0
+    issued_lock = threading.Lock()
+    stop = threading.Event()
+    arrivals = queue.Queue()
+
+    def next_request():
+        """Reserve the next request slot, or None when the run is over"""
+        nonlocal issued
+        with issued_lock:
+            if stop.is_set() or (max_requests is not None and issued >= max_requests):
+                return None
+            issued += 1
+            return issued
+
+    def execute(client, rng, endpoint, request_number):
+        if endpoint == 'download':
+            with names_lock:
+                filename = rng.choice(download_names) if download_names else None
+            if filename is None:
+                endpoint = 'list'  # Nothing to download yet
+            else:
+                return endpoint, client.get(f'/download/{filename}')
+        if endpoint == 'list':
+            return endpoint, client.get('/list-comparisons')
+        return endpoint, client.upload(f'load_test_{request_number}.png', images[request_number % len(images)])
+
+    def record(endpoint, status, body, scheduled, error=None):
+        ok = error is None and status < 400 and (body is None or body.get('success', True) is not False)
+        sample = {'endpoint': endpoint, 'status': status, 'ok': ok,
+                  'latency': time.perf_counter() - scheduled}
+        if endpoint == 'upload' and ok:
+            with names_lock:
+                download_names.append(body['comparison_file'])
+                download_names.append(os.path.basename(body['quantum_result']['output_path']))
+        with samples_lock:
+            samples.append(sample)
+
+    def worker(index):
+        client = make_client()
+        rng = random.Random(seed * 1000 + index)
+        while True:
+            if rate is None:
+                request_number = next_request()
+                if request_number is None:
+                    return
+                scheduled, endpoint = time.perf_counter(), rng.choices(names, weights)[0]
+            else:
+                item = arrivals.get()
+                if item is None:
+                    return
+                scheduled, endpoint, request_number = item
+            try:
+                endpoint, (status, body) = execute(client, rng, endpoint, request_number)
+                record(endpoint, status, body, scheduled)
+            except Exception as e:
+                record(endpoint, 0, None, scheduled, error=e)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+
+    if rate is not None:
+        rng = random.Random(seed)
+        scheduled = start
+        while True:
+            scheduled += rng.expovariate(rate)
+            if scheduled - start > duration:
+                break
+            request_number = next_request()
+            if request_number is None:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            arrivals.put((scheduled, rng.choices(names, weights)[0], request_number))
+        for _ in threads:
+            arrivals.put(None)
+    else:
+        while time.perf_counter() - start < duration and any(thread.is_alive() for thread in threads):
+            time.sleep(0.05)
+        stop.set()
+
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    endpoints = {name: summarize([s for s in samples if s['endpoint'] == name], elapsed)
+                 for name in ENDPOINTS if any(s['endpoint'] == name for s in samples)}
+    return {
+        'config': {
+            'target': url or 'wsgi',
+            'concurrency': concurrency,
+            'rate': rate,
+            'duration': duration,
+            'max_requests': max_requests,
+            'mix': mix,
+            'image_size': image_size,
+            'comparison_files': comparison_files if workdir is not None else 0,
+            'seed': seed
+        },
+        'elapsed_seconds': round(elapsed, 3),
+        'uploads_per_second': endpoints.get('upload', {}).get('successful_rps', 0.0),
+        'overall': summarize(samples, elapsed),
+        'endpoints': endpoints
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the quantum image processing endpoints")
+    parser.add_argument('--url', help="Base URL of a running server (default: drive the app in-process via WSGI)")
+    parser.add_argument('--workdir', help="Working directory for the in-process app (default: a temporary "
+                                          "directory); with --url, the server's directory to pre-populate")
+    parser.add_argument('--keep-workdir', action='store_true', help="Keep the temporary working directory")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--rate', type=float, help="Open-loop arrival rate in requests/second (default: closed loop)")
+    parser.add_argument('--duration', type=float, default=30.0, help="Seconds to generate load")
+    parser.add_argument('--requests', type=int, dest='max_requests', help="Stop after this many requests")
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX, help="Endpoint weights, e.g. upload=1,download=4,list=2")
+    parser.add_argument('--image-size', type=int, default=512, help="Side of the synthetic upload images")
+    parser.add_argument('--comparison-files', type=int, default=2000, help="Comparison files to pre-populate")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='load_test_results.json')
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    original_cwd = os.getcwd()
+    workdir = args.workdir
+    temporary = args.url is None and workdir is None
+    if temporary:
+        workdir = tempfile.mkdtemp(prefix='qmi_load_test_')
+    if args.url is None:
+        # The app resolves its directories against the working directory
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        os.makedirs(workdir, exist_ok=True)
+        os.chdir(workdir)
+
+    try:
+        report = run_load_test(url=args.url, workdir=workdir, concurrency=max(1, args.concurrency),
+                               rate=args.rate, duration=args.duration, max_requests=args.max_requests,
+                               mix=args.mix, image_size=args.image_size,
+                               comparison_files=args.comparison_files, seed=args.seed)
+    finally:
+        os.chdir(original_cwd)
+        if temporary and not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(json.dumps(report['overall'], indent=2, sort_keys=True))
+    print(f"Uploads/second: {report['uploads_per_second']}")
+    print(f"Report written to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+import sys
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+class BufferSet:
+    """Named arrays that are grown on demand and reused; contents are undefined on return"""
+    def __init__(self):
+        self._arrays = {}
+
+    def get(self, name, shape, dtype=np.uint8):
+        size = int(np.prod(shape))
+        key = (name, np.dtype(dtype).str)
+        flat = self._arrays.get(key)
+        if flat is None or flat.size < size:
+            flat = self._arrays[key] = np.empty(size, dtype=dtype)
+        return flat[:size].reshape(shape)
+
+    def nbytes(self):
+        return sum(array.nbytes for array in self._arrays.values())
+
+
+class BufferPool:
+    """Process-wide pool of BufferSets so calls in one worker reuse their allocations
+
+    Each caller checks out a set for the duration of a call, so concurrent
+    requests never share arrays; the pool holds at most as many sets as
+    there were concurrent callers.
+    """
+    def __init__(self):
+        self._free = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            return self._free.pop() if self._free else BufferSet()
+
+    def release(self, buffer_set):
+        with self._lock:
+            self._free.append(buffer_set)
+
+    @contextmanager
+    def checkout(self):
+        buffer_set = self.acquire()
+        try:
+            yield buffer_set
+        finally:
+            self.release(buffer_set)
+
+    def nbytes(self):
+        with self._lock:
+            return sum(buffer_set.nbytes() for buffer_set in self._free)
+
+
+_trackers = 0
+_trackers_lock = threading.Lock()
+_started_tracing = False
+
+
+def max_rss_bytes():
+    """Process high-water resident set size, including native allocations, or None"""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024  # Linux reports KiB
+
+
+@contextmanager
+def track_peak_memory():
+    """Trace Python and NumPy allocations for the duration of the block
+
+    Yields a dict that is filled on exit with 'peak_traced_bytes' (peak
+    traced memory above the level at entry) and 'max_rss_bytes'. tracemalloc
+    is process-wide, so with several requests traced at once each figure is
+    an upper bound. Native allocations (e.g. inside the Aer simulator) are
+    not traced but are included in max_rss_bytes.
+    """
+    global _trackers, _started_tracing
+    with _trackers_lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_tracing = True
+        if _trackers == 0:
+            tracemalloc.reset_peak()
+        _trackers += 1
+        baseline, _ = tracemalloc.get_traced_memory()
+
+    report = {}
+    try:
+        yield report
+    finally:
+        with _trackers_lock:
+            _, peak = tracemalloc.get_traced_memory()
+            _trackers -= 1
+            if _trackers == 0 and _started_tracing:
+                tracemalloc.stop()
+                _started_tracing = False
+        report['peak_traced_bytes'] = max(0, peak - baseline)
+        report['max_rss_bytes'] = max_rss_bytes()
+
+
+# Make functions available for import
+__all__ = ['BufferPool', 'BufferSet', 'track_peak_memory', 'max_rss_bytes']
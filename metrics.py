@@ -0,0 +1,216 @@
+import bisect
+import os
+import threading
+import time
+
+# Latency buckets in seconds shared by the duration histograms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+BYTE_BUCKETS = tuple(2 ** power for power in range(20, 34))  # 1 MiB to 8 GiB
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(label_names, label_values, extra=()):
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Metric:
+    """Base for registered metrics; values are kept per tuple of label values"""
+    metric_type = 'untyped'
+    additive = False  # Whether values from several processes can be summed (see merge_deltas)
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def take(self):
+        """Return the values recorded so far and reset them"""
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def render(self, extra=()):
+        """Exposition lines; extra (name, value) label pairs are added to every series"""
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.metric_type}']
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(self.label_names, key, extra)} {_format_value(value)}')
+        return lines
+
+
+class Counter(Metric):
+    metric_type = 'counter'
+    additive = True
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def merge(self, values):
+        """Add values taken from the same counter in another process"""
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = self._values.get(key, 0) + value
+
+
+class Gauge(Metric):
+    """Gauge set explicitly, or computed at scrape time when a callback is given"""
+    metric_type = 'gauge'
+
+    def __init__(self, name, documentation, label_names=(), callback=None):
+        super().__init__(name, documentation, label_names)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self, extra=()):
+        if self.callback is not None:
+            try:
+                self.set(self.callback())
+            except Exception as e:
+                print(f"Error collecting metric {self.name}: {str(e)}")
+        return super().render(extra)
+
+
+class Histogram(Metric):
+    metric_type = 'histogram'
+    additive = True
+
+    def __init__(self, name, documentation, label_names=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def merge(self, values):
+        """Add values taken from the same histogram in another process"""
+        with self._lock:
+            for key, (bucket_counts, total, count) in values.items():
+                state = self._values.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0, 0])
+                state[0] = [a + b for a, b in zip(state[0], bucket_counts)]
+                state[1] += total
+                state[2] += count
+
+    def render(self, extra=()):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.metric_type}']
+        with self._lock:
+            items = sorted((key, ([*state[0]], state[1], state[2])) for key, state in self._values.items())
+        for key, (bucket_counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names, key, (*extra, ('le', _format_value(bound))))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.label_names, key, extra)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+def render_metrics():
+    """All registered metrics in the Prometheus text exposition format
+
+    Every series carries a pid label. With serve.py each scrape reaches one
+    worker; the label keeps the workers' series apart so they can be summed
+    (e.g. sum without (pid)) instead of overwriting one another.
+    """
+    extra = (('pid', os.getpid()),)
+    lines = []
+    for metric in list(_registry):
+        lines.extend(metric.render(extra))
+    return '\n'.join(lines) + '\n'
+
+
+def take_deltas():
+    """Counter and histogram values recorded since the last call, by metric name, resetting them
+
+    For processes that are never scraped, such as shm_transport workers, to
+    hand their metrics to one that is (see merge_deltas).
+    """
+    return {metric.name: metric.take() for metric in list(_registry) if metric.additive}
+
+
+def merge_deltas(deltas):
+    """Add values from take_deltas in another process to this process's metrics"""
+    metrics = {metric.name: metric for metric in list(_registry) if metric.additive}
+    for name, values in deltas.items():
+        if name in metrics:
+            metrics[name].merge(values)
+
+
+# Metrics are kept per process and labelled with its pid
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'HTTP request latency by route',
+                            ('route', 'method', 'status'))
+REQUESTS_IN_FLIGHT = Gauge('http_requests_in_flight', 'HTTP requests currently being handled')
+STAGE_SECONDS = Histogram('pipeline_stage_duration_seconds', 'Duration of each processing pipeline stage',
+                          ('stage',))
+SIMULATION_SECONDS = Histogram('quantum_simulation_duration_seconds', 'Simulator execution time',
+                               ('kind',))
+IMAGES_PROCESSED = Counter('images_processed_total', 'Images processed, by pipeline', ('pipeline',))
+ANOMALY_CANDIDATES = Histogram('anomaly_candidates', 'Anomaly candidates per image before de-duplication',
+                               ('source',), buckets=COUNT_BUCKETS)
+PEAK_TRACED_BYTES = Histogram('pipeline_peak_traced_bytes', 'Peak traced memory per processed upload',
+                              buckets=BYTE_BUCKETS)
+CACHE_REQUESTS = Counter('cache_requests_total', 'Cache lookups by cache and result (hit or miss)',
+                         ('cache', 'result'))
+
+
+def record_stage(stage, start):
+    """Observe the time since start for a pipeline stage and return a new start time"""
+    now = time.perf_counter()
+    STAGE_SECONDS.observe(now - start, stage=stage)
+    return now
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+# Make functions available for import
+__all__ = ['Counter', 'Gauge', 'Histogram', 'render_metrics', 'take_deltas', 'merge_deltas',
+           'record_stage', 'record_cache',
+           'REQUEST_SECONDS', 'REQUESTS_IN_FLIGHT', 'STAGE_SECONDS', 'SIMULATION_SECONDS',
+           'IMAGES_PROCESSED', 'ANOMALY_CANDIDATES', 'PEAK_TRACED_BYTES', 'CACHE_REQUESTS']
@@ -0,0 +1,315 @@
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import cv2
+
+from quantum_processing import (
+    CLASSICAL_SCALES, SAMPLE_RATE, LOCAL_RADIUS, SEVERITY_CUTOFF, DEDUP_RADIUS, QUANTUM_SIGMA,
+    DEFAULT_QUBITS, DEFAULT_SHOTS, PATCH_SHOTS, resize_for_quantum, quantum_feature_extraction,
+    quantum_patch_feature_map, quantum_anomalies, deduplicate_locations, check_quantum_mode
+)
+
+# process_image reports this many of the strongest anomalies
+REPORTED_ANOMALIES = 10
+
+IMAGE_SUFFIXES = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+
+
+def local_severity_map(scaled_image, radius=LOCAL_RADIUS):
+    """local_severity for every pixel at once
+
+    The standard deviation comes from box-filtered sums over the window
+    (zero-padded, divided by the number of pixels inside the image) and the
+    contrast from a max/min filter, so windows are clipped at the borders
+    exactly as in process_image.
+    """
+    ksize = (2 * radius + 1, 2 * radius + 1)
+    values = scaled_image.astype(np.float64)
+    count = cv2.boxFilter(np.ones_like(values), -1, ksize, normalize=False, borderType=cv2.BORDER_CONSTANT)
+    mean = cv2.boxFilter(values, -1, ksize, normalize=False, borderType=cv2.BORDER_CONSTANT) / count
+    mean_square = cv2.boxFilter(values * values, -1, ksize, normalize=False, borderType=cv2.BORDER_CONSTANT) / count
+    local_std = np.sqrt(np.maximum(mean_square - mean * mean, 0))
+
+    # Pixels outside the image are ignored by dilate and erode
+    kernel = np.ones(ksize, np.uint8)
+    local_contrast = (cv2.dilate(scaled_image, kernel).astype(np.float64) - cv2.erode(scaled_image, kernel)) / 255.0
+    return (local_std * local_contrast) / 255.0
+
+
+def format_scales(scales):
+    """[(1.0, 100, 200), ...] -> '1.0:100:200,...'"""
+    return ','.join(f'{factor}:{low:g}:{high:g}' for factor, low, high in scales)
+
+
+def parse_scales(text):
+    """'1.0:100:200,0.5:50:100' -> [(1.0, 100.0, 200.0), (0.5, 50.0, 100.0)]"""
+    scales = []
+    for part in text.split(','):
+        factor, low, high = (float(value) for value in part.split(':'))
+        scales.append((factor, low, high))
+    return scales
+
+
+class PreparedImage:
+    """The parameter-independent intermediates of one image, for evaluating many detector settings
+
+    Decoding, resizing and the quantum simulation are done once here. Each
+    classical scale is resized, adaptively thresholded, sampled and scored
+    (see local_severity_map) the first time it is used, and Canny edges are
+    computed once per (scale, low, high).
+
+    process_image samples candidate points at random on every call. Here each
+    scale has a fixed random field, seeded by seed and the scale factor, so
+    every setting is scored on the same sample and differences between
+    settings come from the parameters alone.
+    """
+    def __init__(self, image, name='', n_qubits=DEFAULT_QUBITS, shots=DEFAULT_SHOTS, quantum_mode='global',
+                 patch_size=2, seed=0):
+        if image.ndim != 2 or image.dtype != np.uint8:
+            raise ValueError('Expected a 2D 8-bit grayscale image')
+        check_quantum_mode(quantum_mode)
+        self.name = name
+        self.shape = image.shape
+        self.patch_size = patch_size
+        self.seed = seed
+        self._image = image
+
+        image_resized, self.scale, _ = resize_for_quantum(image)
+        image_normalized = image_resized.astype(float) / 255.0
+        self.quantum_features, _, _ = quantum_feature_extraction(image_normalized.flatten(), n_qubits=n_qubits,
+                                                                 shots=shots)
+        self.quantum_feature_map = None
+        if quantum_mode == 'patch':
+            self.quantum_feature_map = quantum_patch_feature_map(image_normalized, patch_size=patch_size,
+                                                                 shots=PATCH_SHOTS)
+
+        self._scales = {}
+        self._classical = {}
+        self._quantum = {}
+
+    @classmethod
+    def from_file(cls, image_path, **options):
+        image = cv2.imread(image_path, cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError(f'Failed to load image: {image_path}')
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return cls(image, name=os.path.basename(image_path), **options)
+
+    def _scale(self, scale_factor):
+        """(scaled image, rows, cols, severities) of the sampled points that pass the adaptive threshold"""
+        prepared = self._scales.get(scale_factor)
+        if prepared is None:
+            scaled_image = cv2.resize(self._image, None, fx=scale_factor, fy=scale_factor)
+            thresh = cv2.adaptiveThreshold(scaled_image, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                           cv2.THRESH_BINARY, 11, 2)
+            rng = np.random.default_rng([self.seed, int(round(scale_factor * 1000))])
+            sampled = rng.random(scaled_image.shape, dtype=np.float32) < SAMPLE_RATE
+            rows, cols = np.nonzero(sampled & (thresh > 0))
+            severity = local_severity_map(scaled_image)[rows, cols]
+            prepared = self._scales[scale_factor] = (scaled_image, rows, cols, severity)
+        return prepared
+
+    def classical_candidates(self, scale_factor, low_threshold, high_threshold):
+        """(x, y, severity) arrays of the sampled edge points at one scale, located in original pixels"""
+        key = (scale_factor, low_threshold, high_threshold)
+        candidates = self._classical.get(key)
+        if candidates is None:
+            scaled_image, rows, cols, severity = self._scale(scale_factor)
+            on_edge = cv2.Canny(scaled_image, low_threshold, high_threshold)[rows, cols] > 0
+            candidates = self._classical[key] = ((cols[on_edge] / scale_factor).astype(int),
+                                                 (rows[on_edge] / scale_factor).astype(int),
+                                                 severity[on_edge])
+        return candidates
+
+    def quantum_candidates(self, sigma):
+        """(x, y, severity, located) arrays of the quantum anomalies at a threshold of sigma standard deviations
+
+        Global quantum anomalies have no location; they are marked False in
+        located and their x and y are -1.
+        """
+        candidates = self._quantum.get(sigma)
+        if candidates is None:
+            anomalies = quantum_anomalies(self.quantum_features, self.quantum_feature_map, self.shape, self.scale,
+                                          patch_size=self.patch_size, sigma=sigma)
+            candidates = self._quantum[sigma] = (
+                np.array([a['location'][0] if 'location' in a else -1 for a in anomalies], dtype=int),
+                np.array([a['location'][1] if 'location' in a else -1 for a in anomalies], dtype=int),
+                np.array([a['severity'] for a in anomalies], dtype=np.float64),
+                np.array(['location' in a for a in anomalies], dtype=bool)
+            )
+        return candidates
+
+    def evaluate(self, scales=CLASSICAL_SCALES, severity_cutoff=SEVERITY_CUTOFF, dedup_radius=DEDUP_RADIUS,
+                 quantum_sigma=QUANTUM_SIGMA):
+        """Anomaly counts and severities for one detector setting
+
+        Candidates are merged, sorted by severity and deduplicated as in
+        process_image (candidates without a location are all kept).
+        """
+        parts = [self.quantum_candidates(quantum_sigma)]
+        for scale_factor, low_threshold, high_threshold in scales:
+            x, y, severity = self.classical_candidates(scale_factor, low_threshold, high_threshold)
+            strong = severity > severity_cutoff
+            parts.append((x[strong], y[strong], severity[strong], np.ones(np.count_nonzero(strong), dtype=bool)))
+
+        xs, ys, severities, located = (np.concatenate(values) for values in zip(*parts))
+        order = np.argsort(-severities, kind='stable')
+        spatial = order[located[order]]
+        kept_spatial = spatial[deduplicate_locations(list(zip(xs[spatial].tolist(), ys[spatial].tolist())),
+                                                     dedup_radius)]
+        kept = order[~located[order] | np.isin(order, kept_spatial)]
+        kept_severities = severities[kept]
+        reported = kept_severities[:REPORTED_ANOMALIES]
+        return {
+            'quantum_candidates': len(parts[0][0]),
+            'classical_candidates': len(xs) - len(parts[0][0]),
+            'anomalies': len(kept),
+            'reported_anomalies': len(reported),
+            'max_severity': float(kept_severities[0]) if len(kept) else 0.0,
+            'mean_severity': float(np.mean(kept_severities)) if len(kept) else 0.0,
+            'mean_reported_severity': float(np.mean(reported)) if len(reported) else 0.0
+        }
+
+
+def parameter_grid(scale_sets=None, severity_cutoffs=None, dedup_radii=None, quantum_sigmas=None):
+    """Every combination of the detector parameters, as keyword arguments for PreparedImage.evaluate"""
+    scale_sets = [CLASSICAL_SCALES] if not scale_sets else scale_sets
+    severity_cutoffs = [SEVERITY_CUTOFF] if not severity_cutoffs else severity_cutoffs
+    dedup_radii = [DEDUP_RADIUS] if not dedup_radii else dedup_radii
+    quantum_sigmas = [QUANTUM_SIGMA] if not quantum_sigmas else quantum_sigmas
+    return [{'scales': scales, 'severity_cutoff': cutoff, 'dedup_radius': radius, 'quantum_sigma': sigma}
+            for scales, cutoff, radius, sigma in itertools.product(scale_sets, severity_cutoffs, dedup_radii,
+                                                                   quantum_sigmas)]
+
+
+def setting_label(setting):
+    return {**setting, 'scales': format_scales(setting['scales'])}
+
+
+def sweep_image(prepared, grid):
+    """One row per setting for a PreparedImage"""
+    return [{'image': prepared.name, **setting_label(setting), **prepared.evaluate(**setting)} for setting in grid]
+
+
+def sweep(sources, grid, progress=None, **prepare_options):
+    """Evaluate the grid on each image and return one row per (image, setting)
+
+    Each image is prepared once and released before the next is loaded.
+    prepare_options are passed to PreparedImage (n_qubits, shots,
+    quantum_mode, patch_size, seed). progress, if given, is called with
+    (name, prepare_seconds, evaluate_seconds) after each image.
+    """
+    rows = []
+    for source in sources:
+        start = time.perf_counter()
+        prepared = PreparedImage.from_file(source, **prepare_options)
+        prepared_at = time.perf_counter()
+        rows.extend(sweep_image(prepared, grid))
+        if progress is not None:
+            progress(prepared.name, prepared_at - start, time.perf_counter() - prepared_at)
+    return rows
+
+
+def summarize_sweep(rows):
+    """Aggregate per-image rows into one row per setting, in grid order"""
+    settings = {}
+    for row in rows:
+        key = (row['scales'], row['severity_cutoff'], row['dedup_radius'], row['quantum_sigma'])
+        settings.setdefault(key, []).append(row)
+
+    summary = []
+    for (scales, cutoff, radius, sigma), setting_rows in settings.items():
+        anomalies = np.array([row['anomalies'] for row in setting_rows])
+        total = int(anomalies.sum())
+        summary.append({
+            'scales': scales,
+            'severity_cutoff': cutoff,
+            'dedup_radius': radius,
+            'quantum_sigma': sigma,
+            'images': len(setting_rows),
+            'images_with_anomalies': int(np.count_nonzero(anomalies)),
+            'total_anomalies': total,
+            'mean_anomalies': float(anomalies.mean()),
+            'mean_quantum_candidates': float(np.mean([row['quantum_candidates'] for row in setting_rows])),
+            'mean_classical_candidates': float(np.mean([row['classical_candidates'] for row in setting_rows])),
+            'max_severity': max(row['max_severity'] for row in setting_rows),
+            'mean_severity': sum(row['mean_severity'] * row['anomalies'] for row in setting_rows) / total
+            if total else 0.0
+        })
+    return summary
+
+
+def write_table(rows, path):
+    """Write rows as CSV, or as JSON if path ends in .json"""
+    with open(path, 'w', newline='') as f:
+        if path.lower().endswith('.json'):
+            json.dump(rows, f, indent=2)
+        elif rows:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def image_files(paths):
+    """The given image files, with directories expanded to the images they contain"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                if name.lower().endswith(IMAGE_SUFFIXES)))
+        else:
+            files.append(path)
+    return files
+
+
+def parse_floats(text):
+    return [float(value) for value in text.split(',')]
+
+
+# Make functions available for import
+__all__ = ['PreparedImage', 'parameter_grid', 'sweep', 'sweep_image', 'summarize_sweep', 'local_severity_map',
+           'format_scales', 'parse_scales', 'write_table']
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Evaluate a grid of anomaly detector parameters on a set of images")
+    parser.add_argument('images', nargs='+', help="Image files or directories of images")
+    parser.add_argument('--scales', type=parse_scales, action='append',
+                        help="Classical scales as factor:low:high,... (repeat for several sets)")
+    parser.add_argument('--canny-multipliers', type=parse_floats,
+                        help="Also sweep the default Canny thresholds scaled by each of these factors")
+    parser.add_argument('--severity', type=parse_floats, help="Severity cutoffs, e.g. 0.05,0.1,0.15")
+    parser.add_argument('--radius', type=parse_floats, help="Deduplication radii in pixels, e.g. 3,5,10")
+    parser.add_argument('--sigma', type=parse_floats, help="Quantum threshold sigmas, e.g. 1.5,2,2.5")
+    parser.add_argument('--quantum-mode', choices=('global', 'patch'), default='global')
+    parser.add_argument('--n-qubits', type=int, default=DEFAULT_QUBITS)
+    parser.add_argument('--shots', type=int, default=DEFAULT_SHOTS)
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the fixed point-sampling fields")
+    parser.add_argument('--output', default='parameter_sweep.csv', help="Per-setting summary (.csv or .json)")
+    parser.add_argument('--per-image', help="Also write the per-image rows to this file (.csv or .json)")
+    args = parser.parse_args()
+
+    scale_sets = list(args.scales or [])
+    for multiplier in args.canny_multipliers or []:
+        scale_sets.append([(factor, low * multiplier, high * multiplier) for factor, low, high in CLASSICAL_SCALES])
+    grid = parameter_grid(scale_sets, args.severity, args.radius, args.sigma)
+    sources = image_files(args.images)
+    print(f"{len(sources)} images x {len(grid)} settings", file=sys.stderr)
+
+    def report_progress(name, prepare_seconds, evaluate_seconds):
+        print(f"{name}: prepared in {prepare_seconds:.2f}s, {len(grid)} settings in {evaluate_seconds:.2f}s",
+              file=sys.stderr)
+
+    rows = sweep(sources, grid, progress=report_progress, n_qubits=args.n_qubits, shots=args.shots,
+                 quantum_mode=args.quantum_mode, seed=args.seed)
+    summary = summarize_sweep(rows)
+    write_table(summary, args.output)
+    if args.per_image:
+        write_table(rows, args.per_image)
+    print(f"Summary of {len(summary)} settings written to {args.output}")
@@ -1,12 +1,14 @@
 import os
 import quantum_processing as qp
 import cv2
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
-import matplotlib.pyplot as plt
 
 def process_uploaded_image(image_path):
     """Process a single uploaded image and display results"""
+    # Deferred so the CLI only pays for matplotlib when it actually plots
+    import matplotlib
+    matplotlib.use('Agg')  # Use non-interactive backend
+    import matplotlib.pyplot as plt
+    
     # Create all necessary directories
     for directory in ['processed_images', 'results', 'comparison_results']:
         os.makedirs(directory, exist_ok=True)
@@ -67,12 +69,20 @@ def process_uploaded_image(image_path):
     for i, anomaly in enumerate(quantum_result['anomalies'], 1):
         print(f"\nAnomaly {i}:")
         print(f"Type: {anomaly['type']}")
-        print(f"Location: {anomaly['location']}")
+        if 'location' in anomaly:
+            print(f"Location: {anomaly['location']}")
+        else:
+            print(f"Feature index: {anomaly['feature_index']}")
         print(f"Severity: {anomaly['severity']:.3f}")
 
 if __name__ == "__main__":
     # Get the image path from command line argument or use default
     import sys
+    if '--import-profile' in sys.argv:
+        from lazy_imports import print_import_profile
+        print_import_profile('process_upload')
+        sys.exit(0)
+    
     if len(sys.argv) > 1:
         image_path = sys.argv[1]
     else:
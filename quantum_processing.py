@@ -1,16 +1,91 @@
 import numpy as np
 import cv2
-from qiskit import QuantumCircuit
-from qiskit_aer import AerSimulator
-from PIL import Image
 import os
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from datetime import datetime
+from metrics import record_stage, SIMULATION_SECONDS, IMAGES_PROCESSED, ANOMALY_CANDIDATES
+from memory_usage import BufferPool
+from feature_cache import feature_cache, patch_cache, quantize, backend_key
 
-def quantum_feature_extraction(image_data, n_qubits=8):
-    """Enhanced quantum feature extraction with improved circuit design"""
-    # Normalize image data
-    normalized_data = (image_data - np.min(image_data)) / (np.max(image_data) - np.min(image_data))
+# Circuit settings used when no latency budget or explicit values are given
+DEFAULT_QUBITS = 10
+DEFAULT_SHOTS = 8192
+
+# Feature vectors returned for similarity search always come from this many
+# qubits, so scans processed at different latency budgets stay comparable
+FEATURE_VECTOR_QUBITS = DEFAULT_QUBITS
+
+# Shots per patch circuit in patch mode
+PATCH_SHOTS = 1024
+
+# 'global': one circuit on the downsampled image; 'patch': one circuit per image patch
+QUANTUM_MODES = ('global', 'patch')
+
+# (scale factor, Canny low threshold, Canny high threshold) for classical detection
+CLASSICAL_SCALES = [(1.0, 100, 200), (0.5, 50, 100), (2.0, 200, 400)]
+
+# Fraction of classical candidate points that are scored, half-size of the
+# window their local statistics are taken over, and the severity they must exceed
+SAMPLE_RATE = 0.05
+LOCAL_RADIUS = 5
+SEVERITY_CUTOFF = 0.1
+
+# Anomalies closer than this (in original pixels) to a more severe one are dropped
+DEDUP_RADIUS = 5
+
+# Quantum anomalies lie this many standard deviations above the mean feature
+QUANTUM_SIGMA = 2
+
+# Longer side of the image the quantum circuits are built from
+QUANTUM_IMAGE_SIZE = 32
+
+# Simulator instance shared by all calls in this process, created on first use
+_simulator = None
+
+def get_simulator():
+    """Return the shared Aer simulator, importing qiskit_aer on first use"""
+    global _simulator
+    if _simulator is None:
+        from qiskit_aer import AerSimulator
+        _simulator = AerSimulator()
+    return _simulator
+
+# Scratch arrays reused across process_image calls in lean mode
+_buffer_pool = BufferPool()
+
+# Thread pool shared by the concurrent pipeline stages in this process, created on first use
+_stage_executor = None
+_stage_executor_lock = threading.Lock()
+
+def get_stage_executor():
+    """Return the shared stage thread pool, sized by QMI_STAGE_WORKERS (default: CPU count, at most 8)
+
+    OpenCV and Aer release the GIL, so stages submitted here run in parallel.
+    Only request threads may wait on its futures; tasks on the pool must not.
+    """
+    global _stage_executor
+    with _stage_executor_lock:
+        if _stage_executor is None:
+            workers = int(os.environ.get('QMI_STAGE_WORKERS', 0)) or min(8, os.cpu_count() or 2)
+            _stage_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pipeline-stage')
+    return _stage_executor
+
+class DeadlineExceeded(Exception):
+    """Raised between pipeline stages once a request's processing deadline has passed"""
+    pass
+
+def check_deadline(deadline, stage):
+    """Abort processing if the monotonic-clock deadline has passed"""
+    if deadline is not None and time.monotonic() > deadline:
+        raise DeadlineExceeded(f'Processing deadline exceeded before {stage}')
+
+def build_feature_circuit(normalized_data, n_qubits):
+    """Feature-extraction circuit encoding normalized values (floats or circuit parameters)"""
+    from qiskit import QuantumCircuit
     
     # Create quantum circuit with more qubits for better feature representation
     qc = QuantumCircuit(n_qubits, n_qubits)
@@ -52,16 +127,44 @@ def quantum_feature_extraction(image_data, n_qubits=8):
     for i in range(n_qubits):
         qc.measure(i, i)
     
-    # Execute circuit with increased shots for better accuracy
-    backend = AerSimulator()
-    result = backend.run(qc, shots=8192).result()
-    counts = result.get_counts()
-    
-    # Enhanced feature extraction with normalization
+    return qc
+
+def counts_to_distribution(counts, n_qubits):
+    """Convert measurement counts to a normalized 2**n_qubits probability vector"""
     features = np.zeros(2**n_qubits)
     total_counts = sum(counts.values())
     for state, count in counts.items():
         features[int(state, 2)] = count / total_counts
+    return features
+
+def quantum_feature_extraction(image_data, n_qubits=8, shots=8192):
+    """Enhanced quantum feature extraction with improved circuit design
+    
+    The circuit only reads the first n_qubits + 1 normalized values. Those are
+    quantized (see feature_cache) and, with n_qubits, shots and the backend,
+    key an LRU memo, so images that bind the same angles share one simulation.
+    """
+    # Normalize image data
+    normalized_data = (image_data - np.min(image_data)) / (np.max(image_data) - np.min(image_data))
+    
+    # Only these values are bound into the circuit's rotation angles
+    circuit_inputs = quantize(normalized_data[:n_qubits + 1])
+    backend = get_simulator()
+    cache_key = (backend_key(backend), n_qubits, shots, circuit_inputs.tobytes())
+    cached = feature_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    qc = build_feature_circuit(circuit_inputs, n_qubits)
+    
+    # Execute circuit with increased shots for better accuracy
+    simulation_start = time.perf_counter()
+    result = backend.run(qc, shots=shots).result()
+    SIMULATION_SECONDS.observe(time.perf_counter() - simulation_start, kind='global')
+    counts = result.get_counts()
+    
+    # Enhanced feature extraction with normalization
+    features = counts_to_distribution(counts, n_qubits)
     
     # Calculate quantum entropy and additional quantum metrics
     quantum_entropy = -np.sum(features * np.log2(features + 1e-10))
@@ -71,131 +174,431 @@ def quantum_feature_extraction(image_data, n_qubits=8):
     feature_std = np.std(features)
     quantum_contrast = feature_std / (feature_mean + 1e-10)
     
-    return features, quantum_entropy, quantum_contrast
+    # Cached results are shared between callers, so they must not be modified
+    features.setflags(write=False)
+    result = (features, quantum_entropy, quantum_contrast)
+    feature_cache.put(cache_key, result)
+    return result
+
+def quantum_patch_feature_map(image_normalized, patch_size=2, shots=1024):
+    """Spatial quantum feature map: one circuit instance per image patch
+    
+    The image (values in [0, 1]) is tiled into patch_size x patch_size patches
+    and every pixel of a patch is bound into its own circuit on
+    patch_size**2 qubits. All patches are evaluated in a single batched
+    simulator call by binding one parameterized circuit to every patch.
+    Returns a (rows, cols) map of per-patch quantum entropy, normalized to [0, 1].
+    
+    Patch values are quantized like the global circuit inputs. Each distinct
+    patch is simulated once, and only if its entropy is not already memoized.
+    """
+    from qiskit.circuit import ParameterVector
+    
+    # Pad to whole patches by repeating the border pixels
+    h, w = image_normalized.shape
+    rows, cols = -(-h // patch_size), -(-w // patch_size)
+    padded = np.pad(image_normalized, ((0, rows * patch_size - h), (0, cols * patch_size - w)), mode='edge')
+    patches = padded.reshape(rows, patch_size, cols, patch_size).swapaxes(1, 2).reshape(rows * cols, -1)
+    
+    n_qubits = patch_size * patch_size
+    backend = get_simulator()
+    
+    # Group identical patches, then look each distinct one up in the memo
+    patches = quantize(patches)
+    patch_indices = {}
+    for index, patch in enumerate(patches):
+        patch_indices.setdefault(patch.tobytes(), []).append(index)
+    
+    entropy = np.empty(len(patches))
+    missing = []
+    for patch_key, indices in patch_indices.items():
+        cache_key = (backend_key(backend), n_qubits, shots, patch_key)
+        cached = patch_cache.get(cache_key)
+        if cached is None:
+            missing.append((cache_key, indices))
+        else:
+            entropy[indices] = cached
+    
+    if missing:
+        unique_patches = patches[[indices[0] for _, indices in missing]]
+        angles = ParameterVector('x', n_qubits)
+        qc = build_feature_circuit(angles, n_qubits)
+        
+        simulation_start = time.perf_counter()
+        result = backend.run(qc, shots=shots,
+                             parameter_binds=[{angles[j]: unique_patches[:, j].tolist() for j in range(n_qubits)}]).result()
+        SIMULATION_SECONDS.observe(time.perf_counter() - simulation_start, kind='patch')
+        counts = result.get_counts()
+        if isinstance(counts, dict):  # A single patch returns one dict rather than a list
+            counts = [counts]
+        
+        distributions = np.array([counts_to_distribution(c, n_qubits) for c in counts])
+        unique_entropy = -np.sum(distributions * np.log2(distributions + 1e-10), axis=1) / n_qubits
+        for (cache_key, indices), value in zip(missing, unique_entropy):
+            entropy[indices] = value
+            patch_cache.put(cache_key, float(value))
+    return entropy.reshape(rows, cols)
+
+def detect_scale_candidates(image, scale_factor, low_threshold, high_threshold, deadline=None, buffers=None):
+    """Edge and adaptive-threshold candidate points at one scale
+
+    Returns (scaled_image, points) with points as given by np.where.
+    With a BufferSet the intermediate images are written into its reusable
+    arrays and the points are int32; the returned arrays are only valid
+    until the next call with the same buffers.
+    """
+    check_deadline(deadline, f'classical detection at scale {scale_factor}')
+    if buffers is not None:
+        return _detect_scale_candidates_lean(image, scale_factor, low_threshold, high_threshold, buffers)
+    scaled_image = cv2.resize(image, None, fx=scale_factor, fy=scale_factor)
+    edges = cv2.Canny(scaled_image, low_threshold, high_threshold)
+    
+    # Use adaptive thresholding
+    thresh = cv2.adaptiveThreshold(scaled_image, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
+                                 cv2.THRESH_BINARY, 11, 2)
+    
+    # Combine edge and threshold detection
+    combined = cv2.bitwise_and(edges, thresh)
+    return scaled_image, np.where(combined > 0)
+
+def _detect_scale_candidates_lean(image, scale_factor, low_threshold, high_threshold, buffers):
+    if scale_factor == 1.0:
+        scaled_image = image  # resize would only copy it
+    else:
+        h, w = image.shape
+        # Same rounding as cv2.resize uses for the output size
+        scaled_shape = (int(np.rint(h * scale_factor)), int(np.rint(w * scale_factor)))
+        scaled_image = cv2.resize(image, None, dst=buffers.get('scaled', scaled_shape),
+                                  fx=scale_factor, fy=scale_factor)
+    edges = cv2.Canny(scaled_image, low_threshold, high_threshold,
+                      edges=buffers.get('edges', scaled_image.shape))
+    thresh = cv2.adaptiveThreshold(scaled_image, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                   cv2.THRESH_BINARY, 11, 2, dst=buffers.get('thresh', scaled_image.shape))
+    combined = cv2.bitwise_and(edges, thresh, dst=edges)
+    
+    # findNonZero scans in the same row-major order as np.where
+    points = cv2.findNonZero(combined)
+    if points is None:
+        return scaled_image, (np.empty(0, np.int32), np.empty(0, np.int32))
+    return scaled_image, (points[:, 0, 1], points[:, 0, 0])
+
+def resize_for_quantum(image, max_size=QUANTUM_IMAGE_SIZE):
+    """Downsample so the longer side is max_size; returns (image_resized, scale, new_size)"""
+    h, w = image.shape
+    scale = max_size / max(h, w)
+    new_size = (int(w * scale), int(h * scale))
+    return cv2.resize(image, new_size, interpolation=cv2.INTER_AREA), scale, new_size
+
+def quantum_anomalies(quantum_features, quantum_feature_map, image_shape, scale, patch_size=2, sigma=QUANTUM_SIGMA):
+    """Anomalies where the quantum features lie more than sigma standard deviations above their mean
+
+    With a patch feature map (patch mode) the outlying patches are located at
+    their centres in original image pixels. Otherwise the features are a
+    histogram over measurement outcomes with no place in the image, so each
+    outlying bin is reported by its feature_index and has no location.
+    """
+    h, w = image_shape
+    anomalies = []
+    if quantum_feature_map is not None:
+        patch_threshold = np.mean(quantum_feature_map) + sigma * np.std(quantum_feature_map)
+        
+        # Map each outlying patch centre back to original image pixels
+        for row, col in zip(*np.where(quantum_feature_map > patch_threshold)):
+            anomalies.append({
+                'type': 'quantum_patch_anomaly',
+                'location': [int(min(w - 1, (col + 0.5) * patch_size / scale)),
+                             int(min(h - 1, (row + 0.5) * patch_size / scale))],
+                'severity': float((quantum_feature_map[row, col] - patch_threshold) / patch_threshold)
+            })
+    else:
+        mean_feature = np.mean(quantum_features)
+        std_feature = np.std(quantum_features)
+        quantum_threshold = mean_feature + sigma * std_feature  # Dynamic threshold
+        
+        for i in range(len(quantum_features)):
+            if quantum_features[i] > quantum_threshold:
+                anomalies.append({
+                    'type': 'quantum_anomaly',
+                    'feature_index': i,
+                    'severity': (quantum_features[i] - quantum_threshold) / quantum_threshold
+                })
+    return anomalies
+
+def local_severity(scaled_image, x, y, radius=LOCAL_RADIUS):
+    """Local standard deviation times local contrast around (x, y), on a 0-1 scale"""
+    local_region = scaled_image[
+        max(0, y - radius):min(scaled_image.shape[0], y + radius + 1),
+        max(0, x - radius):min(scaled_image.shape[1], x + radius + 1)
+    ]
+    local_std = np.std(local_region)
+    local_contrast = (np.max(local_region) - np.min(local_region)) / 255.0
+    return (local_std * local_contrast) / 255.0
+
+def deduplicate_locations(locations, radius=DEDUP_RADIUS):
+    """Indices of the locations kept when each one closer than radius to an earlier kept one is dropped
+
+    Locations are visited in order, so sort them by severity first. Kept
+    locations are bucketed on a radius-sized grid, so each is only compared
+    with those in the neighbouring cells.
+    """
+    if radius <= 0:
+        return list(range(len(locations)))
+    kept = []
+    cells = {}
+    limit = radius * radius
+    for index, (x, y) in enumerate(locations):
+        cell_x, cell_y = int(x // radius), int(y // radius)
+        is_duplicate = any((x - kept_x) ** 2 + (y - kept_y) ** 2 < limit
+                           for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+                           for kept_x, kept_y in cells.get((cell_x + dx, cell_y + dy), ()))
+        if not is_duplicate:
+            kept.append(index)
+            cells.setdefault((cell_x, cell_y), []).append((x, y))
+    return kept
+
+def check_quantum_mode(quantum_mode):
+    """Raise ValueError unless quantum_mode is one of QUANTUM_MODES"""
+    if quantum_mode not in QUANTUM_MODES:
+        raise ValueError(f"Unsupported quantum mode: {quantum_mode}. Use one of: {', '.join(QUANTUM_MODES)}")
+
+def _quantum_stage(image_normalized, n_qubits, shots, quantum_mode, patch_size, deadline):
+    """Quantum feature extraction, plus the patch feature map in patch mode"""
+    stage_start = time.perf_counter()
+    quantum_features, quantum_entropy, quantum_contrast = quantum_feature_extraction(
+        image_normalized.flatten(), n_qubits=n_qubits, shots=shots)
+    stage_start = record_stage('quantum_features', stage_start)
+    
+    quantum_feature_map = None
+    if quantum_mode == 'patch':
+        check_deadline(deadline, 'quantum patch feature map')
+        quantum_feature_map = quantum_patch_feature_map(image_normalized, patch_size=patch_size,
+                                                        shots=PATCH_SHOTS)
+        record_stage('quantum_patch_map', stage_start)
+    return quantum_features, quantum_entropy, quantum_contrast, quantum_feature_map
+
+def load_grayscale(image_path, lean=False):
+    """Decode an image file to a 2D uint8 grayscale array, raising ValueError if it cannot be used"""
+    # Verify file exists
+    if not os.path.exists(image_path):
+        raise ValueError(f'Image file not found: {image_path}')
+        
+    # Load and preprocess image with detailed error checking
+    image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE if lean else cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f'Failed to load image: {image_path}. Please ensure it is a valid image file.')
+        
+    # Convert to grayscale if image is in color
+    if len(image.shape) == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    
+    # Verify image dimensions
+    if image.size == 0:
+        raise ValueError('Image is empty')
+    return image
+
+def process_image(image_path, return_features=False, deadline=None, n_qubits=None, shots=None,
+                  latency_budget=None, quantum_mode='global', patch_size=2, parallel=False, lean=False):
+    """Enhanced image processing with improved quantum features and anomaly detection
+
+    With quantum_mode='patch' the resized image is also tiled into patches that
+    are evaluated as one batch of circuits (see quantum_patch_feature_map).
+    Quantum anomalies then come from that spatial map and are located in
+    original image pixels, and the map is returned as 'quantum_feature_map'.
 
-def process_image(image_path):
-    """Enhanced image processing with improved quantum features and anomaly detection"""
+    n_qubits and shots default to 10 and 8192. With latency_budget (seconds)
+    the largest qubit and shot counts predicted to fit the budget are chosen
+    by the calibrated cost model instead; explicit values still take precedence.
+
+    With parallel=True the quantum stage and the classical detection scales
+    run concurrently on the shared stage pool (see get_stage_executor) and
+    are joined before the anomalies are merged. Point sampling still happens
+    in scale order, so the result is the same as the sequential path.
+
+    lean=True keeps memory low for large scans: the image is decoded straight
+    to grayscale, statistics are computed without float64 copies, the scales
+    run one at a time in reused scratch buffers (even with parallel=True) and
+    the enhancement is done in place. Anomalies are unchanged; the quantum
+    stage works in float32, so its features can differ in the last digits.
+
+    With return_features=True the raw quantum feature distribution is included
+    as 'feature_vector' (a NumPy array) so callers can store it for similarity search.
+    It is always the FEATURE_VECTOR_QUBITS distribution; when another qubit
+    count was used, that circuit is simulated as well.
+    deadline is a time.monotonic() timestamp; processing stops between stages
+    once it has passed and the result carries 'deadline_exceeded': True.
+    An unsupported quantum_mode raises ValueError.
+    """
+    check_quantum_mode(quantum_mode)
     try:
-        # Verify file exists
-        if not os.path.exists(image_path):
-            return {'success': False, 'error': f'Image file not found: {image_path}'}
-            
-        # Load and preprocess image with detailed error checking
-        image = cv2.imread(image_path)
-        if image is None:
-            return {'success': False, 'error': f'Failed to load image: {image_path}. Please ensure it is a valid image file.'}
-            
-        # Convert to grayscale if image is in color
-        if len(image.shape) == 3:
-            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        
-        # Verify image dimensions
-        if image.size == 0:
-            return {'success': False, 'error': 'Image is empty'}
-            
+        stage_start = time.perf_counter()
+        image = load_grayscale(image_path, lean=lean)
+        record_stage('load', stage_start)
+    except ValueError as e:
+        return {'success': False, 'error': str(e)}
+    except Exception as e:
+        return {'success': False, 'error': f'Error processing image: {str(e)}'}
+    
+    return process_image_array(image, os.path.basename(image_path), return_features=return_features,
+                               deadline=deadline, n_qubits=n_qubits, shots=shots, latency_budget=latency_budget,
+                               quantum_mode=quantum_mode, patch_size=patch_size, parallel=parallel, lean=lean)
+
+def process_image_array(image, output_name, return_features=False, deadline=None, n_qubits=None, shots=None,
+                        latency_budget=None, quantum_mode='global', patch_size=2, parallel=False, lean=False,
+                        quantum_stage=None, return_quantum_stage=False, enhanced_out=None):
+    """process_image for an image that is already in memory (2D uint8 grayscale)
+
+    output_name ('<name>.<ext>') names the enhanced copy saved to
+    processed_images/. With lean=True the array is overwritten. If
+    enhanced_out (a uint8 array of the image's shape) is given, the enhanced
+    image is also written into it, e.g. into shared memory (see shm_transport).
+
+    With return_quantum_stage=True the result carries 'quantum_stage', the
+    quantum features of this image. Passing it back as quantum_stage for
+    another image of the same size and settings skips the simulation, e.g.
+    for near-identical neighbouring slices of a volume.
+    """
+    check_quantum_mode(quantum_mode)
+    if image.ndim != 2 or image.dtype != np.uint8:
+        return {'success': False, 'error': 'Expected a 2D 8-bit grayscale image'}
+    if image.size == 0:
+        return {'success': False, 'error': 'Image is empty'}
+    
+    buffers = _buffer_pool.acquire() if lean else None
+    try:
+        stage_start = time.perf_counter()
+        
         # Create output directories if they don't exist
         processed_dir = 'processed_images'
         os.makedirs(processed_dir, exist_ok=True)
         
         # Generate output path
-        base_name = os.path.basename(image_path)
-        name, ext = os.path.splitext(base_name)
+        name, ext = os.path.splitext(output_name)
         output_path = os.path.join(processed_dir, f"{name}_processed{ext}")
         
         # Resize for quantum processing while maintaining aspect ratio
-        max_size = 32
-        h, w = image.shape
-        scale = max_size / max(h, w)
-        new_size = (int(w * scale), int(h * scale))
-        image_resized = cv2.resize(image, new_size, interpolation=cv2.INTER_AREA)
+        image_resized, scale, _ = resize_for_quantum(image)
         
         # Normalize pixel values
-        image_normalized = image_resized.astype(float) / 255.0
+        if lean:
+            image_normalized = image_resized.astype(np.float32)
+            image_normalized *= np.float32(1 / 255.0)
+        else:
+            image_normalized = image_resized.astype(float) / 255.0
+        
+        # Choose the circuit size, adapting it to the latency budget if one is given
+        predicted_latency = None
+        if latency_budget is not None:
+            from cost_model import get_cost_model
+            budget_qubits, budget_shots, predicted_latency = get_cost_model().choose(latency_budget, image.size)
+            n_qubits = budget_qubits if n_qubits is None else n_qubits
+            shots = budget_shots if shots is None else shots
+        n_qubits = DEFAULT_QUBITS if n_qubits is None else n_qubits
+        shots = DEFAULT_SHOTS if shots is None else shots
         
         # Extract quantum features with increased number of qubits
-        quantum_features, quantum_entropy, quantum_contrast = quantum_feature_extraction(
-            image_normalized.flatten(), n_qubits=10)
+        check_deadline(deadline, 'quantum feature extraction')
+        stage_start = record_stage('preprocess', stage_start)
+        if quantum_stage is None:
+            run_quantum_stage = partial(_quantum_stage, image_normalized, n_qubits, shots,
+                                        quantum_mode, patch_size, deadline)
+        else:
+            run_quantum_stage = lambda: quantum_stage
+        if parallel and not lean:
+            executor = get_stage_executor()
+            quantum_future = executor.submit(run_quantum_stage)
+            scale_futures = [executor.submit(detect_scale_candidates, image, *scale, deadline)
+                             for scale in CLASSICAL_SCALES]
+            try:
+                quantum_features, quantum_entropy, quantum_contrast, quantum_feature_map = quantum_future.result()
+            except Exception:
+                for future in scale_futures:
+                    future.cancel()
+                raise
+            scale_candidates = (future.result() for future in scale_futures)
+        else:
+            if parallel:
+                # Lean: only the quantum stage overlaps, the scales share one set of buffers
+                quantum_future = get_stage_executor().submit(run_quantum_stage)
+                quantum_features, quantum_entropy, quantum_contrast, quantum_feature_map = quantum_future.result()
+            else:
+                quantum_features, quantum_entropy, quantum_contrast, quantum_feature_map = run_quantum_stage()
+            scale_candidates = (detect_scale_candidates(image, *scale, deadline, buffers=buffers)
+                                for scale in CLASSICAL_SCALES)
+        stage_start = time.perf_counter()
         
         # Calculate enhanced metrics
-        brightness = np.mean(image)
-        contrast = np.std(image)
-        entropy = -np.sum(np.histogram(image, bins=256)[0] * np.log2(np.histogram(image, bins=256)[0] + 1e-10))
-        
-        # Enhanced anomaly detection with multi-scale approach
-        anomalies = []
+        if lean:
+            mean, std = cv2.meanStdDev(image)
+            brightness = mean[0, 0]
+            contrast = std[0, 0]
+            histogram = cv2.calcHist([image], [0], None, [256], [0, 256]).ravel().astype(np.float64)
+            entropy = -np.sum(histogram * np.log2(histogram + 1e-10))
+        else:
+            brightness = np.mean(image)
+            contrast = np.std(image)
+            entropy = -np.sum(np.histogram(image, bins=256)[0] * np.log2(np.histogram(image, bins=256)[0] + 1e-10))
         
-        # Quantum anomaly detection with adaptive threshold
-        mean_feature = np.mean(quantum_features)
-        std_feature = np.std(quantum_features)
-        quantum_threshold = mean_feature + 2 * std_feature  # Dynamic threshold
+        # Enhanced anomaly detection with multi-scale approach, starting
+        # with quantum anomaly detection with an adaptive threshold
+        anomalies = quantum_anomalies(quantum_features, quantum_feature_map, image.shape, scale,
+                                      patch_size=patch_size)
         
-        for i in range(len(quantum_features)):
-            if quantum_features[i] > quantum_threshold:
-                anomalies.append({
-                    'type': 'quantum_anomaly',
-                    'location': [i % new_size[0], i // new_size[0]],
-                    'severity': (quantum_features[i] - quantum_threshold) / quantum_threshold
-                })
+        n_quantum_candidates = len(anomalies)
+        ANOMALY_CANDIDATES.observe(n_quantum_candidates, source='quantum')
+        stage_start = record_stage('quantum_anomalies', stage_start)
         
-        # Multi-scale classical anomaly detection
-        scales = [(1.0, 100, 200), (0.5, 50, 100), (2.0, 200, 400)]
-        for scale_factor, low_threshold, high_threshold in scales:
-            scaled_image = cv2.resize(image, None, fx=scale_factor, fy=scale_factor)
-            edges = cv2.Canny(scaled_image, low_threshold, high_threshold)
-            
-            # Use adaptive thresholding
-            thresh = cv2.adaptiveThreshold(scaled_image, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-                                         cv2.THRESH_BINARY, 11, 2)
-            
-            # Combine edge and threshold detection
-            combined = cv2.bitwise_and(edges, thresh)
-            points = np.where(combined > 0)
-            
+        # Multi-scale classical anomaly detection, sampled in scale order
+        for (scale_factor, _, _), (scaled_image, points) in zip(CLASSICAL_SCALES, scale_candidates):
             for x, y in zip(points[1], points[0]):
-                if np.random.random() < 0.05:  # Sample points
-                    # Calculate local statistics
-                    local_region = scaled_image[
-                        max(0, y-5):min(scaled_image.shape[0], y+6),
-                        max(0, x-5):min(scaled_image.shape[1], x+6)
-                    ]
-                    local_std = np.std(local_region)
-                    local_contrast = (np.max(local_region) - np.min(local_region)) / 255.0
-                    
-                    severity = (local_std * local_contrast) / 255.0
-                    if severity > 0.1:  # Filter weak anomalies
+                if np.random.random() < SAMPLE_RATE:  # Sample points
+                    severity = local_severity(scaled_image, x, y)
+                    if severity > SEVERITY_CUTOFF:  # Filter weak anomalies
                         anomalies.append({
                             'type': f'classical_anomaly_scale_{scale_factor}',
                             'location': [int(x/scale_factor), int(y/scale_factor)],
                             'severity': float(severity)
                         })
         
+        if lean:
+            del scale_candidates, scaled_image, points
+        ANOMALY_CANDIDATES.observe(len(anomalies) - n_quantum_candidates, source='classical')
+        stage_start = record_stage('classical_detection', stage_start)
+        
         # Sort anomalies by severity and remove duplicates
         anomalies.sort(key=lambda x: x['severity'], reverse=True)
         
-        # Remove duplicate anomalies that are too close to each other
-        filtered_anomalies = []
-        for anomaly in anomalies:
-            is_duplicate = False
-            for existing in filtered_anomalies:
-                dist = np.sqrt((anomaly['location'][0] - existing['location'][0])**2 +
-                             (anomaly['location'][1] - existing['location'][1])**2)
-                if dist < 5:  # Distance threshold
-                    is_duplicate = True
-                    break
-            if not is_duplicate:
-                filtered_anomalies.append(anomaly)
+        # Remove duplicate anomalies that are too close to each other; anomalies
+        # without a location (global quantum features) are all kept
+        located = [i for i, anomaly in enumerate(anomalies) if 'location' in anomaly]
+        kept = {located[i] for i in deduplicate_locations([anomalies[i]['location'] for i in located])}
+        filtered_anomalies = [anomaly for i, anomaly in enumerate(anomalies)
+                              if i in kept or 'location' not in anomaly]
+        
+        stage_start = record_stage('deduplication', stage_start)
         
         # Apply advanced image enhancement
-        enhanced = cv2.convertScaleAbs(image, alpha=1.1, beta=5)
+        check_deadline(deadline, 'image enhancement')
+        if lean:
+            # The original is no longer needed, so it is scaled in place
+            enhanced = cv2.convertScaleAbs(image, image, alpha=1.1, beta=5)
+        else:
+            enhanced = cv2.convertScaleAbs(image, alpha=1.1, beta=5)
         
         # Apply adaptive histogram equalization
         clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-        enhanced = clahe.apply(enhanced)
+        if enhanced_out is not None:
+            enhanced = clahe.apply(enhanced, dst=enhanced_out)
+        elif lean:
+            enhanced = clahe.apply(enhanced, dst=buffers.get('enhanced', image.shape))
+        else:
+            enhanced = clahe.apply(enhanced)
         
         # Save enhanced image
         cv2.imwrite(output_path, enhanced)
+        record_stage('enhancement', stage_start)
+        IMAGES_PROCESSED.inc(pipeline='quantum')
         
-        return {
+        result = {
             'success': True,
             'output_path': output_path,
             'metrics': {
@@ -208,13 +611,37 @@ def process_image(image_path):
             'anomalies': filtered_anomalies[:10],  # Limit to top 10 anomalies
             'image_quality': {
                 'resolution': f"{image.shape[1]}x{image.shape[0]}",
-                'format': os.path.splitext(image_path)[1],
-                'quantum_features': len(quantum_features)
+                'format': ext,
+                'quantum_features': len(quantum_features),
+                'n_qubits': n_qubits,
+                'shots': shots,
+                'latency_budget': latency_budget,
+                'predicted_latency': predicted_latency,
+                'quantum_mode': quantum_mode
             }
         }
+        if quantum_feature_map is not None:
+            result['quantum_feature_map'] = np.round(quantum_feature_map, 4).tolist()
+        if return_features:
+            if n_qubits == FEATURE_VECTOR_QUBITS:
+                result['feature_vector'] = quantum_features
+            else:
+                check_deadline(deadline, 'feature vector extraction')
+                result['feature_vector'], _, _ = quantum_feature_extraction(
+                    image_normalized.flatten(), n_qubits=FEATURE_VECTOR_QUBITS, shots=DEFAULT_SHOTS)
+        if return_quantum_stage:
+            result['quantum_stage'] = (quantum_features, quantum_entropy, quantum_contrast, quantum_feature_map)
+        return result
         
+    except DeadlineExceeded as e:
+        return {'success': False, 'error': str(e), 'deadline_exceeded': True}
     except Exception as e:
         return {'success': False, 'error': f'Error processing image: {str(e)}'}
+    finally:
+        if buffers is not None:
+            _buffer_pool.release(buffers)
 
 # Make functions available for import
-__all__ = ['process_image', 'quantum_feature_extraction']
+__all__ = ['process_image', 'process_image_array', 'load_grayscale', 'quantum_feature_extraction', 'quantum_patch_feature_map', 'get_simulator',
+           'get_stage_executor', 'detect_scale_candidates', 'check_deadline', 'DeadlineExceeded', 'resize_for_quantum',
+           'quantum_anomalies', 'local_severity', 'deduplicate_locations', 'check_quantum_mode', 'QUANTUM_MODES']
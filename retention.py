@@ -0,0 +1,244 @@
+import json
+import os
+import threading
+import time
+
+GIB = 1024 ** 3
+DAY = 24 * 3600
+
+# Per-directory caps: total size in bytes and age in seconds since last access
+DEFAULT_POLICIES = {
+    'uploads': {'max_bytes': 5 * GIB, 'max_age': 30 * DAY},
+    'processed_images': {'max_bytes': 5 * GIB, 'max_age': 30 * DAY},
+    'traditional_results': {'max_bytes': 5 * GIB, 'max_age': 30 * DAY},
+    'comparison_results': {'max_bytes': 2 * GIB, 'max_age': 90 * DAY},
+    'results': {'max_bytes': 2 * GIB, 'max_age': 30 * DAY}
+}
+
+RETENTION_DIR = '.retention'
+MAX_TOMBSTONES = 10000
+
+
+def policies_from_env(environ=os.environ, defaults=DEFAULT_POLICIES):
+    """Build policies, overridable per directory, e.g. QMI_RETENTION_UPLOADS_MAX_BYTES / _MAX_AGE_DAYS"""
+    policies = {}
+    for directory, policy in defaults.items():
+        prefix = f"QMI_RETENTION_{directory.upper()}"
+        max_bytes = environ.get(f"{prefix}_MAX_BYTES")
+        max_age_days = environ.get(f"{prefix}_MAX_AGE_DAYS")
+        policies[directory] = {
+            'max_bytes': int(max_bytes) if max_bytes else policy['max_bytes'],
+            'max_age': float(max_age_days) * DAY if max_age_days else policy['max_age']
+        }
+    return policies
+
+
+def last_access(stat_result):
+    """Last access time; downloads refresh atime explicitly via touch()"""
+    return max(stat_result.st_atime, stat_result.st_mtime)
+
+
+class RetentionManager:
+    """Size- and age-capped retention for the artifact directories with LRU eviction
+
+    sweep() first removes files not accessed within max_age, then evicts the
+    least recently accessed files until the directory fits within max_bytes.
+    Every eviction is logged so /download can report removed files cleanly,
+    and each sweep's summary is saved so stats() works from any worker process.
+    on_evict, if given, is called with the eviction records of each sweep
+    that removed files, e.g. to drop data derived from them.
+    """
+    def __init__(self, policies=None, interval=300, state_dir=RETENTION_DIR, on_evict=None):
+        self.policies = policies if policies is not None else policies_from_env()
+        self.interval = interval
+        self.state_dir = state_dir
+        self.tombstone_path = os.path.join(state_dir, 'evicted.jsonl')
+        self.stats_path = os.path.join(state_dir, 'stats.json')
+        self.on_evict = on_evict
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _scan(self, directory):
+        """(path, size, last access) for every regular file in a directory"""
+        entries = []
+        if not os.path.isdir(directory):
+            return entries
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.name.startswith('.') or not entry.is_file(follow_symlinks=False):
+                    continue
+                try:
+                    stat_result = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((entry.path, stat_result.st_size, last_access(stat_result)))
+        return entries
+
+    def _evict(self, path, reason, tombstones):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        tombstones.append({
+            'directory': os.path.dirname(path),
+            'filename': os.path.basename(path),
+            'reason': reason,
+            'evicted_at': time.time()
+        })
+        return True
+
+    def sweep(self):
+        """Apply every policy once and return the per-directory summary"""
+        with self._lock:
+            now = time.time()
+            tombstones = []
+            summary = {}
+            for directory, policy in self.policies.items():
+                entries = self._scan(directory)
+                evicted_files = 0
+                evicted_bytes = 0
+                kept = []
+                for path, size, accessed in entries:
+                    if policy['max_age'] is not None and now - accessed > policy['max_age']:
+                        if self._evict(path, 'max_age', tombstones):
+                            evicted_files += 1
+                            evicted_bytes += size
+                    else:
+                        kept.append((path, size, accessed))
+
+                total_bytes = sum(size for _, size, _ in kept)
+                if policy['max_bytes'] is not None and total_bytes > policy['max_bytes']:
+                    # Least recently accessed first
+                    kept.sort(key=lambda entry: entry[2])
+                    n_evicted = 0
+                    for path, size, _ in kept:
+                        if total_bytes <= policy['max_bytes']:
+                            break
+                        if self._evict(path, 'max_bytes', tombstones):
+                            evicted_files += 1
+                            evicted_bytes += size
+                        total_bytes -= size
+                        n_evicted += 1
+                    kept = kept[n_evicted:]
+
+                summary[directory] = {
+                    'files': len(kept),
+                    'bytes': total_bytes,
+                    'max_bytes': policy['max_bytes'],
+                    'max_age': policy['max_age'],
+                    'evicted_files': evicted_files,
+                    'evicted_bytes': evicted_bytes
+                }
+
+            self._record(tombstones, summary, now)
+            if tombstones and self.on_evict is not None:
+                try:
+                    self.on_evict(tombstones)
+                except Exception as e:
+                    print(f"Error handling retention evictions: {str(e)}")
+            return summary
+
+    def _record(self, tombstones, summary, swept_at):
+        """Append eviction tombstones and save the sweep summary with running totals"""
+        os.makedirs(self.state_dir, exist_ok=True)
+        previous = self._read_stats()
+        totals = previous.get('totals', {})
+        for directory, directory_summary in summary.items():
+            directory_totals = totals.setdefault(directory, {'evicted_files': 0, 'evicted_bytes': 0})
+            directory_totals['evicted_files'] += directory_summary['evicted_files']
+            directory_totals['evicted_bytes'] += directory_summary['evicted_bytes']
+
+        if tombstones:
+            with open(self.tombstone_path, 'a') as f:
+                for tombstone in tombstones:
+                    f.write(json.dumps(tombstone) + '\n')
+            self._compact_tombstones()
+
+        stats = {'last_sweep': swept_at, 'directories': summary, 'totals': totals}
+        temp_path = self.stats_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(stats, f, indent=2)
+        os.replace(temp_path, self.stats_path)
+
+    def _compact_tombstones(self):
+        """Keep only the most recent MAX_TOMBSTONES eviction records"""
+        with open(self.tombstone_path) as f:
+            lines = f.readlines()
+        if len(lines) > MAX_TOMBSTONES:
+            temp_path = self.tombstone_path + '.tmp'
+            with open(temp_path, 'w') as f:
+                f.writelines(lines[-MAX_TOMBSTONES:])
+            os.replace(temp_path, self.tombstone_path)
+
+    def _read_stats(self):
+        try:
+            with open(self.stats_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def eviction_record(self, directory, filename):
+        """Tombstone for a file removed by the retention policy, or None"""
+        if not os.path.exists(self.tombstone_path):
+            return None
+        record = None
+        with open(self.tombstone_path) as f:
+            for line in f:
+                try:
+                    tombstone = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if tombstone['filename'] == filename and os.path.normpath(tombstone['directory']) == os.path.normpath(directory):
+                    record = tombstone
+        return record
+
+    def touch(self, path):
+        """Mark a file as accessed now so LRU eviction keeps it longer"""
+        try:
+            os.utime(path, (time.time(), os.stat(path).st_mtime))
+        except OSError:
+            pass
+
+    def stats(self):
+        """Current usage per directory plus eviction totals from the sweeps so far"""
+        saved = self._read_stats()
+        usage = {}
+        for directory, policy in self.policies.items():
+            entries = self._scan(directory)
+            usage[directory] = {
+                'files': len(entries),
+                'bytes': sum(size for _, size, _ in entries),
+                'max_bytes': policy['max_bytes'],
+                'max_age': policy['max_age'],
+                **saved.get('totals', {}).get(directory, {'evicted_files': 0, 'evicted_bytes': 0})
+            }
+        return {
+            'last_sweep': saved.get('last_sweep'),
+            'interval': self.interval,
+            'directories': usage
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Error during retention sweep: {str(e)}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Sweep in a background daemon thread every interval seconds"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='retention-sweeper', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+# Make functions available for import
+__all__ = ['RetentionManager', 'DEFAULT_POLICIES', 'policies_from_env']
@@ -0,0 +1,195 @@
+# Production entry point for the Flask app: python serve.py --workers 4 --port 5000
+#
+# Heavy modules and the Aer simulator are loaded once in the parent process,
+# then the workers are forked so those pages are shared copy-on-write. The
+# latency cost model is calibrated once before forking and inherited. Each
+# worker runs a synthetic image through process_image before it accepts
+# connections on the shared listening socket.
+import argparse
+import json
+import os
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+import numpy as np
+import cv2
+
+# Modules used on the request path that are worth sharing between workers
+# (comparison plots use the Figure API with the Agg canvas, not pyplot)
+PRELOAD_MODULES = ['qiskit', 'qiskit_aer', 'matplotlib.figure', 'matplotlib.backends.backend_agg']
+
+
+def preload():
+    """Import heavy dependencies and create the simulator before forking"""
+    import matplotlib
+    matplotlib.use('Agg')  # Server threads must not use an interactive backend
+    from lazy_imports import profile_imports
+    import quantum_processing
+
+    start = time.perf_counter()
+    for timing in profile_imports(PRELOAD_MODULES):
+        if timing['error']:
+            print(f"Preload of {timing['module']} failed: {timing['error']}")
+    quantum_processing.get_simulator()
+
+    from app import app
+    print(f"Preloaded application in {time.perf_counter() - start:.2f}s")
+    return app
+
+
+def calibrate_cost_model():
+    """Calibrate the latency cost model once so that forked workers inherit it
+
+    Running the simulator in this process would leave Aer's OpenMP threads
+    behind in a state that hangs forked workers, so the calibration runs in
+    a short-lived child and only the fitted parameters come back through a
+    pipe. If it fails, workers calibrate on their first budgeted request.
+    """
+    import cost_model
+
+    start = time.perf_counter()
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            with os.fdopen(write_fd, 'w') as pipe:
+                json.dump(cost_model.LatencyCostModel().calibrate().to_dict(), pipe)
+        except Exception as e:
+            print(f"Cost model calibration failed: {str(e)}", flush=True)
+        finally:
+            os._exit(0)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd) as pipe:
+        payload = pipe.read()
+    os.waitpid(pid, 0)
+    try:
+        model = cost_model.LatencyCostModel.from_dict(json.loads(payload))
+    except (ValueError, KeyError):
+        print("No calibrated cost model, workers will calibrate on first use")
+        return
+    cost_model.set_cost_model(model)
+    print(f"Calibrated cost model in {time.perf_counter() - start:.2f}s")
+
+
+def warm_up():
+    """Run a synthetic image through process_image so the first request sees steady-state latency"""
+    from quantum_processing import process_image
+
+    start = time.perf_counter()
+    rng = np.random.RandomState(0)
+    synthetic = cv2.GaussianBlur((rng.rand(256, 256) * 255).astype(np.uint8), (5, 5), 0)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        image_path = os.path.join(temp_dir, f'warmup_{os.getpid()}.png')
+        cv2.imwrite(image_path, synthetic)
+        result = process_image(image_path)
+
+    if result.get('success'):
+        # Remove the enhanced copy that process_image saved for the synthetic image
+        if os.path.exists(result['output_path']):
+            os.remove(result['output_path'])
+    else:
+        print(f"Worker {os.getpid()} warm-up failed: {result.get('error')}")
+    print(f"Worker {os.getpid()} warmed up in {time.perf_counter() - start:.2f}s")
+
+
+def serve_worker(app, listen_socket, host, port, warmup=True):
+    """Warm up, then serve requests from the shared listening socket until terminated"""
+    from werkzeug.serving import make_server
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The parent handles Ctrl+C
+    if warmup:
+        warm_up()
+
+    server = make_server(host, port, app, threaded=True, fd=listen_socket.fileno())
+    server.serve_forever()
+
+
+def spawn_worker(app, listen_socket, host, port, warmup=True):
+    """Fork one worker process and return its pid"""
+    pid = os.fork()
+    if pid == 0:
+        try:
+            serve_worker(app, listen_socket, host, port, warmup=warmup)
+        finally:
+            os._exit(0)
+    return pid
+
+
+def run(host='127.0.0.1', port=5000, workers=2, warmup=True):
+    """Preload, fork the workers and restart any worker that exits unexpectedly"""
+    app = preload()
+
+    listen_socket = socket.create_server((host, port), backlog=128)
+    listen_socket.set_inheritable(True)
+    print(f"Listening on http://{host}:{port} with {workers} worker(s)")
+
+    if not hasattr(os, 'fork'):
+        # No fork on Windows: serve from this process instead
+        from app import retention
+        retention.start()
+        if warmup:
+            from cost_model import get_cost_model
+            get_cost_model()
+        serve_worker(app, listen_socket, host, port, warmup=warmup)
+        return
+
+    process_workers = int(os.environ.get('QMI_PROCESS_WORKERS', 0))
+    if process_workers > 0 and workers > 1:
+        # Pools are per web worker (see shm_transport.SharedMemoryProcessPool)
+        total = workers * process_workers
+        print(f"Each of the {workers} workers starts {process_workers} processing processes: "
+              f"{total} simulators in total on {os.cpu_count()} CPUs")
+
+    if warmup:
+        calibrate_cost_model()
+    children = set(spawn_worker(app, listen_socket, host, port, warmup) for _ in range(workers))
+    stopping = False
+
+    # Retention sweeps run only in the parent, after forking
+    from app import retention
+    retention.start()
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if not stopping:
+            print(f"Worker {pid} exited with status {status}, starting a replacement")
+            children.add(spawn_worker(app, listen_socket, host, port, warmup))
+
+    listen_socket.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve the quantum image processing app with pre-forked workers")
+    parser.add_argument('--host', default=os.environ.get('QMI_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('QMI_PORT', 5000)))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('QMI_WORKERS', os.cpu_count() or 2)),
+                        help="Number of worker processes (default: number of CPUs)")
+    parser.add_argument('--no-warmup', action='store_true', help="Skip the synthetic warm-up request")
+    args = parser.parse_args()
+
+    run(host=args.host, port=args.port, workers=max(1, args.workers), warmup=not args.no_warmup)
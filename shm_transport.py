@@ -0,0 +1,236 @@
+import os
+import secrets
+import sys
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from multiprocessing import get_context, resource_tracker, shared_memory
+
+import numpy as np
+
+from metrics import merge_deltas
+
+# What is pickled to a worker instead of the array itself
+ArrayDescriptor = namedtuple('ArrayDescriptor', ['name', 'shape', 'dtype'])
+
+# Prefix of the segments created here, so they can be spotted in /dev/shm
+SEGMENT_PREFIX = 'qmi'
+
+
+def segment_name():
+    """A new segment name chosen by the creating process (short enough for macOS's 31 characters)"""
+    return f"{SEGMENT_PREFIX}_{os.getpid()}_{secrets.token_hex(6)}"
+
+
+class SharedArray:
+    """A NumPy array in a shared memory segment created and owned by this process
+
+    The segment is reference counted: it starts with one reference,
+    retain() adds one and release() drops one, and the segment is unlinked
+    when the last is released. Other processes attach by descriptor (see
+    attach) and never unlink it. If this process dies first, the
+    multiprocessing resource tracker unlinks it.
+    """
+    def __init__(self, shape, dtype=np.uint8):
+        dtype = np.dtype(dtype)
+        shape = tuple(int(n) for n in shape)
+        size = max(1, int(np.prod(shape)) * dtype.itemsize)  # Zero-sized segments are not allowed
+        self._shm = shared_memory.SharedMemory(name=segment_name(), create=True, size=size)
+        self.descriptor = ArrayDescriptor(self._shm.name, shape, dtype.str)
+        self.array = np.ndarray(shape, dtype=dtype, buffer=self._shm.buf)
+        self._refs = 1
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_array(cls, array):
+        """Copy array into a new segment"""
+        shared = cls(array.shape, array.dtype)
+        shared.array[...] = array
+        return shared
+
+    @property
+    def name(self):
+        return self.descriptor.name
+
+    def retain(self):
+        with self._lock:
+            if self._refs <= 0:
+                raise ValueError(f'Shared array {self.name} has already been released')
+            self._refs += 1
+        return self
+
+    def release(self):
+        with self._lock:
+            if self._refs <= 0:
+                return
+            self._refs -= 1
+            if self._refs > 0:
+                return
+        self.array = None
+        try:
+            self._shm.close()
+        except BufferError:
+            pass  # Views of the array are still alive; the mapping goes away with them
+        self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+@contextmanager
+def attach(descriptor, untrack=False):
+    """Map a segment created by another process as a NumPy array for the duration of the block
+
+    Before Python 3.13, attaching registers the segment with the resource
+    tracker as if this process had created it. Processes started by
+    multiprocessing share their creator's tracker, where that is harmless.
+    A process started some other way has its own tracker, which would unlink
+    the segment when the process exits; pass untrack=True there. Views of
+    the array must not be kept beyond the block.
+    """
+    if sys.version_info >= (3, 13):
+        shm = shared_memory.SharedMemory(name=descriptor.name, track=False)
+    else:
+        shm = shared_memory.SharedMemory(name=descriptor.name)
+        if untrack:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+    array = np.ndarray(descriptor.shape, dtype=np.dtype(descriptor.dtype), buffer=shm.buf)
+    try:
+        yield array
+    finally:
+        del array
+        try:
+            shm.close()
+        except BufferError:
+            pass
+
+
+def _init_worker(cost_model_parameters=None):
+    """Create the simulator before the first task arrives and install the parent's cost model, if any"""
+    from quantum_processing import get_simulator
+    get_simulator()
+    if cost_model_parameters is not None:
+        from cost_model import LatencyCostModel, set_cost_model
+        set_cost_model(LatencyCostModel.from_dict(cost_model_parameters))
+
+
+def _process_shared(image_descriptor, enhanced_descriptor, output_name, options):
+    """Worker side of SharedMemoryProcessPool.process_image_array; returns (result, metric deltas)"""
+    from metrics import take_deltas
+    from quantum_processing import process_image_array
+
+    with attach(image_descriptor) as image:
+        if enhanced_descriptor is None:
+            result = process_image_array(image, output_name, **options)
+        else:
+            with attach(enhanced_descriptor) as enhanced:
+                result = process_image_array(image, output_name, enhanced_out=enhanced, **options)
+                del enhanced
+        del image
+    return result, take_deltas()
+
+
+class SharedMemoryProcessPool:
+    """Runs process_image_array in worker processes, handing images over in shared memory
+
+    The decoded image is copied once into a segment, and only its descriptor
+    and the (small) result dict are pickled. The enhanced image can be
+    returned the same way. Every segment is created by this process, so a
+    worker that crashes cannot leak one: the segments of a failed task are
+    released here, and a broken pool is replaced for the next task. Workers
+    are spawned rather than forked, since the web process runs threads.
+
+    Workers inherit this process's latency cost model if it has been
+    calibrated by the time the pool starts, so budgeted tasks do not
+    calibrate again in every worker.
+
+    A pool belongs to the process that created it. Under serve.py every
+    pre-forked web worker creates its own, so N web workers with pools of M
+    processes run N*M simulators, each with its own caches.
+
+    Metrics recorded in a worker during a task (counters and histograms) are
+    returned with the result and added to this process's metrics, so they
+    appear on /metrics.
+    """
+    def __init__(self, max_workers=None, start_method='spawn'):
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.start_method = start_method
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                from cost_model import get_cost_model
+                model = get_cost_model(calibrate=False)
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=get_context(self.start_method),
+                                                     initializer=_init_worker,
+                                                     initargs=(None if model is None else model.to_dict(),))
+            return self._executor
+
+    def _discard(self, executor):
+        """Drop a broken pool so the next task starts a new one"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def process_image_array(self, image, output_name, return_enhanced=False, **options):
+        """process_image_array in a worker; options are passed through (deadline, n_qubits, lean, ...)
+
+        With return_enhanced=True returns (result, enhanced) where enhanced is
+        a SharedArray holding the enhanced image (None if processing failed);
+        release it when done.
+        """
+        source = SharedArray.from_array(image)
+        enhanced = SharedArray(image.shape, np.uint8) if return_enhanced else None
+        try:
+            executor = self._get_executor()
+            future = executor.submit(_process_shared, source.descriptor,
+                                     None if enhanced is None else enhanced.descriptor, output_name, options)
+            result, deltas = future.result()
+            merge_deltas(deltas)
+        except BrokenProcessPool as e:
+            self._discard(executor)
+            result = {'success': False, 'error': f'Worker process exited unexpectedly: {str(e)}'}
+        except BaseException:
+            if enhanced is not None:
+                enhanced.release()
+            raise
+        finally:
+            source.release()
+
+        if not return_enhanced:
+            return result
+        if not result.get('success'):
+            enhanced.release()
+            enhanced = None
+        return result, enhanced
+
+    def process_image(self, image_path, lean=False, **options):
+        """process_image with the decoding done here and the processing in a worker"""
+        from quantum_processing import load_grayscale
+
+        try:
+            image = load_grayscale(image_path, lean=lean)
+        except ValueError as e:
+            return {'success': False, 'error': str(e)}
+        except Exception as e:
+            return {'success': False, 'error': f'Error processing image: {str(e)}'}
+        return self.process_image_array(image, os.path.basename(image_path), lean=lean, **options)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+# Make functions available for import
+__all__ = ['ArrayDescriptor', 'SharedArray', 'attach', 'SharedMemoryProcessPool']
@@ -0,0 +1,313 @@
+import itertools
+import os
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to the in-process lock only
+    fcntl = None
+
+FEATURE_STORE_DIR = 'feature_store'
+
+# Random-projection index settings (shared by every store so codes stay valid)
+INDEX_PLANES = 16
+INDEX_SEED = 1234
+SCAN_CHUNK_ROWS = 16384
+
+_store_lock = threading.Lock()
+
+# Parsed ids, id -> row map and sorted bucket codes per store, reused until the store changes
+_store_cache = {}
+_store_cache_lock = threading.Lock()
+
+
+@contextmanager
+def _locked(store_dir):
+    """Exclusive access to a store directory across threads and, where flock exists, processes
+
+    The lock is taken on a separate file because pruning replaces the store files.
+    """
+    with _store_lock:
+        os.makedirs(store_dir, exist_ok=True)
+        with open(os.path.join(store_dir, '.lock'), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _store_paths(dim, store_dir=FEATURE_STORE_DIR):
+    """Paths of the feature matrix, id list and index codes for one feature size"""
+    return (os.path.join(store_dir, f'features_{dim}.f32'),
+            os.path.join(store_dir, f'ids_{dim}.txt'),
+            os.path.join(store_dir, f'codes_{dim}.u32'))
+
+
+def _projection_planes(dim):
+    """Fixed random hyperplanes used for the coarse bucket index"""
+    rng = np.random.RandomState(INDEX_SEED + dim)
+    return rng.standard_normal((dim, INDEX_PLANES)).astype(np.float32)
+
+
+def _index_codes(vectors):
+    """Bucket code for each row: sign pattern of the centred random projections"""
+    vectors = np.atleast_2d(vectors).astype(np.float32)
+    centred = vectors - 1.0 / vectors.shape[1]
+    bits = (centred @ _projection_planes(vectors.shape[1])) > 0
+    return (bits.astype(np.uint32) << np.arange(INDEX_PLANES, dtype=np.uint32)).sum(axis=1).astype(np.uint32)
+
+
+def normalize_comparison_id(comparison_id):
+    """Accept 'comparison_<ts>.json', 'comparison_<ts>' or the bare timestamp"""
+    comparison_id = os.path.basename(str(comparison_id))
+    if comparison_id.endswith('.json'):
+        comparison_id = comparison_id[:-len('.json')]
+    if not comparison_id.startswith('comparison_'):
+        comparison_id = f'comparison_{comparison_id}'
+    return comparison_id
+
+
+def add_features(comparison_id, features, store_dir=FEATURE_STORE_DIR):
+    """Append a quantum feature distribution to the store for later similarity search"""
+    features = np.asarray(features, dtype=np.float32).ravel()
+    dim = features.shape[0]
+    comparison_id = normalize_comparison_id(comparison_id)
+    os.makedirs(store_dir, exist_ok=True)
+    features_path, ids_path, codes_path = _store_paths(dim, store_dir)
+    code = _index_codes(features)
+
+    with _locked(store_dir):
+        # Rows are appended in the same order to all three files, so the
+        # row number links an id to its vector and bucket code; the ids file
+        # is written last because its size marks a new store generation
+        with open(features_path, 'ab') as f:
+            f.write(features.tobytes())
+        with open(codes_path, 'ab') as f:
+            f.write(code.tobytes())
+        with open(ids_path, 'a') as f:
+            f.write(comparison_id + '\n')
+
+
+def _replace_file(path, data):
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+
+
+def remove_features(comparison_ids, store_dir=FEATURE_STORE_DIR):
+    """Drop the stored features of these comparisons, e.g. once retention has evicted their files
+
+    Each affected store is rewritten without those rows and swapped in
+    atomically. Returns the number of rows removed.
+    """
+    removed_ids = {normalize_comparison_id(comparison_id) for comparison_id in comparison_ids}
+    if not removed_ids:
+        return 0
+
+    removed = 0
+    with _locked(store_dir):
+        for dim in _stored_dims(store_dir):
+            ids, matrix, codes = _read_store(dim, store_dir)
+            keep = np.array([comparison_id not in removed_ids for comparison_id in ids], dtype=bool)
+            if keep.all():
+                continue
+            removed += int(np.count_nonzero(~keep))
+            kept_ids = [comparison_id for comparison_id, kept in zip(ids, keep) if kept]
+            kept_features = np.asarray(matrix[keep]) if matrix is not None else np.empty((0, dim), np.float32)
+            kept_codes = codes[keep] if codes is not None else np.empty(0, np.uint32)
+            del matrix
+
+            features_path, ids_path, codes_path = _store_paths(dim, store_dir)
+            _replace_file(features_path, kept_features.tobytes())
+            _replace_file(codes_path, kept_codes.tobytes())
+            # The ids file goes last, as its new stat marks the new generation
+            _replace_file(ids_path, ''.join(comparison_id + '\n' for comparison_id in kept_ids).encode())
+    return removed
+
+
+def _read_store(dim, store_dir=FEATURE_STORE_DIR):
+    """Memory-map the feature matrix and read ids and codes for one feature size"""
+    features_path, ids_path, codes_path = _store_paths(dim, store_dir)
+    if not os.path.exists(ids_path):
+        return [], None, None
+
+    with open(ids_path) as f:
+        ids = f.read().splitlines()
+
+    # A writer may be mid-append; only use rows present in every file
+    n_rows = min(len(ids),
+                 os.path.getsize(features_path) // (4 * dim),
+                 os.path.getsize(codes_path) // 4)
+    if n_rows == 0:
+        return [], None, None
+
+    matrix = np.memmap(features_path, dtype=np.float32, mode='r', shape=(n_rows, dim))
+    codes = np.fromfile(codes_path, dtype=np.uint32, count=n_rows)
+    return ids[:n_rows], matrix, codes
+
+
+class _Store:
+    """One feature size's store as loaded for queries"""
+    def __init__(self, ids, matrix, codes):
+        self.ids = ids
+        self.matrix = matrix
+        self.codes = codes
+        # Later rows win if an id was stored more than once
+        self.rows = {comparison_id: row for row, comparison_id in enumerate(ids)}
+        if codes is not None:
+            self.code_order = np.argsort(codes, kind='stable')
+            self.sorted_codes = codes[self.code_order]
+
+
+def _load_store(dim, store_dir=FEATURE_STORE_DIR):
+    """The store for one feature size, re-read only when its ids file has changed
+
+    Appends and pruning both change the ids file (size, mtime or inode), so
+    its stat is the store generation.
+    """
+    ids_path = _store_paths(dim, store_dir)[1]
+    try:
+        stat_result = os.stat(ids_path)
+    except FileNotFoundError:
+        return _Store([], None, None)
+    generation = (stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns)
+    key = (os.path.abspath(store_dir), dim)
+
+    with _store_cache_lock:
+        cached = _store_cache.get(key)
+        if cached is not None and cached[0] == generation:
+            return cached[1]
+    store = _Store(*_read_store(dim, store_dir))
+    with _store_cache_lock:
+        _store_cache[key] = (generation, store)
+    return store
+
+
+def _stored_dims(store_dir=FEATURE_STORE_DIR):
+    """Feature sizes that currently have a store on disk"""
+    if not os.path.isdir(store_dir):
+        return []
+    dims = []
+    for filename in os.listdir(store_dir):
+        if filename.startswith('ids_') and filename.endswith('.txt'):
+            dims.append(int(filename[len('ids_'):-len('.txt')]))
+    return sorted(dims)
+
+
+def get_features(comparison_id, store_dir=FEATURE_STORE_DIR):
+    """Return the stored feature vector for a comparison, or None if unknown"""
+    comparison_id = normalize_comparison_id(comparison_id)
+    for dim in _stored_dims(store_dir):
+        store = _load_store(dim, store_dir)
+        row = store.rows.get(comparison_id)
+        if row is not None:
+            return np.array(store.matrix[row])
+    return None
+
+
+def _distances(query, block, metric):
+    """Distance from the query to every row of a block of distributions"""
+    block = np.asarray(block, dtype=np.float32)
+    if metric == 'cosine':
+        norms = np.linalg.norm(block, axis=1) * np.linalg.norm(query)
+        return 1.0 - (block @ query) / (norms + 1e-12)
+    if metric == 'jensen_shannon':
+        mixture = 0.5 * (block + query)
+        log_mixture = np.log(mixture + 1e-12)
+        kl_query = np.sum(query * (np.log(query + 1e-12) - log_mixture), axis=1)
+        kl_block = np.sum(block * (np.log(block + 1e-12) - log_mixture), axis=1)
+        divergence = np.maximum(0.5 * (kl_query + kl_block), 0.0) / np.log(2)
+        return np.sqrt(divergence)
+    raise ValueError(f"Unknown metric: {metric}. Use 'cosine' or 'jensen_shannon'.")
+
+
+def _hamming_ball(code, radius):
+    """Every code that differs from code in exactly radius bits"""
+    return np.array([code ^ sum(1 << bit for bit in bits)
+                     for bits in itertools.combinations(range(INDEX_PLANES), radius)], dtype=np.uint32)
+
+
+def _candidate_rows(query_code, store, k, max_hamming=2):
+    """Rows whose bucket code is within a small Hamming radius of the query's code
+
+    Only the buckets in the Hamming ball are looked up (binary search in the
+    sorted codes), so the cost depends on the candidates, not the store size.
+    """
+    found = []
+    n_found = 0
+    # Widen the probe until there are enough candidates to fill k results
+    for radius in range(max_hamming + 1):
+        probes = _hamming_ball(query_code, radius)
+        starts = np.searchsorted(store.sorted_codes, probes, side='left')
+        stops = np.searchsorted(store.sorted_codes, probes, side='right')
+        for start, stop in zip(starts, stops):
+            if stop > start:
+                found.append(store.code_order[start:stop])
+                n_found += stop - start
+        if n_found >= k:
+            return np.sort(np.concatenate(found))
+    return None
+
+
+def find_similar(query, k=5, metric='cosine', use_index=False, exclude_id=None,
+                 store_dir=FEATURE_STORE_DIR):
+    """Return the k stored scans closest to a query feature vector or comparison id"""
+    if isinstance(query, str):
+        exclude_id = normalize_comparison_id(query) if exclude_id is None else exclude_id
+        query_features = get_features(query, store_dir)
+        if query_features is None:
+            raise KeyError(f'No stored quantum features for {normalize_comparison_id(query)}')
+    else:
+        query_features = np.asarray(query, dtype=np.float32).ravel()
+
+    dim = query_features.shape[0]
+    store = _load_store(dim, store_dir)
+    ids, matrix = store.ids, store.matrix
+    if matrix is None:
+        return []
+
+    if exclude_id is not None:
+        exclude_id = normalize_comparison_id(exclude_id)
+    n_wanted = min(k + (1 if exclude_id is not None else 0), len(ids))
+
+    rows = None
+    if use_index:
+        rows = _candidate_rows(int(_index_codes(query_features)[0]), store, n_wanted)
+
+    if rows is not None:
+        # Coarse index: only the candidate rows are read from the memory map
+        candidate_distances = _distances(query_features, matrix[rows], metric)
+    else:
+        # Full vectorized scan in chunks so memory stays bounded
+        rows = np.arange(len(ids))
+        candidate_distances = np.empty(len(ids), dtype=np.float32)
+        for start in range(0, len(ids), SCAN_CHUNK_ROWS):
+            stop = min(start + SCAN_CHUNK_ROWS, len(ids))
+            candidate_distances[start:stop] = _distances(query_features, matrix[start:stop], metric)
+
+    if n_wanted < len(candidate_distances):
+        best = np.argpartition(candidate_distances, n_wanted - 1)[:n_wanted]
+    else:
+        best = np.arange(len(candidate_distances))
+    best = best[np.argsort(candidate_distances[best], kind='stable')]
+
+    matches = []
+    for position in best:
+        comparison_id = ids[rows[position]]
+        if comparison_id == exclude_id:
+            continue
+        matches.append({
+            'comparison_id': comparison_id,
+            'comparison_file': f'{comparison_id}.json',
+            'distance': float(candidate_distances[position])
+        })
+    return matches[:k]
+
+
+# Make functions available for import
+__all__ = ['add_features', 'find_similar', 'get_features', 'remove_features', 'normalize_comparison_id']
@@ -1,9 +1,9 @@
 import os
 import numpy as np
 import pandas as pd
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
 import matplotlib.pyplot as plt
 import quantum_processing as qp
+from evaluation_metrics import ThresholdSweep, anomaly_score_map, ground_truth_mask, operating_point
 import cv2
 from tqdm import tqdm
 import requests
@@ -11,6 +11,8 @@ import zipfile
 import io
 import json
 import tarfile
+import hashlib
+import time
 
 def download_sample_dataset():
     """Download sample medical image dataset for testing."""
@@ -42,13 +44,27 @@ def download_sample_dataset():
         print(f"Error downloading dataset: {str(e)}")
         print("Please download manually from: https://nihcc.box.com/v/ChestXray-NIHCC")
 
-def evaluate_quantum_processing(image_path, ground_truth=None):
-    """Evaluate quantum processing on a single image."""
+def load_ground_truth(image_path, mask_suffix='_mask'):
+    """Ground-truth anomaly mask stored next to the image as '<name>_mask.png', or None"""
+    mask_path = os.path.splitext(image_path)[0] + mask_suffix + '.png'
+    if not os.path.exists(mask_path):
+        return None
+    return cv2.imread(mask_path, cv2.IMREAD_GRAYSCALE)
+
+def evaluate_quantum_processing(image_path, ground_truth=None, sweep=None, threshold=0.5):
+    """Evaluate quantum processing on a single image.
+    
+    With a ground-truth mask (any resolution; it is resized to the image),
+    the anomalies are painted into a score map at the image's native
+    resolution and scored at threshold. If a ThresholdSweep is given, the map
+    is also added to it and its per-bin counts are returned under
+    'threshold_counts' so that a resumed run can restore the sweep.
+    """
     try:
         # Process image with our quantum method
         result = qp.process_image(image_path)
         
-        if result is None:
+        if not result or not result.get('success'):
             return None
         
         # Extract features and metrics
@@ -59,7 +75,7 @@ def evaluate_quantum_processing(image_path, ground_truth=None):
                 'density_metrics': result['analysis']['density_metrics']
             }
         else:  # Regular image
-            features = result['metrics']['quantum_features']
+            features = result['image_quality']['quantum_features']
             metrics = {
                 'brightness': result['metrics']['brightness'],
                 'contrast': result['metrics']['contrast']
@@ -67,33 +83,19 @@ def evaluate_quantum_processing(image_path, ground_truth=None):
         
         # Calculate anomaly detection performance if ground truth is available
         if ground_truth is not None:
-            anomalies = result.get('anomalies', [])
-            anomaly_map = np.zeros((8, 8))  # Our processing size
-            for anomaly in anomalies:
-                if isinstance(anomaly['location'], list):
-                    i, j = anomaly['location']
-                    anomaly_map[i, j] = anomaly['severity']
-                else:
-                    i = anomaly['location'] // 8
-                    j = anomaly['location'] % 8
-                    anomaly_map[i, j] = anomaly['severity']
+            width, height = (int(n) for n in result['image_quality']['resolution'].split('x'))
+            score_map = anomaly_score_map(result.get('anomalies', []), (height, width))
+            labels = ground_truth_mask(ground_truth, score_map.shape)
             
-            # Compare with ground truth
-            accuracy = accuracy_score(ground_truth.flatten(), (anomaly_map > 0.5).flatten())
-            precision = precision_score(ground_truth.flatten(), (anomaly_map > 0.5).flatten())
-            recall = recall_score(ground_truth.flatten(), (anomaly_map > 0.5).flatten())
-            f1 = f1_score(ground_truth.flatten(), (anomaly_map > 0.5).flatten())
-            
-            return {
+            evaluation = {
                 'features': features,
                 'metrics': metrics,
-                'anomaly_detection': {
-                    'accuracy': accuracy,
-                    'precision': precision,
-                    'recall': recall,
-                    'f1': f1
-                }
+                'anomaly_detection': operating_point(score_map, labels, threshold)
             }
+            if sweep is not None:
+                positive, negative = sweep.update(score_map, labels)
+                evaluation['threshold_counts'] = {'positive': positive.tolist(), 'negative': negative.tolist()}
+            return evaluation
         
         return {
             'features': features,
@@ -125,7 +127,7 @@ def compare_with_classical(image_path):
         
         # Quantum processing
         quantum_result = qp.process_image(image_path)
-        if quantum_result is None:
+        if not quantum_result or not quantum_result.get('success'):
             return None
         
         if 'analysis' in quantum_result:
@@ -135,7 +137,7 @@ def compare_with_classical(image_path):
                 'density_metrics': quantum_result['analysis']['density_metrics']
             }
         else:
-            quantum_features = quantum_result['metrics']['quantum_features']
+            quantum_features = quantum_result['image_quality']['quantum_features']
             quantum_metrics = quantum_result['metrics']
         
         return {
@@ -153,66 +155,203 @@ def compare_with_classical(image_path):
         print(f"Error comparing methods for {image_path}: {str(e)}")
         return None
 
-def run_comprehensive_tests():
-    """Run comprehensive tests on the dataset."""
+class RunningStats:
+    """Incremental mean/std/min/max so aggregates never need the full result set"""
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+    
+    def update(self, value):
+        value = float(value)
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+    
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'std': float(np.sqrt(self.m2 / self.count)) if self.count else 0.0,
+            'min': self.min,
+            'max': self.max
+        }
+
+def file_sha256(path, block_size=1 << 20):
+    """Content hash used to key checkpoint records"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def update_aggregates(aggregates, record):
+    """Fold one per-image record into the running aggregate metrics"""
+    if record.get('status') != 'ok':
+        return
+    aggregates.setdefault('processing_time', RunningStats()).update(record['processing_time'])
+    
+    comparison = record.get('comparison') or {}
+    for method in ('quantum', 'classical'):
+        for key, value in comparison.get(method, {}).get('metrics', {}).items():
+            if isinstance(value, (int, float)):
+                aggregates.setdefault(f'{method}_{key}', RunningStats()).update(value)
+    
+    evaluation = record.get('evaluation') or {}
+    for key, value in evaluation.get('anomaly_detection', {}).items():
+        aggregates.setdefault(f'anomaly_{key}', RunningStats()).update(value)
+
+def load_checkpoint(results_path):
+    """Completed records from a previous run, keyed by (image path, content hash)
+
+    Only the last completed record of each key is kept, so an image written
+    twice counts once. Records are folded into the aggregates only when the
+    current run reaches their image (see add_completed), which leaves out
+    images that have changed or are no longer selected.
+    """
+    completed = {}
+    if not os.path.exists(results_path):
+        return completed
+    
+    with open(results_path, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Last line of a crashed run may be truncated; that image is simply redone
+                continue
+            if record.get('status') == 'ok':
+                completed[(record['image'], record['sha256'])] = record
+    return completed
+
+def add_completed(aggregates, sweep, record):
+    """Fold a record from a previous run into the aggregates and the threshold sweep"""
+    update_aggregates(aggregates, record)
+    counts = (record.get('evaluation') or {}).get('threshold_counts')
+    if counts is not None:
+        sweep.add_counts(counts['positive'], counts['negative'])
+
+def run_comprehensive_tests(max_images=300, results_dir="test_results", resume=True):
+    """Run comprehensive tests on the dataset.
+    
+    Per-image results are streamed to comprehensive_test_results.jsonl as they
+    complete. A rerun skips images whose path and content hash already have a
+    completed record, so an interrupted run picks up where it stopped.
+    Set max_images to None (or 0) to use the whole dataset.
+    
+    Images with a ground-truth mask ('<name>_mask.png' alongside) are scored
+    at native resolution, and all their score maps go into one threshold
+    sweep. Its ROC/PR AUCs and per-threshold curves are written to
+    anomaly_detection_curves.json.
+    """
     # Create results directory if it doesn't exist
-    os.makedirs("test_results", exist_ok=True)
+    os.makedirs(results_dir, exist_ok=True)
+    results_path = os.path.join(results_dir, "comprehensive_test_results.jsonl")
+    summary_path = os.path.join(results_dir, "comprehensive_test_results.json")
+    curves_path = os.path.join(results_dir, "anomaly_detection_curves.json")
     
     # Download sample dataset if not exists
     if not os.path.exists("test_data"):
         download_sample_dataset()
     
-    # Initialize results storage
-    results = {
-        'quantum_vs_classical': [],
-        'anomaly_detection': [],
-        'processing_times': []
-    }
+    # Aggregates are updated record by record, including records from earlier
+    # runs for the images selected in this one
+    aggregates = {}
+    sweep = ThresholdSweep()
+    if resume:
+        completed = load_checkpoint(results_path)
+    else:
+        completed = {}
+        if os.path.exists(results_path):
+            os.remove(results_path)
     
     # Test on sample images
     test_images = []
     for root, _, files in os.walk("test_data"):
         for file in files:
-            if file.lower().endswith(('.png', '.jpg', '.jpeg', '.dcm')):
+            if file.lower().endswith(('.png', '.jpg', '.jpeg', '.dcm')) and not file.lower().endswith('_mask.png'):
                 test_images.append(os.path.join(root, file))
+    test_images.sort()
     
-    # Limit to 300 images
-    if len(test_images) > 300:
-        print(f"Found {len(test_images)} images, limiting to 300 for disk space")
-        # Use a fixed random seed for reproducibility
+    # Limit the number of images
+    if max_images and len(test_images) > max_images:
+        print(f"Found {len(test_images)} images, limiting to {max_images} for disk space")
+        # Use a fixed random seed so a resumed run selects the same images
         np.random.seed(42)
-        test_images = np.random.choice(test_images, size=300, replace=False).tolist()
+        test_images = np.random.choice(test_images, size=max_images, replace=False).tolist()
     else:
         print(f"Found {len(test_images)} test images")
     
-    # Run tests
-    for image_path in tqdm(test_images, desc="Processing images"):
-        try:
-            # Compare quantum vs classical
-            comparison = compare_with_classical(image_path)
-            if comparison:
-                results['quantum_vs_classical'].append({
-                    'image': image_path,
-                    'comparison': comparison
-                })
+    counts = {'processed': 0, 'skipped': 0, 'failed': 0}
+    
+    # Run tests, appending one JSON line per image
+    with open(results_path, "a") as results_file:
+        for image_path in tqdm(test_images, desc="Processing images"):
+            try:
+                image_hash = file_sha256(image_path)
+            except OSError as e:
+                print(f"Error reading {image_path}: {str(e)}")
+                counts['failed'] += 1
+                continue
             
-            # Evaluate quantum processing
-            evaluation = evaluate_quantum_processing(image_path)
-            if evaluation:
-                results['anomaly_detection'].append({
-                    'image': image_path,
-                    'evaluation': evaluation
-                })
+            previous = completed.get((image_path, image_hash))
+            if previous is not None:
+                add_completed(aggregates, sweep, previous)
+                counts['skipped'] += 1
+                continue
             
-        except Exception as e:
-            print(f"Error processing {image_path}: {str(e)}")
-            continue
+            record = {'image': image_path, 'sha256': image_hash}
+            start_time = time.perf_counter()
+            try:
+                # Compare quantum vs classical
+                record['comparison'] = compare_with_classical(image_path)
+                
+                # Evaluate quantum processing
+                record['evaluation'] = evaluate_quantum_processing(image_path, load_ground_truth(image_path),
+                                                                   sweep=sweep)
+                
+                record['status'] = 'ok' if record['comparison'] or record['evaluation'] else 'failed'
+            except Exception as e:
+                print(f"Error processing {image_path}: {str(e)}")
+                record['status'] = 'failed'
+                record['error'] = str(e)
+            record['processing_time'] = time.perf_counter() - start_time
+            
+            results_file.write(json.dumps(record, default=float) + "\n")
+            results_file.flush()
+            
+            update_aggregates(aggregates, record)
+            counts['processed' if record['status'] == 'ok' else 'failed'] += 1
+    
+    # Save aggregate summary
+    with open(summary_path, "w") as f:
+        json.dump({
+            'images': len(test_images),
+            'completed_previously': counts['skipped'],
+            'processed': counts['processed'],
+            'failed': counts['failed'],
+            'aggregates': {key: stats.to_dict() for key, stats in aggregates.items()},
+            'anomaly_detection': sweep.summary(curve_points=False),
+            'results_file': results_path
+        }, f, indent=2)
     
-    # Save results
-    with open("test_results/comprehensive_test_results.json", "w") as f:
-        json.dump(results, f, indent=2)
+    if sweep.n_positive + sweep.n_negative:
+        with open(curves_path, "w") as f:
+            json.dump(sweep.summary(), f)
     
-    print("Tests completed. Results saved to test_results/comprehensive_test_results.json")
+    print(f"Tests completed. Per-image results in {results_path}, summary saved to {summary_path}")
 
 if __name__ == "__main__":
-    run_comprehensive_tests() 
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Run comprehensive tests on the sample dataset")
+    parser.add_argument('--max-images', type=int, default=300,
+                        help="Maximum number of images to evaluate (0 for the whole dataset)")
+    parser.add_argument('--no-resume', action='store_true',
+                        help="Discard earlier results instead of skipping completed images")
+    args = parser.parse_args()
+    run_comprehensive_tests(max_images=args.max_images, resume=not args.no_resume) 
\ No newline at end of file
@@ -0,0 +1,117 @@
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected, estimate_cost
+
+
+def hold(controller, cost, started, release):
+    """Run a request of the given cost until release is set"""
+    with controller.admit(cost):
+        started.set()
+        release.wait(5)
+
+
+def start_request(controller, cost):
+    started, release = threading.Event(), threading.Event()
+    thread = threading.Thread(target=hold, args=(controller, cost, started, release))
+    thread.start()
+    return thread, started, release
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_estimate_cost_grows_with_pixels():
+    assert estimate_cost(0, 0) == pytest.approx(1.0)
+    assert estimate_cost(2000, 2000) > estimate_cost(1000, 1000)
+
+
+def test_oversized_request_is_clipped_and_runs_alone():
+    controller = AdmissionController(max_concurrent=2, max_cost=10.0)
+    with controller.admit(1000.0):
+        assert controller.stats()['running_cost'] == pytest.approx(10.0)
+    assert controller.stats()['running_cost'] == pytest.approx(0.0)
+    assert controller.stats()['running'] == 0
+
+
+def test_cost_budget_queues_second_request():
+    controller = AdmissionController(max_concurrent=4, max_cost=10.0, max_queue=4, max_wait=5.0)
+    first, first_started, first_release = start_request(controller, 8.0)
+    assert first_started.wait(5)
+
+    second, second_started, second_release = start_request(controller, 5.0)
+    wait_for(lambda: controller.stats()['queued'] == 1)
+    assert not second_started.is_set()
+
+    first_release.set()
+    assert second_started.wait(5)
+    second_release.set()
+    first.join()
+    second.join()
+    stats = controller.stats()
+    assert (stats['running'], stats['queued'], stats['rejected']) == (0, 0, 0)
+    assert stats['running_cost'] == pytest.approx(0.0)
+
+
+def test_queue_is_fifo():
+    controller = AdmissionController(max_concurrent=1, max_cost=100.0, max_queue=4, max_wait=5.0)
+    order = []
+    first, first_started, first_release = start_request(controller, 1.0)
+    assert first_started.wait(5)
+
+    def queued(label):
+        with controller.admit(1.0):
+            order.append(label)
+
+    threads = []
+    for label in ('a', 'b', 'c'):
+        thread = threading.Thread(target=queued, args=(label,))
+        thread.start()
+        threads.append(thread)
+        wait_for(lambda: controller.stats()['queued'] == len(threads))
+
+    first_release.set()
+    for thread in [first] + threads:
+        thread.join()
+    assert order == ['a', 'b', 'c']
+
+
+def test_full_queue_rejects_with_429():
+    controller = AdmissionController(max_concurrent=1, max_queue=1, max_wait=5.0)
+    first, first_started, first_release = start_request(controller, 1.0)
+    assert first_started.wait(5)
+    second, _, second_release = start_request(controller, 1.0)
+    wait_for(lambda: controller.stats()['queued'] == 1)
+
+    with pytest.raises(AdmissionRejected) as excinfo:
+        with controller.admit(1.0):
+            pass
+    assert excinfo.value.status_code == 429
+    assert excinfo.value.retry_after >= 1
+    assert controller.stats()['rejected'] == 1
+
+    first_release.set()
+    second_release.set()
+    first.join()
+    second.join()
+
+
+def test_wait_timeout_rejects_with_503():
+    controller = AdmissionController(max_concurrent=1, max_queue=4, max_wait=0.05)
+    first, first_started, first_release = start_request(controller, 1.0)
+    assert first_started.wait(5)
+
+    with pytest.raises(AdmissionRejected) as excinfo:
+        with controller.admit(1.0):
+            pass
+    assert excinfo.value.status_code == 503
+    assert controller.stats()['queued'] == 0
+
+    first_release.set()
+    first.join()
@@ -0,0 +1,54 @@
+import importlib
+import io
+import json
+
+import pytest
+
+from metrics import REQUEST_SECONDS, REQUESTS_IN_FLIGHT
+
+
+@pytest.fixture
+def web(tmp_path, monkeypatch):
+    """app.py imported with its working directories under tmp_path"""
+    monkeypatch.chdir(tmp_path)
+    for directory in ('uploads', 'results', 'comparison_results', 'processed_images', 'traditional_results'):
+        (tmp_path / directory).mkdir()
+    web = importlib.import_module('app')
+
+    def fake_process(filepath, original_filename, timestamp, latency_budget=None):
+        return {'success': True, 'comparison_file': f'comparison_{timestamp}.json'}, 200
+    monkeypatch.setattr(web, 'admit_and_process', fake_process)
+    return web
+
+
+def in_flight():
+    return REQUESTS_IN_FLIGHT._values.get((), 0)
+
+
+def observations(route):
+    with REQUEST_SECONDS._lock:
+        return sum(state[2] for key, state in REQUEST_SECONDS._values.items() if key[0] == route)
+
+
+def test_plain_response_is_recorded_when_the_request_ends(web):
+    before, recorded = in_flight(), observations('/')
+
+    assert web.app.test_client().get('/').status_code == 200
+    assert in_flight() == before
+    assert observations('/') == recorded + 1
+
+
+def test_streamed_response_is_recorded_when_the_body_is_done(web):
+    before, recorded = in_flight(), observations('/upload-batch')
+    data = {'files': [(io.BytesIO(b'not decoded'), 'a.png'), (io.BytesIO(b'not decoded'), 'b.png')]}
+
+    response = web.app.test_client().post('/upload-batch', data=data, buffered=False)
+    assert response.is_streamed
+    assert in_flight() == before + 1
+    assert observations('/upload-batch') == recorded
+
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    response.close()
+    assert [line['type'] for line in lines] == ['result', 'result', 'summary']
+    assert in_flight() == before
+    assert observations('/upload-batch') == recorded + 1
@@ -0,0 +1,114 @@
+import io
+import json
+import tarfile
+import zipfile
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+from batch_upload import BatchError, format_event, save_batch, stream_batch
+
+ALLOWED = {'png', 'jpg'}
+
+
+def zip_upload(members, filename='study.zip'):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    buffer.seek(0)
+    return FileStorage(buffer, filename)
+
+
+def tar_upload(members, filename='study.tar.gz'):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as archive:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    buffer.seek(0)
+    return FileStorage(buffer, filename)
+
+
+def test_archives_are_expanded_in_name_order(tmp_path):
+    files = [
+        zip_upload({'scans/b.png': b'b', 'scans/a.png': b'a', 'notes.txt': b'x',
+                    '__MACOSX/scans/._a.png': b'x', 'scans/.hidden.png': b'x'}),
+        FileStorage(io.BytesIO(b'c'), 'c.jpg'),
+        tar_upload({'series/e.png': b'e', 'series/d.png': b'd', 'series/readme.md': b'x'}),
+    ]
+
+    items = save_batch(files, str(tmp_path), '20260101_120000', ALLOWED, max_files=10)
+
+    assert [item['filename'] for item in items] == ['a.png', 'b.png', 'c.jpg', 'd.png', 'e.png']
+    assert [item['index'] for item in items] == list(range(5))
+    for item in items:
+        assert item['filepath'] == str(tmp_path / f"{item['timestamp']}_{item['filename']}")
+        with open(item['filepath'], 'rb') as f:
+            assert f.read() == item['filename'][0].encode()
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(
+        f"{item['timestamp']}_{item['filename']}" for item in items)
+
+
+def test_batches_in_the_same_second_get_distinct_ids(tmp_path):
+    first = save_batch([FileStorage(io.BytesIO(b'1'), 'scan.png')], str(tmp_path), '20260101_120000', ALLOWED, 10)
+    second = save_batch([FileStorage(io.BytesIO(b'2'), 'scan.png')], str(tmp_path), '20260101_120000', ALLOWED, 10)
+
+    assert first[0]['timestamp'].startswith('20260101_120000_000_')
+    assert first[0]['timestamp'] != second[0]['timestamp']
+    with open(first[0]['filepath'], 'rb') as f:
+        assert f.read() == b'1'
+
+
+@pytest.mark.parametrize('files, message', [
+    (lambda: [zip_upload({f'{i}.png': b'x' for i in range(3)})], 'Too many images'),
+    (lambda: [FileStorage(io.BytesIO(b'x'), 'a.png'), FileStorage(io.BytesIO(b'not a zip'), 'b.zip')],
+     'Failed to read archive'),
+    (lambda: [FileStorage(io.BytesIO(b'x'), 'a.png'), FileStorage(io.BytesIO(b'x'), 'b.exe')], 'Invalid file type'),
+    (lambda: [zip_upload({'notes.txt': b'x'})], 'No images found'),
+])
+def test_rejected_batches_leave_no_uploads(tmp_path, files, message):
+    with pytest.raises(BatchError, match=message):
+        save_batch(files(), str(tmp_path), '20260101_120000', ALLOWED, max_files=2)
+    assert list(tmp_path.iterdir()) == []
+
+
+def items_named(*names):
+    return [{'index': i, 'filename': name, 'filepath': f'/nonexistent/{name}', 'timestamp': str(i)}
+            for i, name in enumerate(names)]
+
+
+def process(item):
+    if item['filename'] == 'busy.png':
+        return {'success': False, 'error': 'Server busy', 'retry_after': 1}, 503
+    if item['filename'] == 'broken.png':
+        raise RuntimeError('cannot decode')
+    if item['filename'] == 'bad.png':
+        return {'success': False, 'error': 'Invalid image'}, 400
+    return {'success': True, 'comparison_file': f"comparison_{item['timestamp']}.json"}, 200
+
+
+def test_ndjson_stream_has_a_line_per_image_then_a_summary():
+    lines = [json.loads(line) for line in
+             ''.join(stream_batch(items_named('b.png', 'busy.png', 'a.png', 'broken.png', 'bad.png'), process)).splitlines()]
+
+    results, summary = lines[:-1], lines[-1]
+    assert all(line['type'] == 'result' for line in results)
+    by_name = {line['filename']: line for line in results}
+    assert set(by_name) == {'a.png', 'b.png', 'busy.png', 'broken.png', 'bad.png'}
+    assert by_name['busy.png']['status'] == 503 and by_name['busy.png']['retry_after'] == 1
+    assert by_name['broken.png'] == {'type': 'result', 'index': 3, 'filename': 'broken.png', 'status': 500,
+                                     'success': False, 'error': 'Server error: cannot decode'}
+    assert summary['type'] == 'summary'
+    assert (summary['total'], summary['succeeded'], summary['failed'], summary['rejected']) == (5, 2, 2, 1)
+    assert summary['comparison_files'] == ['comparison_0.json', 'comparison_2.json']
+
+
+def test_sse_stream_sends_named_events():
+    events = list(stream_batch(items_named('a.png'), process, stream_format='sse'))
+
+    assert [event.split('\n', 1)[0] for event in events] == ['event: result', 'event: summary']
+    assert all(event.endswith('\n\n') for event in events)
+    assert json.loads(events[0].split('data: ', 1)[1])['comparison_file'] == 'comparison_0.json'
+    assert format_event('summary', {'total': 0}) == '{"type": "summary", "total": 0}\n'
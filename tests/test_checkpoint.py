@@ -0,0 +1,61 @@
+import json
+import os
+
+import pytest
+
+from evaluation_metrics import ThresholdSweep
+
+evaluation = pytest.importorskip('test_quantum_processing')
+
+
+def write_records(path, records):
+    with open(path, 'w') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+        f.write('{"image": "trunc')  # A crashed run's last line
+
+
+def ok_record(image, sha256, processing_time):
+    """A completed record with one positive and one negative pixel in its threshold counts"""
+    positive, negative = ThresholdSweep().histogram([0.9, 0.1], [True, False])
+    return {'image': image, 'sha256': sha256, 'status': 'ok', 'processing_time': processing_time,
+            'evaluation': {'threshold_counts': {'positive': positive.tolist(), 'negative': negative.tolist()}}}
+
+
+def test_last_completed_record_per_key_wins(tmp_path):
+    path = str(tmp_path / 'results.jsonl')
+    write_records(path, [ok_record('a.png', 'h1', 1.0), ok_record('a.png', 'h1', 3.0),
+                         {'image': 'b.png', 'sha256': 'h2', 'status': 'failed'}])
+    completed = evaluation.load_checkpoint(path)
+    assert list(completed) == [('a.png', 'h1')]
+    assert completed[('a.png', 'h1')]['processing_time'] == 3.0
+
+
+def test_resume_aggregates_only_the_current_selection(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('test_data')
+    for name in ('a.png', 'b.png'):
+        with open(os.path.join('test_data', name), 'wb') as f:
+            f.write(name.encode())
+    image_a, image_b = os.path.join('test_data', 'a.png'), os.path.join('test_data', 'b.png')
+    hash_a = evaluation.file_sha256(image_a)
+
+    os.makedirs('results')
+    write_records(os.path.join('results', 'comprehensive_test_results.jsonl'), [
+        ok_record(image_a, hash_a, 1.0), ok_record(image_a, hash_a, 2.0),    # Written twice
+        ok_record(image_b, 'stale', 5.0),                                    # Image changed since
+        ok_record(os.path.join('test_data', 'gone.png'), 'h', 7.0)          # No longer selected
+    ])
+    processed = []
+    monkeypatch.setattr(evaluation, 'compare_with_classical', lambda path: processed.append(path) or {'quantum': {}})
+    monkeypatch.setattr(evaluation, 'evaluate_quantum_processing', lambda *args, **kwargs: None)
+
+    evaluation.run_comprehensive_tests(max_images=None, results_dir='results')
+    with open(os.path.join('results', 'comprehensive_test_results.json')) as f:
+        summary = json.load(f)
+
+    assert processed == [image_b]
+    assert (summary['completed_previously'], summary['processed']) == (1, 1)
+    assert summary['aggregates']['processing_time']['count'] == 2
+    assert summary['anomaly_detection']['positive_pixels'] == 1
+    assert summary['anomaly_detection']['negative_pixels'] == 1
@@ -0,0 +1,62 @@
+import json
+
+import numpy as np
+import pytest
+
+from cost_model import MAX_QUBITS, MIN_QUBITS, SHOT_LADDER, LatencyCostModel
+
+
+def fitted_model(max_qubits=MAX_QUBITS, max_shots=SHOT_LADDER[-1]):
+    return LatencyCostModel.from_dict({'quantum_coefficients': [0.01, 1e-4, 1e-5, 1e-7],
+                                       'classical_fixed': 0.05, 'seconds_per_pixel': 1e-7,
+                                       'max_qubits': max_qubits, 'max_shots': max_shots})
+
+
+def test_parameters_round_trip_through_json():
+    model = fitted_model()
+    restored = LatencyCostModel.from_dict(json.loads(json.dumps(model.to_dict())))
+    assert restored.calibrated
+    assert restored.predict(8, 1024, 10 ** 6) == pytest.approx(model.predict(8, 1024, 10 ** 6))
+
+
+def test_choose_fits_budget_or_returns_cheapest():
+    model = fitted_model()
+    n_qubits, shots, predicted = model.choose(0.2, 10 ** 6)
+    assert MIN_QUBITS <= n_qubits <= MAX_QUBITS
+    assert predicted <= 0.2
+    assert model.choose(0.0, 10 ** 6)[:2] == (MIN_QUBITS, SHOT_LADDER[0])
+    assert model.choose(np.inf, 10 ** 6)[:2] == (MAX_QUBITS, SHOT_LADDER[-1])
+
+
+def test_choose_stays_within_the_calibrated_range():
+    model = fitted_model(max_qubits=10, max_shots=2048)
+    assert model.choose(np.inf, 10 ** 6)[:2] == (10, 2048)
+
+
+def test_calibration_always_runs_the_simulator(tmp_path, monkeypatch):
+    pytest.importorskip('qiskit_aer')
+    from feature_cache import cache_stats, clear_caches
+
+    monkeypatch.chdir(tmp_path)
+    clear_caches()
+    model = LatencyCostModel().calibrate(qubit_counts=(4, 5), shot_counts=(256, 512))
+
+    assert model.calibrated
+    assert (model.max_qubits, model.max_shots) == (5, 512)
+    assert model.choose(np.inf, 10 ** 6)[:2] == (5, 512)
+    assert all(stats['hits'] == 0 and stats['size'] == 0 for stats in cache_stats().values())
+
+
+def test_pool_workers_inherit_the_calibrated_model(monkeypatch):
+    pytest.importorskip('qiskit_aer')
+    import cost_model
+    from shm_transport import SharedMemoryProcessPool
+
+    model = fitted_model(max_qubits=9)
+    monkeypatch.setattr(cost_model, '_model', model)
+    pool = SharedMemoryProcessPool(max_workers=1)
+    try:
+        inherited = pool._get_executor().submit(cost_model.get_cost_model, False).result(timeout=60)
+    finally:
+        pool.shutdown()
+    assert inherited.to_dict() == model.to_dict()
@@ -0,0 +1,74 @@
+import importlib.util
+import os
+
+import numpy as np
+import cv2
+import pytest
+
+qml = pytest.importorskip('pennylane')
+pytest.importorskip('qiskit_aer')
+
+# app/api/quantum_processing.py shares its module name with the top-level pipeline, so load it by path
+_spec = importlib.util.spec_from_file_location(
+    'scanner', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            'app', 'api', 'quantum_processing.py'))
+scanner = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(scanner)
+
+
+def classical_gradient(image):
+    """Gradient magnitude from absolute forward differences, zero past the last row and column"""
+    gradient_x = np.zeros_like(image)
+    gradient_y = np.zeros_like(image)
+    gradient_x[:, :-1] = np.abs(np.diff(image, axis=1))
+    gradient_y[:-1, :] = np.abs(np.diff(image, axis=0))
+    return np.sqrt(gradient_x ** 2 + gradient_y ** 2)
+
+
+@pytest.mark.parametrize('shape', [(16, 16), (20, 37), (31, 9)])
+def test_qhed_matches_classical_differences(shape):
+    image = np.random.RandomState(0).rand(*shape)
+    image[:, :5] = 0.0  # Flat (zero-norm) segments
+
+    edges = scanner.QuantumMedicalScanner().quantum_edge_detection(image)
+
+    assert edges.shape == shape and edges.dtype == np.float64
+    np.testing.assert_allclose(edges, classical_gradient(image), atol=1e-9)
+
+
+def test_qhed_keeps_lean_images_in_float32():
+    image = np.random.RandomState(1).rand(24, 24).astype(np.float32)
+
+    edges = scanner.QuantumMedicalScanner().quantum_edge_detection(image)
+
+    assert edges.dtype == np.float32
+    np.testing.assert_allclose(edges, classical_gradient(image.astype(np.float64)), atol=1e-5)
+
+
+def test_qhed_runs_every_segment_in_one_execution():
+    medical_scanner = scanner.QuantumMedicalScanner()
+    image = np.random.RandomState(2).rand(40, 40)
+
+    with qml.Tracker(medical_scanner.dev) as tracker:
+        medical_scanner.quantum_edge_detection(image)
+
+    assert tracker.totals['batches'] == 1
+    assert tracker.totals['simulations'] == 1
+
+
+def test_process_scan_leaves_edges_out_by_default(tmp_path):
+    path = str(tmp_path / 'scan.png')
+    image = np.zeros((64, 64), np.uint8)
+    image[16:48, 16:48] = 255
+    cv2.imwrite(path, image)
+    medical_scanner = scanner.QuantumMedicalScanner()
+
+    plain = medical_scanner.process_scan(path)
+    assert plain['success'] and 'edge_density' not in plain['metrics']
+    assert medical_scanner._edge_qnode is None
+
+    with_edges = medical_scanner.process_scan(path, edge_detection=True)
+    assert with_edges['success']
+    assert with_edges['metrics']['edge_density'] > 0
+    assert {key: value for key, value in with_edges['metrics'].items()
+            if key not in ('edge_density', 'mean_edge_strength')} == plain['metrics']
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from evaluation_metrics import ThresholdSweep, anomaly_score_map, ground_truth_mask, operating_point
+
+sklearn_metrics = pytest.importorskip('sklearn.metrics')
+
+
+def scores_and_labels(n=5000, seed=0, decimals=2):
+    """Noisy scores on the default threshold grid, higher for positive pixels"""
+    rng = np.random.RandomState(seed)
+    labels = rng.rand(n) < 0.2
+    scores = np.clip(rng.normal(0.35, 0.15, n) + 0.3 * labels, 0, 1)
+    return np.round(scores, decimals), labels
+
+
+def test_auc_and_average_precision_match_sklearn():
+    scores, labels = scores_and_labels()
+    sweep = ThresholdSweep()
+    half = len(scores) // 2
+    sweep.update(scores[:half], labels[:half])
+    sweep.update(scores[half:], labels[half:])
+
+    assert sweep.roc_auc() == pytest.approx(sklearn_metrics.roc_auc_score(labels, scores), abs=1e-12)
+    assert sweep.average_precision() == pytest.approx(
+        sklearn_metrics.average_precision_score(labels, scores), abs=1e-12)
+
+
+def test_per_threshold_counts_match_operating_point():
+    scores, labels = scores_and_labels(seed=1)
+    sweep = ThresholdSweep(thresholds=[0.2, 0.5, 0.8])
+    sweep.update(scores, labels)
+    metrics = sweep.metrics()
+    for i, threshold in enumerate(sweep.thresholds):
+        expected = operating_point(scores, labels, threshold)
+        assert expected['f1'] == pytest.approx(sklearn_metrics.f1_score(labels, scores > threshold))
+        for key, value in expected.items():
+            assert metrics[key][i] == pytest.approx(value)
+
+
+def test_single_class_has_no_auc():
+    sweep = ThresholdSweep()
+    sweep.update(np.array([0.1, 0.9]), np.array([False, False]))
+    assert sweep.roc_auc() is None and sweep.average_precision() is None
+    assert 'best_f1' not in sweep.summary(curve_points=False)
+
+
+def test_score_map_skips_feature_space_anomalies_and_clips():
+    anomalies = [
+        {'type': 'classical_anomaly_scale_1.0', 'location': [10, 10], 'severity': 0.4},
+        {'type': 'quantum_patch_anomaly', 'location': [30, 20], 'severity': 7.5},
+        {'type': 'quantum_anomaly', 'location': [50, 5], 'severity': 0.9},
+        {'type': 'classical_anomaly_scale_2.0', 'location': [80, 383], 'severity': 0.9}
+    ]
+    score_map = anomaly_score_map(anomalies, (40, 60), radius=2)
+
+    assert score_map[10, 10] == pytest.approx(0.4)
+    assert score_map[20, 30] == 1.0
+    assert score_map[5, 50] == 0.0
+    assert score_map.max() == 1.0
+    assert np.count_nonzero(score_map) == 2 * 13  # Two discs of radius 2
+
+
+def test_ground_truth_mask_is_resized_to_the_score_map():
+    mask = np.zeros((4, 4), dtype=np.uint8)
+    mask[:2, :2] = 255
+    resized = ground_truth_mask(mask, (8, 8))
+    assert resized.shape == (8, 8) and resized[:4, :4].all() and not resized[4:, :].any()
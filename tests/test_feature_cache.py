@@ -0,0 +1,45 @@
+import numpy as np
+
+from feature_cache import LRUCache, bypass_caches, quantize
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LRUCache('test', maxsize=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert cache.stats() == {'size': 2, 'maxsize': 2, 'hits': 3, 'misses': 1, 'hit_rate': 0.75}
+
+
+def test_clear_drops_entries_and_counters():
+    cache = LRUCache('test', maxsize=2)
+    cache.put('a', 1)
+    cache.get('a')
+    cache.clear()
+    assert cache.get('a') is None
+    assert cache.stats()['size'] == 0 and cache.stats()['hits'] == 0
+
+
+def test_zero_maxsize_disables_caching():
+    cache = LRUCache('test', maxsize=0)
+    cache.put('a', 1)
+    assert cache.get('a') is None
+    assert cache.stats()['misses'] == 1
+
+
+def test_bypass_neither_reads_nor_writes_nor_counts():
+    cache = LRUCache('test', maxsize=4)
+    cache.put('a', 1)
+    with bypass_caches():
+        assert cache.get('a') is None
+        cache.put('b', 2)
+    assert cache.stats()['hits'] == 0 and cache.stats()['misses'] == 0
+    assert cache.get('b') is None and cache.get('a') == 1
+
+
+def test_quantize_rounds_to_the_key_precision():
+    np.testing.assert_array_equal(quantize([0.12345, 0.5], decimals=3), [0.123, 0.5])
@@ -0,0 +1,54 @@
+import numpy as np
+import cv2
+import pytest
+
+from image_metrics import compare_images, mse_psnr, region_means, structural_similarity
+
+skimage_metrics = pytest.importorskip('skimage.metrics')
+
+
+def scan_pair(shape=(120, 160), seed=0):
+    rng = np.random.RandomState(seed)
+    image = cv2.resize((rng.rand(12, 16) * 255).astype(np.uint8), shape[::-1], interpolation=cv2.INTER_CUBIC)
+    noisy = np.clip(image + rng.normal(0, 8, shape), 0, 255).astype(np.uint8)
+    return image, noisy
+
+
+def test_box_ssim_matches_skimage():
+    image, noisy = scan_pair()
+    expected = skimage_metrics.structural_similarity(image, noisy, data_range=255)
+    assert structural_similarity(image, noisy) == pytest.approx(expected, abs=1e-6)
+
+
+def test_gaussian_ssim_matches_skimage():
+    image, noisy = scan_pair(seed=1)
+    expected = skimage_metrics.structural_similarity(image, noisy, data_range=255, gaussian_weights=True,
+                                                     sigma=1.5, use_sample_covariance=False)
+    assert structural_similarity(image, noisy, gaussian=True) == pytest.approx(expected, abs=1e-6)
+
+
+def test_ssim_on_flat_bright_regions():
+    # Large equal values: E[x^2] - E[x]^2 loses all precision in float32
+    image = np.full((64, 64), 250, np.uint8)
+    other = image.copy()
+    other[::2, ::2] = 251
+    expected = skimage_metrics.structural_similarity(image, other, data_range=255)
+    assert structural_similarity(image, other) == pytest.approx(expected, abs=1e-6)
+    assert structural_similarity(image, image) == pytest.approx(1.0)
+
+
+def test_mse_psnr_matches_skimage():
+    image, noisy = scan_pair(seed=2)
+    mse, psnr = mse_psnr(image, noisy)
+    assert mse == pytest.approx(skimage_metrics.mean_squared_error(image, noisy))
+    assert psnr == pytest.approx(skimage_metrics.peak_signal_noise_ratio(image, noisy, data_range=255))
+    assert mse_psnr(image, image) == (0.0, float('inf'))
+
+
+def test_compare_images_regions_and_roi():
+    image, noisy = scan_pair()
+    metrics = compare_images(image, noisy, region_grid=(2, 3))
+    assert len(metrics['ssim_regions']) == 2 and len(metrics['ssim_regions'][0]) == 3
+    assert compare_images(image, noisy, roi=(10, 20, 50, 40))['resolution'] == '50x40'
+    assert compare_images(image, noisy, max_size=80)['resolution'] == '80x60'
+    assert region_means(np.arange(16, dtype=float).reshape(4, 4), (2, 2)) == [[2.5, 4.5], [10.5, 12.5]]
@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+from metrics import Counter, Gauge, Histogram, merge_deltas, render_metrics, take_deltas, _registry
+
+
+@pytest.fixture
+def registry():
+    """Metrics registered by a test are dropped afterwards"""
+    before = list(_registry)
+    yield
+    _registry[:] = before
+
+
+def test_every_series_has_a_pid_label(registry):
+    Counter('test_events_total', 'Events', ('kind',)).inc(kind='a')
+    Histogram('test_seconds', 'Durations', buckets=(1.0,)).observe(0.5)
+    Gauge('test_level', 'Level').set(3)
+    pid = f'pid="{os.getpid()}"'
+
+    lines = [line for line in render_metrics().splitlines() if line.startswith('test_')]
+    assert f'test_events_total{{kind="a",{pid}}} 1.0' in lines
+    assert f'test_seconds_bucket{{{pid},le="1.0"}} 1' in lines
+    assert f'test_seconds_count{{{pid}}} 1' in lines
+    assert f'test_level{{{pid}}} 3.0' in lines
+
+
+def test_deltas_move_counters_and_histograms_between_processes(registry):
+    counter = Counter('test_events_total', 'Events', ('kind',))
+    histogram = Histogram('test_seconds', 'Durations', buckets=(1.0,))
+    gauge = Gauge('test_level', 'Level')
+    counter.inc(2, kind='a')
+    histogram.observe(0.5)
+    histogram.observe(3.0)
+    gauge.set(7)
+
+    deltas = take_deltas()
+    assert 'test_level' not in deltas
+    assert counter.take() == {} and histogram.take() == {}
+    assert gauge.take() == {(): 7}
+
+    counter.inc(kind='a')
+    merge_deltas(deltas)
+    merge_deltas(deltas)
+    assert counter.take() == {('a',): 5}
+    assert histogram.take() == {(): [[2, 2], 7.0, 4]}
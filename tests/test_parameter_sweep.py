@@ -0,0 +1,71 @@
+import numpy as np
+import cv2
+import pytest
+
+from parameter_sweep import PreparedImage, local_severity_map, parameter_grid, summarize_sweep, sweep_image
+from quantum_processing import CLASSICAL_SCALES, deduplicate_locations, local_severity
+
+
+def synthetic_scan(shape=(96, 128), seed=0):
+    rng = np.random.RandomState(seed)
+    image = cv2.resize((rng.rand(8, 8) * 255).astype(np.uint8), shape[::-1], interpolation=cv2.INTER_CUBIC)
+    image[40:50, 60:75] = 255  # A bright lesion with sharp edges
+    return image
+
+
+def test_local_severity_map_matches_per_pixel_severity():
+    image = synthetic_scan((23, 31))
+    severity_map = local_severity_map(image, radius=3)
+    expected = np.array([[local_severity(image, x, y, radius=3) for x in range(image.shape[1])]
+                         for y in range(image.shape[0])])
+    np.testing.assert_allclose(severity_map, expected, atol=1e-9)
+
+
+@pytest.fixture(scope='module')
+def prepared():
+    pytest.importorskip('qiskit_aer')
+    return PreparedImage(synthetic_scan(), name='scan.png', n_qubits=4, shots=256)
+
+
+def reference_evaluate(prepared, scales, severity_cutoff, dedup_radius, quantum_sigma):
+    """Per-point version of PreparedImage.evaluate, scoring each candidate with local_severity"""
+    xs, ys, severities, located = (list(values) for values in prepared.quantum_candidates(quantum_sigma))
+    for scale_factor, low, high in scales:
+        scaled_image, rows, cols, _ = prepared._scale(scale_factor)
+        edges = cv2.Canny(scaled_image, low, high)
+        for row, col in zip(rows, cols):
+            severity = local_severity(scaled_image, col, row)
+            if edges[row, col] and severity > severity_cutoff:
+                xs.append(int(col / scale_factor))
+                ys.append(int(row / scale_factor))
+                severities.append(severity)
+                located.append(True)
+    order = [i for i in sorted(range(len(severities)), key=lambda i: -severities[i]) if located[i]]
+    kept = [order[i] for i in deduplicate_locations([(xs[i], ys[i]) for i in order], dedup_radius)]
+    kept += [i for i in range(len(severities)) if not located[i]]
+    return len(severities), sorted(severities[i] for i in kept)
+
+
+@pytest.mark.parametrize('severity_cutoff, dedup_radius', [(0.0, 5), (0.05, 10)])
+def test_evaluate_matches_per_point_reference(prepared, severity_cutoff, dedup_radius):
+    result = prepared.evaluate(severity_cutoff=severity_cutoff, dedup_radius=dedup_radius)
+    n_candidates, kept = reference_evaluate(prepared, CLASSICAL_SCALES, severity_cutoff, dedup_radius, 2)
+
+    assert result['classical_candidates'] > 0 and result['quantum_candidates'] > 0
+    assert result['quantum_candidates'] + result['classical_candidates'] == n_candidates
+    assert result['anomalies'] == len(kept)
+    assert result['max_severity'] == pytest.approx(max(kept, default=0.0))
+    assert result['mean_severity'] == pytest.approx(np.mean(kept) if kept else 0.0)
+
+
+def test_grid_and_summary(prepared):
+    grid = parameter_grid(severity_cutoffs=[0.0, 0.1], dedup_radii=[3, 5, 10])
+    assert len(grid) == 6
+    rows = sweep_image(prepared, grid) + sweep_image(prepared, grid)
+    summary = summarize_sweep(rows)
+
+    assert len(summary) == len(grid)
+    for setting, row in zip(grid, summary):
+        assert (row['severity_cutoff'], row['dedup_radius'], row['images']) == (setting['severity_cutoff'],
+                                                                               setting['dedup_radius'], 2)
+        assert row['total_anomalies'] == 2 * prepared.evaluate(**setting)['anomalies']
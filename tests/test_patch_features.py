@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('qiskit_aer')
+
+import quantum_processing
+from feature_cache import clear_caches, quantize
+from quantum_processing import build_feature_circuit, get_simulator, quantum_patch_feature_map
+
+
+@pytest.fixture
+def run_calls(monkeypatch):
+    """Count simulator executions; the memo is emptied first so every patch is simulated"""
+    clear_caches()
+    backend = get_simulator()
+    calls = []
+    run = backend.run
+
+    def counting_run(*args, **kwargs):
+        calls.append(kwargs)
+        return run(*args, **kwargs)
+
+    monkeypatch.setattr(backend, 'run', counting_run)
+    yield calls
+    clear_caches()
+
+
+def exact_patch_entropy(patch):
+    """Entropy of one patch circuit's exact outcome distribution, per qubit"""
+    from qiskit.quantum_info import Statevector
+
+    n_qubits = len(patch)
+    circuit = build_feature_circuit(quantize(patch), n_qubits).remove_final_measurements(inplace=False)
+    probabilities = Statevector.from_instruction(circuit).probabilities()
+    return -np.sum(probabilities * np.log2(probabilities + 1e-10)) / n_qubits
+
+
+def test_patches_are_simulated_in_one_batch(run_calls):
+    rng = np.random.RandomState(0)
+    image = rng.rand(6, 8)
+    feature_map = quantum_patch_feature_map(image, patch_size=2, shots=8192)
+
+    assert feature_map.shape == (3, 4)
+    assert len(run_calls) == 1
+    assert len(run_calls[0]['parameter_binds'][0]) == 4  # One parameter per qubit, bound to every patch
+
+    # Each entry matches its patch's own circuit, up to shot noise
+    for row in range(3):
+        for col in range(4):
+            patch = image[2 * row:2 * row + 2, 2 * col:2 * col + 2].ravel()
+            assert feature_map[row, col] == pytest.approx(exact_patch_entropy(patch), abs=0.02)
+
+
+def test_identical_and_memoized_patches_are_not_simulated_again(run_calls):
+    image = np.tile(np.array([[0.1, 0.9], [0.4, 0.6]]), (3, 3))
+    feature_map = quantum_patch_feature_map(image, patch_size=2, shots=512)
+    assert np.all(feature_map == feature_map[0, 0])
+    assert len(run_calls) == 1
+
+    np.testing.assert_array_equal(quantum_patch_feature_map(image, patch_size=2, shots=512), feature_map)
+    assert len(run_calls) == 1
+
+
+def test_odd_sizes_are_padded_with_border_pixels(run_calls):
+    image = np.random.RandomState(1).rand(5, 7)
+    assert quantum_patch_feature_map(image, patch_size=2, shots=256).shape == (3, 4)
+
+
+def test_unknown_quantum_mode_is_rejected():
+    image = np.zeros((16, 16), dtype=np.uint8)
+    with pytest.raises(ValueError, match='quantum mode'):
+        quantum_processing.process_image_array(image, 'scan.png', quantum_mode='bogus')
+    with pytest.raises(ValueError, match='quantum mode'):
+        quantum_processing.process_image('missing.png', quantum_mode='bogus')
+
+
+def test_patch_mode_result_carries_the_feature_map(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    image = (np.random.RandomState(2).rand(64, 48) * 255).astype(np.uint8)
+    result = quantum_processing.process_image_array(image, 'scan.png', quantum_mode='patch', n_qubits=4, shots=256)
+
+    assert result['success'] and result['image_quality']['quantum_mode'] == 'patch'
+    assert np.array(result['quantum_feature_map']).shape == (16, 12)  # 32x24 resized image in 2x2 patches
+    for anomaly in result['anomalies']:
+        if anomaly['type'] == 'quantum_patch_anomaly':
+            assert 0 <= anomaly['location'][0] < 48 and 0 <= anomaly['location'][1] < 64
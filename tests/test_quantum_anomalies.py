@@ -0,0 +1,39 @@
+import numpy as np
+
+from quantum_processing import process_image_array, quantum_anomalies, resize_for_quantum
+
+
+def spiky_features(n_features, spikes):
+    features = np.full(n_features, 1.0 / n_features)
+    features[list(spikes)] = 0.5
+    return features
+
+
+def test_global_anomalies_are_feature_bins_without_location():
+    image = np.zeros((300, 200), dtype=np.uint8)
+    _, scale, _ = resize_for_quantum(image)
+    # 14 qubits: many more features than pixels in the resized grid
+    anomalies = quantum_anomalies(spiky_features(2 ** 14, [5, 1205, 2 ** 14 - 1]), None, image.shape, scale)
+
+    assert [anomaly['feature_index'] for anomaly in anomalies] == [5, 1205, 2 ** 14 - 1]
+    assert all(anomaly['type'] == 'quantum_anomaly' and 'location' not in anomaly for anomaly in anomalies)
+
+
+def test_feature_space_anomalies_are_not_deduplicated(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # Neighbouring bins, which a pixel mapping would put within the deduplication radius
+    quantum_stage = (spiky_features(256, [3, 4]), 1.0, 1.0, None)
+    image = np.full((64, 64), 128, dtype=np.uint8)
+    result = process_image_array(image, 'flat.png', quantum_stage=quantum_stage)
+
+    assert result['success']
+    assert sorted(a['feature_index'] for a in result['anomalies'] if a['type'] == 'quantum_anomaly') == [3, 4]
+
+
+def test_patch_anomalies_in_original_pixels():
+    image = np.zeros((320, 320), dtype=np.uint8)
+    _, scale, _ = resize_for_quantum(image)
+    feature_map = np.zeros((16, 16))
+    feature_map[3, 7] = 1.0
+    anomalies = quantum_anomalies(None, feature_map, image.shape, scale, patch_size=2)
+    assert [anomaly['location'] for anomaly in anomalies] == [[150, 70]]
@@ -0,0 +1,98 @@
+import json
+import os
+import time
+
+import pytest
+
+from retention import DAY, RetentionManager, policies_from_env
+
+
+def write_file(path, size, accessed):
+    with open(path, 'wb') as f:
+        f.write(b'\0' * size)
+    os.utime(path, (accessed, accessed))
+
+
+@pytest.fixture
+def artifacts(tmp_path):
+    directory = tmp_path / 'uploads'
+    directory.mkdir()
+    return str(directory)
+
+
+def manager_for(directory, tmp_path, max_bytes=None, max_age=None, on_evict=None):
+    return RetentionManager({directory: {'max_bytes': max_bytes, 'max_age': max_age}},
+                            state_dir=str(tmp_path / '.retention'), on_evict=on_evict)
+
+
+def test_policies_from_env_overrides_one_directory():
+    policies = policies_from_env({'QMI_RETENTION_UPLOADS_MAX_BYTES': '1000',
+                                  'QMI_RETENTION_RESULTS_MAX_AGE_DAYS': '2'})
+    assert policies['uploads']['max_bytes'] == 1000
+    assert policies['results']['max_age'] == 2 * DAY
+    assert policies['processed_images']['max_bytes'] == 5 * 1024 ** 3
+
+
+def test_old_files_are_evicted_by_age(artifacts, tmp_path):
+    now = time.time()
+    write_file(os.path.join(artifacts, 'old.png'), 10, now - 2 * DAY)
+    write_file(os.path.join(artifacts, 'new.png'), 10, now)
+    write_file(os.path.join(artifacts, '.hidden'), 10, now - 2 * DAY)
+
+    summary = manager_for(artifacts, tmp_path, max_age=DAY).sweep()[artifacts]
+    assert sorted(os.listdir(artifacts)) == ['.hidden', 'new.png']
+    assert (summary['files'], summary['evicted_files'], summary['evicted_bytes']) == (1, 1, 10)
+
+
+def test_least_recently_accessed_files_are_evicted_first(artifacts, tmp_path):
+    now = time.time()
+    for i, name in enumerate(['a.png', 'b.png', 'c.png', 'd.png']):
+        write_file(os.path.join(artifacts, name), 100, now - (4 - i) * 60)
+    manager = manager_for(artifacts, tmp_path, max_bytes=250)
+    manager.touch(os.path.join(artifacts, 'a.png'))
+
+    summary = manager.sweep()[artifacts]
+    assert sorted(os.listdir(artifacts)) == ['a.png', 'd.png']
+    assert (summary['files'], summary['bytes'], summary['evicted_files']) == (2, 200, 2)
+
+
+def test_tombstones_and_stats_survive_the_manager(artifacts, tmp_path):
+    write_file(os.path.join(artifacts, 'old.png'), 10, time.time() - 2 * DAY)
+    manager_for(artifacts, tmp_path, max_age=DAY).sweep()
+
+    manager = manager_for(artifacts, tmp_path, max_age=DAY)
+    record = manager.eviction_record(artifacts, 'old.png')
+    assert record['reason'] == 'max_age'
+    assert manager.eviction_record(artifacts, 'other.png') is None
+
+    stats = manager.stats()
+    assert stats['last_sweep'] is not None
+    assert stats['directories'][artifacts]['evicted_files'] == 1
+    manager.sweep()
+    assert manager.stats()['directories'][artifacts]['evicted_files'] == 1
+
+
+def test_tombstones_are_compacted(artifacts, tmp_path, monkeypatch):
+    monkeypatch.setattr('retention.MAX_TOMBSTONES', 3)
+    manager = manager_for(artifacts, tmp_path, max_age=DAY)
+    for i in range(5):
+        write_file(os.path.join(artifacts, f'{i}.png'), 1, time.time() - 2 * DAY)
+        manager.sweep()
+    with open(manager.tombstone_path) as f:
+        names = [json.loads(line)['filename'] for line in f]
+    assert names == ['2.png', '3.png', '4.png']
+
+
+def test_on_evict_receives_tombstones_and_errors_are_contained(artifacts, tmp_path):
+    calls = []
+    write_file(os.path.join(artifacts, 'old.png'), 10, time.time() - 2 * DAY)
+    manager_for(artifacts, tmp_path, max_age=DAY, on_evict=calls.append).sweep()
+    manager_for(artifacts, tmp_path, max_age=DAY, on_evict=calls.append).sweep()  # Nothing evicted
+    assert [[t['filename'] for t in tombstones] for tombstones in calls] == [['old.png']]
+
+    def fail(tombstones):
+        raise RuntimeError('boom')
+
+    write_file(os.path.join(artifacts, 'older.png'), 10, time.time() - 3 * DAY)
+    manager_for(artifacts, tmp_path, max_age=DAY, on_evict=fail).sweep()
+    assert not os.path.exists(os.path.join(artifacts, 'older.png'))
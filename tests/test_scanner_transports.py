@@ -0,0 +1,96 @@
+import base64
+import importlib.util
+import io
+import os
+import tracemalloc
+
+import numpy as np
+import cv2
+import pytest
+
+pytest.importorskip('pennylane')
+pytest.importorskip('qiskit_aer')
+
+# app/api/quantum_processing.py shares its module name with the top-level pipeline, so load it by path
+_spec = importlib.util.spec_from_file_location(
+    'scanner', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            'app', 'api', 'quantum_processing.py'))
+scanner = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(scanner)
+
+
+@pytest.fixture
+def scan_path(tmp_path):
+    path = str(tmp_path / 'scan.jpg')
+    cv2.imwrite(path, (np.random.RandomState(0).rand(48, 64) * 255).astype(np.uint8))
+    return path
+
+
+def decode(image_bytes):
+    return cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+
+
+def test_frames_round_trip_one_after_another():
+    stream = io.BytesIO()
+    scanner.write_frame(stream, {'success': True, 'metrics': {'mean': 0.5}}, b'\x89PNG\x00\xff')
+    scanner.write_frame(stream, {'success': False, 'error': 'no image'})
+    stream.seek(0)
+
+    assert scanner.read_frame(stream) == ({'success': True, 'metrics': {'mean': 0.5}}, b'\x89PNG\x00\xff')
+    assert scanner.read_frame(stream) == ({'success': False, 'error': 'no image'}, b'')
+
+
+def test_base64_transport_embeds_the_image_without_writing_files(scan_path, tmp_path):
+    result = scanner.QuantumMedicalScanner().process_scan(scan_path, edge_detection=False)
+    assert result['success']
+    assert decode(base64.b64decode(result['processed_image'])).shape == (256, 256, 3)
+    assert os.listdir(tmp_path) == ['scan.jpg']
+
+
+def test_file_transport_writes_the_encoded_format(scan_path, tmp_path):
+    result = scanner.QuantumMedicalScanner().process_scan(scan_path, transport='file', image_format='webp',
+                                                          edge_detection=False)
+    assert result['processed_image_path'] == str(tmp_path / 'scan_processed.webp')
+    with open(result['processed_image_path'], 'rb') as f:
+        image_bytes = f.read()
+    assert result['processed_image_size'] == len(image_bytes)
+    assert result['processed_image_format'] == 'webp'
+    assert decode(image_bytes).shape == (256, 256, 3)
+    assert 'processed_image' not in result
+
+
+def test_frame_transport_returns_bytes_for_write_frame(scan_path, tmp_path):
+    result = scanner.QuantumMedicalScanner().process_scan(scan_path, transport='frame', image_format='jpg',
+                                                          compression=80, edge_detection=False)
+    image_bytes = result.pop('processed_image_bytes')
+    assert decode(image_bytes).shape == (256, 256, 3)
+    assert os.listdir(tmp_path) == ['scan.jpg']
+
+    stream = io.BytesIO()
+    scanner.write_frame(stream, result, image_bytes)
+    stream.seek(0)
+    metadata, received = scanner.read_frame(stream)
+    assert received == image_bytes and metadata['processed_image_format'] == 'jpg'
+
+
+def test_unknown_transport_and_format_fail_cleanly(scan_path):
+    processor = scanner.QuantumMedicalScanner()
+    assert 'Unsupported transport' in processor.process_scan(scan_path, transport='carrier-pigeon')['error']
+    assert 'Unsupported image format' in processor.process_scan(scan_path, image_format='gif',
+                                                                 edge_detection=False)['error']
+
+
+def test_trace_memory_leaves_outer_tracing_running(scan_path):
+    processor = scanner.QuantumMedicalScanner()
+    assert not tracemalloc.is_tracing()
+    result = processor.process_scan(scan_path, lean=True, trace_memory=True)
+    assert not tracemalloc.is_tracing()
+    assert result['memory']['lean'] is True and result['memory']['peak_traced_bytes'] > 0
+
+    tracemalloc.start()
+    try:
+        result = processor.process_scan(scan_path, trace_memory=True)
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+    assert result['success'] and set(result['memory']) == {'lean', 'peak_traced_bytes', 'max_rss_bytes'}
@@ -0,0 +1,102 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import shm_transport
+from shm_transport import ArrayDescriptor, SharedArray, SharedMemoryProcessPool, attach
+
+pytestmark = pytest.mark.skipif(not os.path.isdir('/dev/shm'), reason='Segments are listed in /dev/shm')
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def own_segments():
+    """Segments created by this process that still exist"""
+    prefix = f'{shm_transport.SEGMENT_PREFIX}_{os.getpid()}_'
+    return sorted(name for name in os.listdir('/dev/shm') if name.startswith(prefix))
+
+
+def test_segment_is_unlinked_with_the_last_reference():
+    shared = SharedArray((3, 4), np.float32)
+    assert own_segments() == [shared.name]
+    assert shared.descriptor == ArrayDescriptor(shared.name, (3, 4), '<f4')
+
+    assert shared.retain() is shared
+    shared.release()
+    assert own_segments() == [shared.name]
+    shared.release()
+    assert own_segments() == []
+
+    with pytest.raises(ValueError, match='already been released'):
+        shared.retain()
+    shared.release()  # Releasing again is a no-op
+
+
+def test_from_array_copies_and_context_manager_releases():
+    image = np.arange(12, dtype=np.uint8).reshape(3, 4)
+    with SharedArray.from_array(image) as shared:
+        image[0, 0] = 99
+        assert shared.array[0, 0] == 0
+        np.testing.assert_array_equal(shared.array[1:], image[1:])
+    assert own_segments() == []
+
+    with SharedArray((0, 5)) as empty:
+        assert empty.array.shape == (0, 5)
+    assert own_segments() == []
+
+
+def test_attach_maps_the_same_memory():
+    with SharedArray((2, 2), np.int16) as shared:
+        with attach(shared.descriptor) as view:
+            view[...] = [[1, 2], [3, 4]]
+            del view
+        np.testing.assert_array_equal(shared.array, [[1, 2], [3, 4]])
+
+
+def test_untracked_attach_from_another_program_leaves_the_segment():
+    with SharedArray((4,), np.uint8) as shared:
+        # A plain subprocess has its own resource tracker, which must not unlink the segment
+        script = ('from shm_transport import ArrayDescriptor, attach\n'
+                  f'with attach(ArrayDescriptor{tuple(shared.descriptor)!r}, untrack=True) as array:\n'
+                  '    array[...] = 7\n'
+                  '    del array\n')
+        completed = subprocess.run([sys.executable, '-c', script], cwd=PROJECT_ROOT,
+                                   capture_output=True, text=True, timeout=60)
+        assert completed.returncode == 0, completed.stderr
+        assert 'leaked' not in completed.stderr
+        assert own_segments() == [shared.name]
+        np.testing.assert_array_equal(shared.array, [7, 7, 7, 7])
+    assert own_segments() == []
+
+
+def exit_in_worker(image_descriptor, enhanced_descriptor, output_name, options):
+    """Stands in for _process_shared: the worker dies while it has the segments attached"""
+    with attach(image_descriptor):
+        os._exit(1)
+
+
+def test_crashed_worker_leaks_nothing_and_the_pool_is_replaced(tmp_path, monkeypatch):
+    pytest.importorskip('qiskit_aer')
+    monkeypatch.chdir(tmp_path)
+    image = np.random.RandomState(0).randint(0, 256, (16, 16)).astype(np.uint8)
+    pool = SharedMemoryProcessPool(max_workers=1)
+    try:
+        with monkeypatch.context() as patch:
+            patch.setattr(shm_transport, '_process_shared', exit_in_worker)
+            result, enhanced = pool.process_image_array(image, 'crash.png', return_enhanced=True)
+        assert result['success'] is False
+        assert result['error'].startswith('Worker process exited unexpectedly')
+        assert enhanced is None
+        assert own_segments() == []
+        assert pool._executor is None
+
+        result, enhanced = pool.process_image_array(image, 'after.png', return_enhanced=True, n_qubits=4, shots=256)
+        assert result['success'], result.get('error')
+        assert enhanced.array.shape == (16, 16)
+        enhanced.release()
+        assert own_segments() == []
+    finally:
+        pool.shutdown()
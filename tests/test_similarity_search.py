@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+import similarity_search as ss
+
+
+def random_distributions(n, dim=64, seed=0):
+    rng = np.random.RandomState(seed)
+    vectors = rng.rand(n, dim).astype(np.float32)
+    return vectors / vectors.sum(axis=1, keepdims=True)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store_dir = str(tmp_path / 'feature_store')
+    vectors = random_distributions(200)
+    for i, vector in enumerate(vectors):
+        ss.add_features(f'comparison_{i:04d}.json', vector, store_dir=store_dir)
+    return store_dir, vectors
+
+
+def brute_force(vectors, query, k):
+    distances = 1.0 - (vectors @ query) / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query) + 1e-12)
+    return [f'comparison_{i:04d}' for i in np.argsort(distances, kind='stable')[:k]]
+
+
+def test_full_scan_matches_brute_force(store):
+    store_dir, vectors = store
+    matches = ss.find_similar(vectors[7], k=5, store_dir=store_dir)
+    assert [m['comparison_id'] for m in matches] == brute_force(vectors, vectors[7], 5)
+
+
+def test_get_features_and_latest_row_wins(store):
+    store_dir, vectors = store
+    np.testing.assert_array_equal(ss.get_features('0003', store_dir=store_dir), vectors[3])
+    ss.add_features('comparison_0003', vectors[9], store_dir=store_dir)
+    np.testing.assert_array_equal(ss.get_features('comparison_0003.json', store_dir=store_dir), vectors[9])
+    assert ss.get_features('comparison_missing', store_dir=store_dir) is None
+
+
+def test_index_probes_only_nearby_buckets(store):
+    store_dir, vectors = store
+    store_state = ss._load_store(vectors.shape[1], store_dir)
+    query_code = int(ss._index_codes(vectors[0])[0])
+    rows = ss._candidate_rows(query_code, store_state, k=1)
+
+    # Same rows as comparing the query's code with every stored code
+    differing = np.bitwise_xor(store_state.codes, np.uint32(query_code))
+    hamming = np.array([bin(int(code)).count('1') for code in differing])
+    for radius in range(3):
+        expected = np.flatnonzero(hamming <= radius)
+        if len(expected) >= 1:
+            break
+    np.testing.assert_array_equal(rows, expected)
+
+    matches = ss.find_similar('comparison_0000', k=3, use_index=True, store_dir=store_dir)
+    assert all(m['comparison_id'] != 'comparison_0000' for m in matches)
+
+
+def test_store_is_reloaded_only_when_it_changes(store):
+    store_dir, vectors = store
+    first = ss._load_store(vectors.shape[1], store_dir)
+    assert ss._load_store(vectors.shape[1], store_dir) is first
+    ss.add_features('comparison_new', vectors[0], store_dir=store_dir)
+    reloaded = ss._load_store(vectors.shape[1], store_dir)
+    assert reloaded is not first
+    assert reloaded.rows['comparison_new'] == len(vectors)
+
+
+def test_remove_features(store):
+    store_dir, vectors = store
+    assert ss.remove_features(['comparison_0001.json', '0002', 'comparison_unknown'], store_dir=store_dir) == 2
+    assert ss.get_features('comparison_0001', store_dir=store_dir) is None
+    np.testing.assert_array_equal(ss.get_features('comparison_0003', store_dir=store_dir), vectors[3])
+    matches = ss.find_similar(vectors[1], k=200, store_dir=store_dir)
+    assert len(matches) == 198
+    assert {'comparison_0001', 'comparison_0002'}.isdisjoint(m['comparison_id'] for m in matches)
+
+
+def test_scans_processed_at_different_qubit_counts_are_comparable(tmp_path, monkeypatch):
+    pytest.importorskip('qiskit_aer')
+    from quantum_processing import FEATURE_VECTOR_QUBITS, process_image_array
+
+    monkeypatch.chdir(tmp_path)
+    store_dir = str(tmp_path / 'feature_store')
+    rng = np.random.RandomState(0)
+    for name, n_qubits in (('comparison_small', 6), ('comparison_large', 12)):
+        image = (rng.rand(64, 64) * 255).astype(np.uint8)
+        result = process_image_array(image, f'{name}.png', return_features=True, n_qubits=n_qubits, shots=256)
+        assert result['image_quality']['n_qubits'] == n_qubits
+        assert result['feature_vector'].shape == (2 ** FEATURE_VECTOR_QUBITS,)
+        ss.add_features(name, result['feature_vector'], store_dir=store_dir)
+
+    matches = ss.find_similar('comparison_small', k=1, store_dir=store_dir)
+    assert [m['comparison_id'] for m in matches] == ['comparison_large']
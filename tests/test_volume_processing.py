@@ -0,0 +1,161 @@
+import numpy as np
+import pytest
+
+import volume_processing
+from volume_processing import process_volume, volume_frames, volume_shape, volume_summary
+
+
+def write_dicom(path, pixels, position=None, instance=None, window=(40.0, 400.0)):
+    """Minimal uint16 CT slice stored with a -1024 HU rescale intercept"""
+    pytest.importorskip('pydicom')
+    from pydicom.dataset import Dataset, FileMetaDataset
+    from pydicom.uid import CTImageStorage, ExplicitVRLittleEndian, generate_uid
+
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = CTImageStorage
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    dataset = Dataset()
+    dataset.file_meta = meta
+    dataset.SOPClassUID = CTImageStorage
+    dataset.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    dataset.Rows, dataset.Columns = pixels.shape
+    dataset.SamplesPerPixel = 1
+    dataset.PhotometricInterpretation = 'MONOCHROME2'
+    dataset.BitsAllocated, dataset.BitsStored, dataset.HighBit = 16, 16, 15
+    dataset.PixelRepresentation = 0
+    dataset.RescaleSlope, dataset.RescaleIntercept = 1, -1024
+    if window is not None:
+        dataset.WindowCenter, dataset.WindowWidth = window
+    if position is not None:
+        dataset.ImagePositionPatient = [0, 0, position]
+    if instance is not None:
+        dataset.InstanceNumber = instance
+    dataset.PixelData = pixels.astype(np.uint16).tobytes()
+    dataset.save_as(str(path), enforce_file_format=True)
+    return str(path)
+
+
+def test_tiff_pages_share_the_whole_volume_range(tmp_path):
+    tifffile = pytest.importorskip('tifffile')
+    # The first page spans only part of the range of the later pages
+    volume = np.stack([np.full((8, 8), 1000, np.uint16), np.full((8, 8), 1000, np.uint16),
+                       np.full((8, 8), 3000, np.uint16)])
+    volume[0, 0, 0] = 500
+    volume[2, 0, 0] = 4000
+    path = str(tmp_path / 'ct.tif')
+    tifffile.imwrite(path, volume, photometric='minisblack')
+
+    frames = list(volume_frames(path))
+
+    assert [frame.dtype for frame in frames] == [np.uint8] * 3
+    assert frames[0][0, 0] == 0 and frames[2][0, 0] == 255
+    # The same raw value maps to the same grey level on every page
+    assert frames[0][1, 1] == frames[1][1, 1] == round((1000 - 500) * 255 / 3500)
+    assert frames[2][1, 1] == round((3000 - 500) * 255 / 3500)
+    assert volume_shape(path) == (3, 8, 8)
+
+
+def test_uint8_tiff_pages_are_passed_through(tmp_path):
+    tifffile = pytest.importorskip('tifffile')
+    volume = np.random.RandomState(0).randint(0, 256, (4, 6, 10)).astype(np.uint8)
+    path = str(tmp_path / 'scan.tiff')
+    tifffile.imwrite(path, volume, photometric='minisblack')
+
+    frames = list(volume_frames(path))
+
+    np.testing.assert_array_equal(np.stack(frames), volume)
+    assert volume_shape(path) == (4, 10, 6)
+
+
+def test_dicom_series_is_read_in_slice_order_through_the_window(tmp_path):
+    # Raw 1064 is 40 HU, the centre of the default soft-tissue window
+    paths = [write_dicom(tmp_path / 'a.dcm', np.full((4, 5), 1064), position=20.0),
+             write_dicom(tmp_path / 'b.dcm', np.full((4, 5), 824), position=-10.0),
+             write_dicom(tmp_path / 'c.dcm', np.full((4, 5), 1304), position=5.0)]
+
+    frames = list(volume_frames(str(tmp_path)))
+
+    assert [int(frame[0, 0]) for frame in frames] == [0, 255, 127]
+    assert all(frame.shape == (4, 5) and frame.dtype == np.uint8 for frame in frames)
+    assert volume_shape(str(tmp_path)) == (3, 5, 4)
+    assert len(list(volume_frames(paths[0]))) == 1
+
+
+def test_dicom_without_position_is_ordered_by_instance_number(tmp_path):
+    write_dicom(tmp_path / '1.dcm', np.full((3, 3), 1264), instance=2, window=None)
+    write_dicom(tmp_path / '2.dcm', np.full((3, 3), 864), instance=1, window=None)
+
+    assert [int(frame[0, 0]) for frame in volume_frames(str(tmp_path))] == [0, 255]
+
+
+def fake_result(index, anomalies=()):
+    return {'success': True, 'index': index, 'reused': None,
+            'metrics': {'brightness': 0.5, 'contrast': 0.1, 'entropy': 4.0,
+                        'quantum_entropy': 3.0, 'quantum_contrast': 0.2},
+            'anomalies': list(anomalies)}
+
+
+@pytest.fixture
+def fake_pipeline(monkeypatch):
+    """process_image_array replaced by a stub that records what each slice was given"""
+    calls = []
+
+    def process_image_array(frame, output_name, deadline=None, quantum_stage=None,
+                            return_quantum_stage=False, **options):
+        calls.append({'name': output_name, 'quantum_stage': quantum_stage, 'options': options})
+        result = fake_result(len(calls))
+        result['quantum_stage'] = f'stage of {output_name}'
+        return result
+
+    monkeypatch.setattr(volume_processing, 'process_image_array', process_image_array)
+    return calls
+
+
+def test_identical_and_similar_slices_reuse_work(tmp_path, fake_pipeline):
+    tifffile = pytest.importorskip('tifffile')
+    base = np.random.RandomState(1).randint(0, 200, (32, 32)).astype(np.uint8)
+    similar = base.copy()
+    similar[0, 0] += 1
+    different = 255 - base
+    tifffile.imwrite(str(tmp_path / 'volume.tif'), np.stack([base, base, similar, different, different]),
+                     photometric='minisblack')
+
+    result = process_volume(str(tmp_path / 'volume.tif'), n_qubits=6)
+
+    assert result['success'] and result['name'] == 'volume'
+    assert [s['reused'] for s in result['slices']] == [None, 'identical', 'quantum_stage', None, 'identical']
+    assert [s['index'] for s in result['slices']] == [0, 1, 2, 3, 4]
+    # Identical slices never reach the pipeline; the similar one gets its neighbour's quantum stage
+    assert [call['name'] for call in fake_pipeline] == ['volume_slice0000.png', 'volume_slice0002.png',
+                                                        'volume_slice0003.png']
+    assert [call['quantum_stage'] for call in fake_pipeline] == [None, 'stage of volume_slice0000.png', None]
+    assert all(call['options'] == {'n_qubits': 6} for call in fake_pipeline)
+    assert 'quantum_stage' not in result['slices'][0]
+    volume = result['volume']
+    assert (volume['slices'], volume['reused_identical'], volume['reused_quantum_stage'], volume['simulated']) == \
+        (5, 2, 1, 2)
+
+
+def test_volume_summary_locates_anomalies_by_slice():
+    slices = [
+        fake_result(0, [{'type': 'intensity_anomaly', 'location': [3, 4], 'severity': 0.4}]),
+        fake_result(1, [{'type': 'quantum_anomaly', 'feature_index': 7, 'severity': 0.99},
+                        {'type': 'quantum_anomaly', 'feature_index': 8, 'severity': 0.98},
+                        {'type': 'quantum_patch_anomaly', 'location': [1, 2], 'severity': 0.6}]),
+        fake_result(2, [{'type': 'intensity_anomaly', 'location': [5, 6], 'severity': 0.7},
+                        {'type': 'intensity_anomaly', 'location': [7, 8], 'severity': 0.5}]),
+        {'success': False, 'index': 3, 'error': 'Invalid image'},
+    ]
+    slices[2]['metrics']['brightness'] = 0.8
+
+    summary = volume_summary(slices)
+
+    assert (summary['slices'], summary['successful_slices'], summary['simulated']) == (4, 3, 3)
+    assert summary['total_anomalies'] == 4
+    assert [a['location'] for a in summary['anomalies']] == [[5, 6, 2], [1, 2, 1], [7, 8, 2], [3, 4, 0]]
+    assert summary['slice_with_most_anomalies'] == 2
+    assert summary['mean_brightness'] == pytest.approx(0.6)
+    assert summary['std_brightness'] == pytest.approx(np.std([0.5, 0.5, 0.8]))
+    assert volume_summary([{'success': False, 'index': 0}]) == {
+        'slices': 1, 'successful_slices': 0, 'reused_identical': 0, 'reused_quantum_stage': 0, 'simulated': 0}
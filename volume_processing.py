@@ -0,0 +1,287 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import cv2
+
+from quantum_processing import process_image_array
+
+# Side of the downsampled slice signature, and the mean absolute difference
+# (on the 0-1 scale) below which a slice reuses its neighbour's quantum stage
+SIGNATURE_SIZE = 16
+SIGNATURE_TOLERANCE = 0.01
+
+TIFF_SUFFIXES = ('.tif', '.tiff')
+DICOM_SUFFIXES = ('.dcm', '.dicom')
+
+
+def to_uint8(frame, value_range=None):
+    """Map a frame to 8-bit grayscale using a fixed (low, high) range for the whole volume
+
+    A fixed range keeps identical tissue at the same grey level on every
+    slice, so neighbouring slices stay comparable.
+    """
+    if frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY) if frame.shape[2] in (3, 4) else frame[..., 0]
+    if frame.dtype == np.uint8 and value_range is None:
+        return np.ascontiguousarray(frame)
+    if value_range is None:
+        value_range = (np.iinfo(frame.dtype).min, np.iinfo(frame.dtype).max) if np.issubdtype(frame.dtype, np.integer) \
+            else (float(np.min(frame)), float(np.max(frame)))
+    low, high = value_range
+    scaled = (frame.astype(np.float32) - low) * (255.0 / max(high - low, 1e-6))
+    return np.clip(scaled, 0, 255).astype(np.uint8)
+
+
+def iter_tiff_frames(path):
+    """Yield the pages of a (multi-page) TIFF one at a time as 8-bit frames"""
+    import tifffile
+
+    with tifffile.TiffFile(path) as tif:
+        pages = tif.pages
+        value_range = None
+        if pages[0].dtype != np.uint8:
+            # Deeper samples (e.g. 12-bit CT stored as uint16) are scaled with the
+            # range of the whole volume, found in a first pass one page at a time
+            low, high = np.inf, -np.inf
+            for page in pages:
+                frame = page.asarray()
+                low, high = min(low, float(np.min(frame))), max(high, float(np.max(frame)))
+            value_range = (low, high)
+        for page in pages:
+            frame = page.asarray()
+            if frame.ndim == 3 and frame.shape[-1] not in (3, 4):
+                # Several frames stored in one page
+                for sub_frame in frame:
+                    yield to_uint8(sub_frame, value_range)
+            else:
+                yield to_uint8(frame, value_range)
+
+
+def dicom_window(dataset):
+    """(low, high) display range from the DICOM window, or a soft-tissue window in HU"""
+    center, width = getattr(dataset, 'WindowCenter', None), getattr(dataset, 'WindowWidth', None)
+    if center is not None and width is not None:
+        center = float(center[0] if hasattr(center, '__len__') and not isinstance(center, str) else center)
+        width = float(width[0] if hasattr(width, '__len__') and not isinstance(width, str) else width)
+    else:
+        center, width = 40.0, 400.0
+    return center - width / 2, center + width / 2
+
+
+def iter_dicom_frames(paths):
+    """Yield the frames of a DICOM series in slice order, reading one file at a time
+
+    Only the headers are read up front, to sort the series by position (or
+    instance number). Pixel values are rescaled to Hounsfield units where
+    the rescale tags are present and mapped through the first slice's window.
+    """
+    import pydicom
+
+    headers = []
+    for path in paths:
+        header = pydicom.dcmread(path, stop_before_pixels=True)
+        position = getattr(header, 'ImagePositionPatient', None)
+        order = float(position[2]) if position is not None else float(getattr(header, 'InstanceNumber', 0) or 0)
+        headers.append((order, path, header))
+    headers.sort(key=lambda entry: (entry[0], entry[1]))
+    if not headers:
+        return
+
+    value_range = dicom_window(headers[0][2])
+    for _, path, _ in headers:
+        dataset = pydicom.dcmread(path)
+        pixels = dataset.pixel_array.astype(np.float32)
+        pixels = pixels * float(getattr(dataset, 'RescaleSlope', 1)) + float(getattr(dataset, 'RescaleIntercept', 0))
+        frames = pixels if int(getattr(dataset, 'NumberOfFrames', 1) or 1) > 1 else [pixels]
+        for frame in frames:
+            yield to_uint8(frame, value_range)
+
+
+def series_files(directory):
+    """Files of a DICOM series directory, in name order"""
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if not name.startswith('.') and os.path.isfile(os.path.join(directory, name)))
+
+
+def save_series(fileobj, filename, upload_dir, prefix):
+    """Extract a zip/tar of DICOM files into upload_dir as '<prefix>_<n>_<name>' and return their paths
+
+    DICOM files often have no extension, so every file in the archive is kept.
+    """
+    from batch_upload import archive_members
+
+    paths = []
+    for name, member in archive_members(fileobj, filename):
+        path = os.path.join(upload_dir, f"{prefix}_{len(paths):04d}_{name}")
+        with open(path, 'wb') as f:
+            shutil.copyfileobj(member, f)
+        paths.append(path)
+    return paths
+
+
+def volume_frames(source):
+    """Lazy frame iterator for a multi-page TIFF, a DICOM file, or a directory/list of DICOM files"""
+    if isinstance(source, (list, tuple)):
+        return iter_dicom_frames(list(source))
+    if os.path.isdir(source):
+        return iter_dicom_frames(series_files(source))
+    if source.lower().endswith(TIFF_SUFFIXES):
+        return iter_tiff_frames(source)
+    if source.lower().endswith(DICOM_SUFFIXES):
+        return iter_dicom_frames([source])
+    raise ValueError(f'Unsupported volume source: {source}. Use a multi-page TIFF, a DICOM file or a DICOM directory')
+
+
+def volume_shape(source):
+    """(slices, width, height) read from the file headers only"""
+    if not isinstance(source, (list, tuple)) and source.lower().endswith(TIFF_SUFFIXES):
+        import tifffile
+        with tifffile.TiffFile(source) as tif:
+            page = tif.pages[0]
+            n_slices = len(tif.pages) * (page.shape[0] if len(page.shape) == 3 and page.shape[-1] not in (3, 4) else 1)
+            return n_slices, page.imagewidth, page.imagelength
+
+    import pydicom
+    if isinstance(source, (list, tuple)):
+        paths = list(source)
+    elif os.path.isdir(source):
+        paths = series_files(source)
+    else:
+        paths = [source]
+    if not paths:
+        return 0, 0, 0
+    header = pydicom.dcmread(paths[0], stop_before_pixels=True)
+    n_frames = int(getattr(header, 'NumberOfFrames', 1) or 1)
+    return len(paths) * n_frames, int(header.Columns), int(header.Rows)
+
+
+def slice_signature(frame):
+    """Downsampled float32 signature used to spot near-identical neighbouring slices"""
+    return cv2.resize(frame, (SIGNATURE_SIZE, SIGNATURE_SIZE), interpolation=cv2.INTER_AREA).astype(np.float32) / 255.0
+
+
+def process_volume(source, name=None, signature_tolerance=SIGNATURE_TOLERANCE, deadline=None, **process_options):
+    """Process every slice of a volume through one warm pipeline
+
+    Frames are read lazily. A slice whose content hash equals the previous
+    slice reuses that slice's result outright. A slice whose downsampled
+    signature is within signature_tolerance of the last slice that ran the
+    quantum simulation reuses its quantum stage and only runs the classical
+    stages. process_options are passed to process_image_array (e.g. n_qubits,
+    shots, quantum_mode, parallel, lean).
+
+    Returns {'success', 'slices': [...], 'volume': {...}}; per-slice results
+    carry 'reused' (None, 'identical' or 'quantum_stage').
+    """
+    start = time.perf_counter()
+    if name is None:
+        base = source[0] if isinstance(source, (list, tuple)) else source
+        name = os.path.splitext(os.path.basename(os.path.normpath(base)))[0]
+
+    slices = []
+    previous_hash = None
+    previous_result = None
+    reference_signature = None
+    reference_stage = None
+    deadline_exceeded = False
+
+    for index, frame in enumerate(volume_frames(source)):
+        if deadline is not None and time.monotonic() > deadline:
+            deadline_exceeded = True
+            break
+
+        content_hash = hashlib.blake2b(frame.tobytes(), digest_size=16).hexdigest() + str(frame.shape)
+        if content_hash == previous_hash and previous_result is not None:
+            slices.append({**previous_result, 'index': index, 'reused': 'identical', 'signature_distance': 0.0})
+            continue
+
+        signature = slice_signature(frame)
+        distance = None
+        quantum_stage = None
+        if reference_signature is not None and reference_signature.shape == signature.shape:
+            distance = float(np.mean(np.abs(signature - reference_signature)))
+            if distance <= signature_tolerance:
+                quantum_stage = reference_stage
+
+        result = process_image_array(frame, f"{name}_slice{index:04d}.png", deadline=deadline,
+                                     quantum_stage=quantum_stage, return_quantum_stage=True, **process_options)
+        stage = result.pop('quantum_stage', None)
+        if result.get('deadline_exceeded'):
+            deadline_exceeded = True
+            break
+        if result.get('success') and quantum_stage is None:
+            reference_signature, reference_stage = signature, stage
+
+        result.update({'index': index, 'reused': 'quantum_stage' if quantum_stage is not None else None,
+                       'signature_distance': None if distance is None else round(distance, 5)})
+        slices.append(result)
+        previous_hash, previous_result = content_hash, result
+
+    volume = volume_summary(slices)
+    volume['elapsed_seconds'] = round(time.perf_counter() - start, 3)
+    response = {'success': bool(slices) and not deadline_exceeded, 'name': name, 'volume': volume, 'slices': slices}
+    if deadline_exceeded:
+        response['deadline_exceeded'] = True
+        response['error'] = f'Processing deadline exceeded after {len(slices)} slices'
+    elif not slices:
+        response['error'] = 'No slices found in volume'
+    return response
+
+
+def volume_summary(slices):
+    """Whole-volume metrics from the per-slice results"""
+    processed = [s for s in slices if s.get('success')]
+    summary = {
+        'slices': len(slices),
+        'successful_slices': len(processed),
+        'reused_identical': sum(1 for s in slices if s.get('reused') == 'identical'),
+        'reused_quantum_stage': sum(1 for s in slices if s.get('reused') == 'quantum_stage'),
+        'simulated': sum(1 for s in processed if s.get('reused') is None)
+    }
+    if not processed:
+        return summary
+
+    for key in ('brightness', 'contrast', 'entropy', 'quantum_entropy', 'quantum_contrast'):
+        values = [s['metrics'][key] for s in processed]
+        summary[f'mean_{key}'] = float(np.mean(values))
+    summary['std_brightness'] = float(np.std([s['metrics']['brightness'] for s in processed]))
+
+    # Strongest anomalies across the volume, located as [x, y, slice]; global
+    # quantum anomalies have no location and are left out
+    anomalies = [{**a, 'location': list(a['location']) + [s['index']]}
+                 for s in processed for a in s['anomalies'] if 'location' in a]
+    anomalies.sort(key=lambda a: a['severity'], reverse=True)
+    summary['total_anomalies'] = len(anomalies)
+    summary['anomalies'] = anomalies[:10]
+    busiest = max(processed, key=lambda s: sum(1 for a in s['anomalies'] if 'location' in a))
+    summary['slice_with_most_anomalies'] = busiest['index']
+    return summary
+
+
+# Make functions available for import
+__all__ = ['process_volume', 'volume_frames', 'volume_shape', 'save_series', 'iter_tiff_frames', 'iter_dicom_frames', 'volume_summary']
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Process a multi-page TIFF or DICOM series slice by slice")
+    parser.add_argument('source', nargs='+', help="Multi-page TIFF, DICOM file, DICOM directory or DICOM files")
+    parser.add_argument('--tolerance', type=float, default=SIGNATURE_TOLERANCE,
+                        help="Signature distance below which a slice reuses its neighbour's quantum stage")
+    parser.add_argument('--lean', action='store_true', help="Use the memory-lean pipeline")
+    parser.add_argument('--output', help="Write the JSON result to this file")
+    args = parser.parse_args()
+
+    source = args.source[0] if len(args.source) == 1 else args.source
+    result = process_volume(source, signature_tolerance=args.tolerance, lean=args.lean)
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+        print(json.dumps(result['volume'], indent=2))
+    else:
+        print(text)